@@ -1,69 +1,110 @@
 
-from pymodbus.client import AsyncModbusTcpClient
 from typing import Optional
 from utils import is_nth_bit_on
 import asyncio
+from functools import partial
 from pymodbus.exceptions import ConnectionException, ModbusIOException
 from time import sleep
 import time
 from utils import IEG_MODE_bitmask_alternative, IEG_MODE_bitmask_default
+from register_planner import decode_snapshot, DriveSnapshot
+from metrics import REGISTRY
+from modbus_mux import ModbusMultiplexer
+from state_estimator import ActuatorEstimator, StateEstimate
+from drive_watchdog import DriveWatchdog
+from emergency_stop import EmergencyStopLane
+from drive_pool import DrivePool, DEFAULT_PLATFORM
 
 class ModbusClients:
-    def __init__(self, config, logger):
+    """
+    Left and right drive of one platform in a DrivePool. Without a pool
+    it creates its own with the single platform of SERVER_IP_LEFT and SERVER_IP_RIGHT
+    """
+    def __init__(self, config, logger, pool: Optional[DrivePool] = None, platform=DEFAULT_PLATFORM):
         self.config = config
         self.logger = logger
-        self.client_left: Optional[AsyncModbusTcpClient] = None
-        self.client_right: Optional[AsyncModbusTcpClient] = None
+        self.pool = pool or DrivePool(config, logger)
+        self.platform = platform
+        self.drive_ids = self.pool.platforms[platform] # left/right -> drive id in the pool
         self.max_retries = 10
         self.retry_delay = 0.2
+        self.snapshot_blocks = self.pool.snapshot_blocks
+        # Time difference between left and right side of paired operations
+        self.send_skew = REGISTRY.histogram("paired_send_skew_seconds", "Left/right send time difference")
+        self.completion_skew = REGISTRY.histogram("paired_completion_skew_seconds", "Left/right completion time difference")
+        self.retries = {
+            operation: REGISTRY.counter("modbus_retries", "Retried drive operations", {"operation": operation})
+            for operation in ("fault_reset", "home")
+        }
+        self.fault_resets = REGISTRY.counter("fault_resets", "Successful fault resets")
+        self.last_snapshots: tuple[Optional[DriveSnapshot], Optional[DriveSnapshot]] = (None, None)
+        self.watchdogs: dict[str, DriveWatchdog] = {}
+        # Stops go through their own connections, started with estop.start()
+        self.estop = EmergencyStopLane(config, logger, {
+            drive: self.pool.hosts[drive] for drive in self.drive_ids.values()
+        })
+        # Latency compensated actuator state, updated from every snapshot read
+        self.estimators = {side: ActuatorEstimator(config) for side in ("left", "right")}
+        for side, estimator in self.estimators.items():
+            REGISTRY.gauge("drive_feedback_latency_seconds", "Smoothed snapshot read round trip",
+                           {"drive": self.drive_ids[side]}, fn=lambda estimator=estimator: estimator.latency or 0.0)
+
+    @property
+    def client_left(self) -> Optional[ModbusMultiplexer]:
+        return self.pool.clients.get(self.drive_ids["left"])
+
+    @property
+    def client_right(self) -> Optional[ModbusMultiplexer]:
+        return self.pool.clients.get(self.drive_ids["right"])
+
+    @property
+    def connected(self):
+        return all(client is not None and client.connected for client in (self.client_left, self.client_right))
+
+    def create_clients(self):
+        """
+        Creates new connection objects for both drives, old ones are closed
+        """
+        self.unwatch()
+        self.pool.create([self.drive_ids["left"], self.drive_ids["right"]])
+        for estimator in self.estimators.values():
+            estimator.reset()
+
+    async def connect_drive(self, client) -> bool:
+        """
+        Connects one drive, retrying with exponential backoff.
+        Returns True if connected, False after CONNECTION_TRY_COUNT attempts
+        """
+        max_attempts = self.config.CONNECTION_TRY_COUNT
+        delay = self.config.CONNECT_BACKOFF_INITIAL
+        for attempt in range(1, max_attempts + 1):
+            if await client.connect():
+                return True
+            self.logger.debug(f"{client.drive} connection attempt {attempt} failed")
+            if attempt < max_attempts:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.config.CONNECT_BACKOFF_MAX)
+        return False
 
     async def connect(self):
         """
-        Establishes connections to both Modbus clients.
+        Establishes connections to both Modbus clients in parallel.
         Returns True if both connections are successful, or False if either fails
         and returns None if error
         """
         try:
-            self.client_left = AsyncModbusTcpClient(
-                host=self.config.SERVER_IP_LEFT,
-                port=self.config.PORT
-            )
+            self.create_clients()
 
-            self.client_right = AsyncModbusTcpClient(
-                host=self.config.SERVER_IP_RIGHT,
-                port=self.config.PORT
+            left_connected, right_connected = await asyncio.gather(
+                self.connect_drive(self.client_left),
+                self.connect_drive(self.client_right)
             )
 
-            left_connected = False
-            right_connected = False
-            max_attempts = self.config.CONNECTION_TRY_COUNT
-            attempt_left = 0
-            attempt_right = 0
-
-            while (not left_connected or not right_connected) and \
-            (attempt_left < max_attempts or attempt_right < max_attempts):
-                if not left_connected:
-                    left_connected = await self.client_left.connect()
-                    attempt_left += 1
-                    if not left_connected:
-                         self.logger.debug(f"Left connection attempt {attempt_left} failed")
-
-                if not right_connected:
-                    right_connected = await self.client_right.connect()
-                    attempt_right += 1
-                    if not right_connected:
-                         self.logger.debug(f"Right connection attempt {attempt_right} failed")
-                
             if left_connected and right_connected:
                 self.logger.info("Both clients connected succesfully")
-
-                if "fault_poller.py" in self.config.MODULE_NAME:
-                    self.client_left.ctx.next_tid = self.config.START_TID
-                    self.client_right.ctx.next_tid = self.config.START_TID
-
                 return True
             else: 
-                self.logger.warning(f"Connection failed after {max_attempts} attempts. "
+                self.logger.warning(f"Connection failed after {self.config.CONNECTION_TRY_COUNT} attempts. "
                                     f"Left: {left_connected}, right: {right_connected}")
                 return False
             
@@ -71,11 +112,86 @@ class ModbusClients:
             self.logger.error(f"Error connecting to clients {str(e)}")
             return None
 
-    def check_and_reset_tids(self):
-        for client in [self.client_left, self.client_right]:
-            if client and client.ctx.next_tid >= self.config.LAST_TID:
-                client.ctx.next_tid = self.config.START_TID
-                self.logger.debug(f"Reset TID for client")
+    def watch(self, on_change=None):
+        """
+        Starts a watchdog for both drive connections, from then on they alone reconnect.
+        on_change(drive, state) is called on health state changes
+        """
+        for client in (self.client_left, self.client_right):
+            if client is None:
+                continue
+            watchdog = self.watchdogs.get(client.drive)
+            if watchdog is None:
+                watchdog = self.watchdogs[client.drive] = DriveWatchdog(client, self.config, self.logger, on_change)
+            watchdog.start()
+
+    def unwatch(self):
+        for watchdog in self.watchdogs.values():
+            watchdog.stop()
+        self.watchdogs.clear()
+
+    def health(self):
+        return {drive: watchdog.status() for drive, watchdog in self.watchdogs.items()}
+
+    async def wait_healthy(self, timeout) -> bool:
+        """
+        Waits for the watchdogs to restore both connections.
+        Returns True if both drives are healthy within timeout seconds
+        """
+        if not self.watchdogs:
+            return self.connected
+        results = await asyncio.gather(*(watchdog.wait_healthy(timeout) for watchdog in self.watchdogs.values()))
+        return all(results)
+
+    async def _timed(self, request):
+        sent = time.perf_counter()
+        try:
+            result = await request()
+        except Exception as e:
+            result = e
+        return sent, time.perf_counter(), result
+
+    async def paired(self, left_request, right_request, return_exceptions=False):
+        """
+        Runs the left and right drive requests at the same time and records
+        the send and completion skew between the sides. Requests are zero argument
+        callables returning the coroutine, it is only created once it is awaited.
+        Returns tuple of (left_response, right_response). Exceptions are raised
+        unless return_exceptions is True, then they are returned like in asyncio.gather
+        """
+        (left_sent, left_done, left_response), (right_sent, right_done, right_response) = \
+            await asyncio.gather(self._timed(left_request), self._timed(right_request))
+
+        self.send_skew.observe(abs(left_sent - right_sent))
+        self.completion_skew.observe(abs(left_done - right_done))
+
+        if not return_exceptions:
+            for response in (left_response, right_response):
+                if isinstance(response, Exception):
+                    raise response
+
+        return left_response, right_response
+
+    async def paired_read(self, address, count=1, return_exceptions=False):
+        return await self.paired(
+            partial(self.client_left.read_holding_registers, address=address, count=count, slave=self.config.SLAVE_ID),
+            partial(self.client_right.read_holding_registers, address=address, count=count, slave=self.config.SLAVE_ID),
+            return_exceptions=return_exceptions
+        )
+
+    async def paired_write_register(self, address, left_value, right_value, return_exceptions=False):
+        return await self.paired(
+            partial(self.client_left.write_register, address=address, value=left_value, slave=self.config.SLAVE_ID),
+            partial(self.client_right.write_register, address=address, value=right_value, slave=self.config.SLAVE_ID),
+            return_exceptions=return_exceptions
+        )
+
+    async def paired_write_registers(self, address, left_values, right_values, return_exceptions=False):
+        return await self.paired(
+            partial(self.client_left.write_registers, address=address, values=left_values, slave=self.config.SLAVE_ID),
+            partial(self.client_right.write_registers, address=address, values=right_values, slave=self.config.SLAVE_ID),
+            return_exceptions=return_exceptions
+        )
 
     async def get_recent_fault(self) -> tuple[Optional[int], Optional[int]]:
         """
@@ -83,16 +199,7 @@ class ModbusClients:
         Returns tuple of (left_fault, right_fault), None if read fails
         """
         try:
-            left_response = await self.client_left.read_holding_registers(
-                address=self.config.RECENT_FAULT_ADDRESS,
-                count=1,
-                slave=self.config.SLAVE_ID
-            )
-            right_response = await self.client_right.read_holding_registers(
-                address=self.config.RECENT_FAULT_ADDRESS,
-                count=1,
-                slave=self.config.SLAVE_ID
-            )
+            left_response, right_response = await self.paired_read(self.config.RECENT_FAULT_ADDRESS)
 
             if left_response.isError() or right_response.isError():
                 self.logger.error("Error reading fault register")
@@ -124,34 +231,25 @@ class ModbusClients:
             retry_delay = self.retry_delay
 
             while attempt_count < max_retries:
-                responses = await asyncio.gather(
-                    self.client_left.write_register(
-                    address=self.config.IEG_MODE,
-                    value=value,
-                    slave=self.config.SLAVE_ID
-                ),
-                    self.client_right.write_register(
-                    address=self.config.IEG_MODE,
-                    value=value,
-                    slave= self.config.SLAVE_ID
-                ),
-                return_exceptions=True
+                left_response, right_response = await self.paired_write_register(
+                    self.config.IEG_MODE, value, value, return_exceptions=True
                 )
 
-                left_response, right_response = responses
-
                 if isinstance(left_response, Exception) or isinstance(right_response, Exception):
                     attempt_count += 1
+                    self.retries["fault_reset"].inc()
                     self.logger.error("Exception during trying to do a fault reset")
                     await asyncio.sleep(retry_delay*3)
                     continue
 
                 if left_response.isError() or right_response.isError():
                     attempt_count += 1
+                    self.retries["fault_reset"].inc()
                     self.logger.error("Error resetting faults")
                     await asyncio.sleep(retry_delay*3)
                     continue
 
+                self.fault_resets.inc()
                 return True
             
             return False
@@ -170,16 +268,7 @@ class ModbusClients:
         try:
             result = False
             
-            left_response = await self.client_left.read_holding_registers(
-                address=self.config.DRIVER_STATUS_ADDRESS,
-                count=1,
-                slave=self.config.SLAVE_ID
-            )
-            right_response = await self.client_right.read_holding_registers(
-                address=self.config.DRIVER_STATUS_ADDRESS,
-                count=1,
-                slave=self.config.SLAVE_ID
-            )
+            left_response, right_response = await self.paired_read(self.config.DRIVER_STATUS_ADDRESS)
 
             if left_response.isError() or right_response.isError():
                 self.logger.error("Error reading driver status register")
@@ -200,16 +289,7 @@ class ModbusClients:
         Gets velocity from both registers returns None if error
         """
         try:
-            left_response = await  self.client_left.read_holding_registers(
-                address=self.config.VFEEDBACK_VELOCITY,
-                count=1,
-                slave=self.config.SLAVE_ID
-            )
-            right_response = await self.client_right.read_holding_registers(
-                address=self.config.VFEEDBACK_VELOCITY,
-                count=1,
-                slave=self.config.SLAVE_ID
-            )
+            left_response, right_response = await self.paired_read(self.config.VFEEDBACK_VELOCITY)
 
             if left_response.isError() or right_response.isError():
                 self.logger.error("Error reading velocity register")
@@ -221,161 +301,167 @@ class ModbusClients:
                 self.logger.error(f"Exception reading fault registers: {str(e)}")
                 return None, None
 
-
-    async def stop(self):
+    async def read_snapshot(self) -> tuple[Optional[DriveSnapshot], Optional[DriveSnapshot]]:
         """
-        Attempts to stop both motors by writing to the IEG_MOTION register.
-        Returns True if successful, False if failed after retries.
+        Reads status, fault, position and velocity of both drives
+        using the planned block reads and updates the state estimators.
+        Returns tuple of (left_snapshot, right_snapshot), None if read fails
         """
-        attempt_count = 0
-        max_retries = self.max_retries
-        retry_delay = self.retry_delay
+        try:
+            (left_registers, left_sent, left_received), (right_registers, right_sent, right_received) = await self.paired(
+                partial(self.pool.read_blocks_timed, self.client_left),
+                partial(self.pool.read_blocks_timed, self.client_right)
+            )
 
-        while attempt_count < max_retries:
-            try:
-                # Attempt to stop both motors in parallel
-                responses = await asyncio.gather(
-                    self.client_left.write_register(
-                        address=self.config.IEG_MOTION,
-                        value=4,
-                        slave=self.config.SLAVE_ID
-                    ),
-                    self.client_right.write_register(
-                        address=self.config.IEG_MOTION,
-                        value=4,
-                        slave=self.config.SLAVE_ID
-                    ),
-                    return_exceptions=True
-                )
+            if left_registers is None or right_registers is None:
+                self.logger.error("Error reading snapshot registers")
+                return None, None
 
-                left_response, right_response = responses
+            left_snapshot = decode_snapshot(self.snapshot_blocks, left_registers)
+            right_snapshot = decode_snapshot(self.snapshot_blocks, right_registers)
+            # Dated by the round trip of the block that holds position and velocity
+            self.estimators["left"].update(left_snapshot.position, left_snapshot.velocity, left_sent, left_received)
+            self.estimators["right"].update(right_snapshot.position, right_snapshot.velocity, right_sent, right_received)
+            self.last_snapshots = (left_snapshot, right_snapshot)
+            return self.last_snapshots
 
-                # Check for exceptions in the responses
-                if isinstance(left_response, Exception) or isinstance(right_response, Exception):
-                    attempt_count += 1
-                    self.logger.error(
-                        f"Exception during parallel write (attempt {attempt_count}/{max_retries}): "
-                        f"Left: {left_response}, Right: {right_response}"
-                    )
-                    await asyncio.sleep(retry_delay)
-                    continue
+        except Exception as e:
+                self.logger.error(f"Exception reading snapshot registers: {str(e)}")
+                return None, None
 
-                # Check for Modbus errors in the responses
-                if left_response.isError() or right_response.isError():
-                    attempt_count += 1
-                    self.logger.error(
-                        f"Modbus error stopping motors (attempt {attempt_count}/{max_retries}): "
-                        f"Left: {left_response}, Right: {right_response}"
-                    )
-                    await asyncio.sleep(retry_delay)
-                    continue
+    def predict(self, at=None) -> tuple[Optional[StateEstimate], Optional[StateEstimate]]:
+        """
+        Estimated actuator states at time.perf_counter() time at (default now).
+        Returns tuple of (left, right), None before the first snapshot read
+        """
+        return self.estimators["left"].predict(at), self.estimators["right"].predict(at)
+
+    def predict_at_write(self) -> tuple[Optional[StateEstimate], Optional[StateEstimate]]:
+        """
+        Estimated actuator states when a write sent now reaches the drives.
+        Returns tuple of (left, right), None before the first snapshot read
+        """
+        now = time.perf_counter()
+        return self.estimators["left"].predict_at_write(now), self.estimators["right"].predict_at_write(now)
 
-                # Success
+    async def stop(self):
+        """
+        Stops both motors through the emergency stop lane. The stop is written to both
+        drives before anything else runs on the event loop and resent until acknowledged,
+        a drive whose stop connection is down gets it through its main connection.
+        Returns True if both drives acknowledged the stop, False after ESTOP_DEADLINE
+        """
+        try:
+            fallbacks = {client.drive: client for client in (self.client_left, self.client_right) if client is not None}
+            if await self.estop.stop(fallbacks):
                 self.logger.info("Successfully stopped both motors")
                 return True
+            self.logger.error("Failed to stop motors. Critical failure!")
+            return False
 
-            except (ConnectionException, asyncio.exceptions.TimeoutError, ModbusIOException) as e:
-                attempt_count += 1
-                self.logger.error(f"Connection error (attempt {attempt_count}/{max_retries}): {e}")
-
-                # Check if either client is disconnected
-                if not self.client_left.connected or not self.client_right.connected:
-                    self.logger.info("One or both clients disconnected. Attempting to reconnect...")
-                    await self.connect()
-
-                if attempt_count < max_retries:
-                    self.logger.info(f"Retrying in {retry_delay} seconds...")
-                    await asyncio.sleep(retry_delay)
-                    continue
-                else:
-                    self.logger.error("Max retries reached. Failed to stop motors.")
-                    return False
-
-            except Exception as e:
-                # Log unexpected errors and fail immediately
-                self.logger.error(f"Unexpected error while stopping motors: {e}")
-                return False
-
-        self.logger.error("Failed to stop motors after maximum retries. Critical failure!")
-        return False
+        except Exception as e:
+            # Log unexpected errors and fail immediately
+            self.logger.error(f"Unexpected error while stopping motors: {e}")
+            return False
 
     def cleanup(self):
         self.logger.info(f"cleanup function executed at module {self.config.MODULE_NAME}")
+        self.unwatch()
+        try:
+            self.estop.close()
+        except RuntimeError:
+            pass # event loop already closed
         if self.client_left is not None and self.client_right is not None:
             self.client_left.close()
             self.client_right.close()    
 
-    async def home(self):
+    def _homing_poll_interval(self, snapshot: DriveSnapshot):
+        """
+        Polls slowly while the actuator is far from home and fast near completion.
+        Remaining time is estimated from position and velocity towards home (0 revs)
+        """
+        poll_min, poll_max = self.config.HOMING_POLL_MIN, self.config.HOMING_POLL_MAX
+        speed = abs(snapshot.velocity)
+        if speed < 0.01:
+            # Not moving yet or already stopping at home
+            return poll_min if snapshot.position < 0.1 else poll_max
+        remaining = snapshot.position / speed
+        return max(poll_min, min(remaining / 4, poll_max))
+
+    async def _start_homing(self, client) -> bool:
+        delay = self.retry_delay
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = await client.write_register(address=self.config.IEG_MOTION, value=256,
+                                                       slave=self.config.SLAVE_ID)
+                if not response.isError():
+                    return True
+                error = response
+            except (ConnectionException, ModbusIOException) as e:
+                error = e
+
+            self.retries["home"].inc()
+            self.logger.error(f"Failed to initiate homing command on {client.drive}. Attempt {attempt}: {error}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.config.CONNECT_BACKOFF_MAX)
+        return False
+
+    async def home_drive(self, client) -> bool:
+        """
+        Homing state machine for one drive | command -> moving -> homed.
+        Each drive has its own HOMING_TIMEOUT.
+        Returns True when homed, False if the command fails, drive faults or it times out
+        """
         try:
-            attempt_left = 0
-            attempt_right = 0
-            success_right = False
-            success_left = False
-            max_retries = self.max_retries
-            
-            while max_retries > attempt_left and max_retries > attempt_right:
-                if not success_left:
-                    success_left = await self.client_right.write_register(address=self.config.IEG_MOTION,
-                                            value=256,
-                                            slave=self.config.SLAVE_ID)
-                if not success_right:
-                    success_right = await self.client_left.write_register(address=self.config.IEG_MOTION,
-                                            value=256,
-                                            slave=self.config.SLAVE_ID)
-            
-                if success_left.isError():
-                    attempt_left += 1
-                    self.logger.error(f"Failed to initiate homing command on left. Attempt {attempt_left}")
-                else:
-                    success_left = True
-
-                if success_right.isError():
-                    attempt_right += 1
-                    self.logger.error(f"Failed to initiate homing command on right motor. Attempt {attempt_right}")
-                else:
-                    success_right = True
-            
-            if not success_left or not success_right:
-                self.logger.error(f"Failed to initiate homing command on both motors. Left: {success_left} | right: Left: {success_right}")
+            if not await self._start_homing(client):
                 return False
 
-            ### homing order was success for both motos make a poller coroutine to poll when the homing is done.
-            #Checks if both actuators are homed or not. Returns True when homed.
-            homing_max_duration = 30
-            start_time = time.time()
-            elapsed_time = 0
-            while elapsed_time <= homing_max_duration:
-                OEG_STATUS_right = await self.client_right.read_holding_registers(address=self.config.OEG_STATUS,
-                                    count=1,
-                                    slave=self.config.SLAVE_ID)
-
-                OEG_STATUS_left = await self.client_left.read_holding_registers(address=self.config.OEG_STATUS,
-                                        count=1,
-                                        slave=self.config.SLAVE_ID)
-                
-                if OEG_STATUS_right.isError() or OEG_STATUS_left.isError():
-                    self.logger.error(f"Unexpected error while reading OEG_STATUS registers: {e}")
-                    await asyncio.sleep(0.2)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            deadline = start + self.config.HOMING_TIMEOUT
+            interval = self.config.HOMING_POLL_MIN
+            while loop.time() < deadline:
+                await asyncio.sleep(interval)
+                try:
+                    block_registers = await self.pool.read_blocks(client)
+                except (ConnectionException, ModbusIOException) as e:
+                    block_registers = None
+                    self.logger.error(f"Exception reading {client.drive} status while homing: {e}")
+
+                if block_registers is None:
+                    interval = self.config.HOMING_POLL_MAX
                     continue
-                
-                ishomed_right = is_nth_bit_on(1, OEG_STATUS_right[0])
-                ishomed_left = is_nth_bit_on(1, OEG_STATUS_left[0])
 
-                # Success
-                if ishomed_right and ishomed_left:
-                    self.logger.info(f"Both motors homes successfully: {e}")
+                snapshot = decode_snapshot(self.snapshot_blocks, block_registers)
+                if snapshot.is_faulted:
+                    self.logger.error(f"{client.drive} motor faulted while homing. Fault: {snapshot.fault}")
+                    return False
+                if snapshot.is_homed:
+                    self.logger.info(f"{client.drive} motor homed in {loop.time() - start:.2f}s")
                     return True
-                
-                await asyncio.sleep(0.2)
-                elapsed_time = time.time() - start_time
-            
-            self.logger.error(f"Failed to home both motors within the time limit of: {homing_max_duration}")
-            return False
+                interval = self._homing_poll_interval(snapshot)
 
+            self.logger.error(f"Failed to home {client.drive} motor within the time limit of: {self.config.HOMING_TIMEOUT}")
+            return False
 
         except Exception as e:
-            self.logger.error(f"Unexpected error while homing motors: {e}")
+            self.logger.error(f"Unexpected error while homing {client.drive} motor: {e}")
             return False
 
+    async def home(self):
+        """
+        Homes both motors in parallel.
+        Returns True when both are homed
+        """
+        left_homed, right_homed = await asyncio.gather(
+            self.home_drive(self.client_left),
+            self.home_drive(self.client_right)
+        )
+        if left_homed and right_homed:
+            self.logger.info("Both motors homed successfully")
+            return True
+        self.logger.error(f"Failed to home both motors. Left: {left_homed} | right: {right_homed}")
+        return False
+
 
                     
\ No newline at end of file
@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import platform
+import time
+import numpy as np
+from config import Config
+from utils import (split_24bit_to_components, split_20bit_to_components,
+                   combine_to_24bit, combine_to_20bit, convert_to_revs)
+from register_codecs import (encode_revs, decode_signed_revs, encode_ucur, revs_to_upos16,
+                             encode_revs_batch, decode_revs_batch, encode_upos16_batch)
+from kinematics import PlatformKinematics
+from trajectory_buffer import validate_batch
+from ModbusClients import ModbusClients
+from drive_simulator import DriveSimulator
+from palvelin import get_modbuscntrl_val
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'baseline.json')
+SIMULATOR_HOSTS = ("127.0.0.1", "127.0.0.2")
+
+def percentile(sorted_samples, q):
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return sorted_samples[index]
+
+def summarize(samples, total_ops, elapsed):
+    """
+    samples are per operation latencies in seconds
+    """
+    samples.sort()
+    return {
+        "ops_per_sec": total_ops / elapsed,
+        "p50_us": percentile(samples, 0.5) * 1e6,
+        "p99_us": percentile(samples, 0.99) * 1e6,
+        "samples": len(samples),
+    }
+
+def bench_sync(fn, args, duration, batch=200):
+    """
+    Times fn(*args) in batches so timer overhead does not dominate sub microsecond calls.
+    Latency samples are batch time / batch size.
+    """
+    samples = []
+    total_ops = 0
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    while perf_counter() - start < duration:
+        batch_start = perf_counter()
+        for _ in range(batch):
+            fn(*args)
+        samples.append((perf_counter() - batch_start) / batch)
+        total_ops += batch
+    return summarize(samples, total_ops, perf_counter() - start)
+
+async def bench_async(coro_fn, duration):
+    samples = []
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    while perf_counter() - start < duration:
+        op_start = perf_counter()
+        await coro_fn()
+        samples.append(perf_counter() - op_start)
+    return summarize(samples, len(samples), perf_counter() - start)
+
+BATCH_SIZE = 4096 # rows per batch codec call, one playback position chunk
+
+def codec_benchmarks(config):
+    # Lookup time does not depend on the geometry, any values do when it is not configured
+    if config.ACTUATOR_X_MM is None or config.ACTUATOR_Y_MM is None:
+        config = dataclasses.replace(config, ACTUATOR_X_MM=300.0, ACTUATOR_Y_MM=250.0)
+    kinematics = PlatformKinematics(config)
+    revs = np.linspace(0.0, 29.0, BATCH_SIZE)
+    registers = encode_revs_batch(revs)
+    fractions = np.linspace(0.0, 1.0, BATCH_SIZE)
+    # Bulk trajectory batch at the control rate, slow enough to pass every limit
+    times = np.arange(BATCH_SIZE) / config.POS_UPDATE_HZ
+    sine = 32767 + 10000 * np.sin(2 * np.pi * 0.1 * times)
+    batch = {"time": times, "left": sine, "right": sine}
+    return {
+        "split_24bit_to_components": (split_24bit_to_components, (9.842519685,)),
+        "split_20bit_to_components": (split_20bit_to_components, (50.0,)),
+        "combine_to_24bit": (combine_to_24bit, (55214, 9)),
+        "combine_to_20bit": (combine_to_20bit, (0, 50)),
+        "convert_to_revs": (convert_to_revs, ([61406, 28],)),
+        "encode_revs": (encode_revs, (28.937007874,)),
+        "decode_signed_revs": (decode_signed_revs, ([25801, 65535],)),
+        "encode_ucur": (encode_ucur, (1.0,)),
+        "revs_to_upos16": (revs_to_upos16, (14.5, 0.393698, 28.936996)),
+        # Batch codecs | latency is per call of BATCH_SIZE values
+        "encode_revs_batch": (encode_revs_batch, (revs,)),
+        "decode_revs_batch": (decode_revs_batch, (registers,)),
+        "encode_upos16_batch": (encode_upos16_batch, (fractions,)),
+        "kinematics_positions": (kinematics.positions, (3.5, -2.25, 1.0)),
+        "validate_batch": (validate_batch, (batch, kinematics, config)),
+    }
+
+async def bench_stop(stop, simulators, duration, interval=0.01):
+    """
+    Stop command to the stop reaching every simulated drive | measured with the
+    simulators' own receive time, both run in this process on the same clock
+    """
+    samples = []
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    while perf_counter() - start < duration:
+        for simulator in simulators:
+            simulator.stop_received = None
+        commanded = perf_counter()
+        await stop()
+        received = [simulator.stop_received for simulator in simulators]
+        if None not in received:
+            samples.append(max(received) - commanded)
+        await asyncio.sleep(interval)
+    return summarize(samples, len(samples), perf_counter() - start)
+
+async def stop_benchmarks(clients, simulators, config, duration, selected):
+    """
+    Stops while motion writes keep both main connections at their in-flight limit.
+    emergency_stop goes through the stop lane, stop_main_connection is a plain
+    paired write on the main connections for comparison
+    """
+    async def motion():
+        while True:
+            await clients.paired_write_register(config.MODBUS_ANALOG_POSITION, 32767, 32767, return_exceptions=True)
+
+    clients.estop.start()
+    while not all(connection.connected for connection in clients.estop.connections.values()):
+        await asyncio.sleep(0.01)
+
+    load = [asyncio.create_task(motion()) for _ in range(config.MODBUS_MAX_IN_FLIGHT * 4)]
+    results = {}
+    try:
+        if selected("emergency_stop"):
+            wire = []
+            async def stop():
+                await clients.stop()
+                wire.append(clients.estop.last_wire_latency)
+            results["emergency_stop"] = await bench_stop(stop, simulators, duration)
+            wire.sort()
+            results["emergency_stop"]["wire_p99_us"] = percentile(wire, 0.99) * 1e6
+            results["emergency_stop"]["bound_us"] = config.ESTOP_WIRE_BOUND * 1e6
+        if selected("stop_main_connection"):
+            results["stop_main_connection"] = await bench_stop(
+                lambda: clients.paired_write_register(config.IEG_MOTION, 4, 4), simulators, duration)
+    finally:
+        for task in load:
+            task.cancel()
+        await asyncio.gather(*load, return_exceptions=True)
+    return results
+
+async def modbus_benchmarks(config, duration, latency, selected):
+    """
+    Snapshot read and paired write cycles through ModbusClients
+    against two local drive simulators
+    """
+    simulators = []
+    for host in SIMULATOR_HOSTS:
+        simulator = DriveSimulator(config, name=host, latency=latency, logger=logging.getLogger("benchmark"))
+        await simulator.start(host, config.SERVER_PORT)
+        simulators.append(simulator)
+
+    clients = ModbusClients(config=config, logger=logging.getLogger("benchmark"))
+    results = {}
+    try:
+        if not await clients.connect():
+            raise RuntimeError("Could not connect to drive simulators")
+
+        cases = {
+            "read_snapshot": clients.read_snapshot,
+            "get_modbuscntrl_val": lambda: get_modbuscntrl_val(clients, config),
+            "paired_write_position": lambda: clients.paired_write_register(
+                config.MODBUS_ANALOG_POSITION, 32767, 32767),
+        }
+        for name, coro_fn in cases.items():
+            if selected(name):
+                results[name] = await bench_async(coro_fn, duration)
+        if selected("emergency_stop") or selected("stop_main_connection"):
+            results.update(await stop_benchmarks(clients, simulators, config, duration, selected))
+    finally:
+        clients.cleanup()
+        for simulator in simulators:
+            await simulator.close()
+
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Returns list of regression descriptions. A benchmark regresses when its
+    throughput drops or its median latency grows by more than threshold.
+    """
+    regressions = []
+    for name, result in results.items():
+        if "bound_us" in result and result["wire_p99_us"] > result["bound_us"]:
+            regressions.append(f"{name}: wire p99 {result['wire_p99_us']:.2f} us exceeds bound {result['bound_us']:.2f} us")
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: {result['ops_per_sec']:.0f} ops/s vs baseline {base['ops_per_sec']:.0f}")
+        if result["p50_us"] > base["p50_us"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {result['p50_us']:.2f} us vs baseline {base['p50_us']:.2f}")
+    return regressions
+
+def print_results(results, baseline):
+    print(f"{'benchmark':<28}{'ops/s':>14}{'p50 us':>12}{'p99 us':>12}{'p50 vs base':>14}")
+    for name, result in results.items():
+        change = ""
+        if name in baseline and baseline[name]["p50_us"]:
+            change = f"{(result['p50_us'] / baseline[name]['p50_us'] - 1) * 100:+.1f}%"
+        print(f"{name:<28}{result['ops_per_sec']:>14.0f}{result['p50_us']:>12.2f}{result['p99_us']:>12.2f}{change:>14}")
+        if "bound_us" in result:
+            print(f"{'':<28}wire p99 {result['wire_p99_us']:.2f} us, bound {result['bound_us']:.2f} us")
+
+async def run(args):
+    config = Config()
+    config.SERVER_PORT = args.port
+    config.SERVER_IP_LEFT, config.SERVER_IP_RIGHT = SIMULATOR_HOSTS
+    config.MODULE_NAME = "benchmark.py"
+
+    def selected(name):
+        return args.filter is None or args.filter in name
+
+    results = {}
+    for name, (fn, fn_args) in codec_benchmarks(config).items():
+        if selected(name):
+            results[name] = bench_sync(fn, fn_args, args.duration)
+
+    if not args.skip_modbus:
+        results.update(await modbus_benchmarks(config, args.duration, args.latency, selected))
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Control path microbenchmarks")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per benchmark")
+    parser.add_argument("--filter", type=str, help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="baseline results file")
+    parser.add_argument("--save", action="store_true", help="save results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    parser.add_argument("--port", type=int, default=15020, help="drive simulator port")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated drive response latency in seconds")
+    parser.add_argument("--skip_modbus", action="store_true", help="only run the in-process benchmarks")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run(args))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+
+    print_results(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "results": results,
+            }, f, indent=2)
+        print(f"Saved baseline to {os.path.abspath(args.baseline)}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
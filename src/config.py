@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class Config:
@@ -9,15 +10,49 @@ class Config:
     VFEEDBACK_VELOCITY: int = 361
     SERVER_IP_LEFT: str = '192.168.0.211'  
     SERVER_IP_RIGHT: str = '192.168.0.212'
-    POS_UPDATE_HZ: int = 1
+    PLATFORMS: Optional[dict] = None # platform name -> {"left": ip, "right": ip}, None = SERVER_IP_LEFT and SERVER_IP_RIGHT
+    POS_UPDATE_HZ: int = 50 # control loop rate
     SERVER_PORT: int = 502  
     SLAVE_ID: int = 1
-    POLLING_TIME_INTERVAL: float = 5.0
-    START_TID: int = 10001 # first TID will be startTID + 1
-    LAST_TID: int = 20000
+    POLLING_TIME_INTERVAL: float = 0.1 # fault poller interval when idle, reads shared memory only
+    FAULT_POLL_FAST: float = 0.01 # fault poller interval while moving or after a fault
+    FAULT_RECENT_WINDOW: float = 10.0 # seconds a fault keeps the fault poller fast
+    FAULT_RESET_RETRY_INTERVAL: float = 1.0
+    MOTION_VELOCITY_THRESHOLD: float = 0.05 # revs/s, slower counts as standing still
+    FAULT_EVENT_SOCKET: str = "/tmp/liikealusta_faults.sock" # fault poller -> server events
+    FAULT_EVENT_PORT: int = 5002 # used instead of the socket on Windows
     CONNECTION_TRY_COUNT = 5
+    CONNECT_BACKOFF_INITIAL: float = 0.1 # seconds, doubled after every failed attempt
+    CONNECT_BACKOFF_MAX: float = 2.0
+    HOMING_TIMEOUT: float = 30.0 # seconds per drive
+    HOMING_POLL_MIN: float = 0.02 # status poll interval near the end of homing
+    HOMING_POLL_MAX: float = 0.25 # status poll interval far from home
+    MODBUS_TIMEOUT: float = 1.0 # seconds per request
+    WATCHDOG_KEEPALIVE_INTERVAL: float = 0.5 # seconds without a response before the watchdog reads the drive status
+    WATCHDOG_KEEPALIVE_TIMEOUT: float = 0.5
+    WATCHDOG_FAILURE_THRESHOLD: int = 3 # failed requests in a row that open the circuit
+    WATCHDOG_RECONNECT_MAX: float = 2.0 # seconds, upper limit of the reconnect backoff
+    ESTOP_WIRE_BOUND: float = 0.001 # seconds from stop command to the stop frames written, exceeding it is logged as critical
+    ESTOP_RESEND_INTERVAL: float = 0.05 # stop is resent if not acknowledged within this
+    ESTOP_DEADLINE: float = 1.0 # seconds a stop is resent before giving up
+    ESTOP_KEEPALIVE_INTERVAL: float = 1.0 # status read on the stop connections to keep them verified
+    ESTOP_KEEPALIVE_TIMEOUT: float = 0.5
+    MODBUS_MAX_IN_FLIGHT: int = 8 # pipelined requests per drive connection, 1 disables pipelining
+    ESTIMATOR_POSITION_GAIN: float = 0.8 # share of the position feedback residual taken into the estimate
+    ESTIMATOR_VELOCITY_GAIN: float = 0.6
+    ESTIMATOR_ACCELERATION_GAIN: float = 0.2
+    ESTIMATOR_MAX_HORIZON: float = 0.1 # seconds the estimate is extrapolated at most
+    ESTIMATOR_LATENCY_SMOOTHING: float = 0.1 # weight of a new round trip in the smoothed latency
     WEB_SERVER_PORT: int = 5001
+    MODULE_RESTART_BACKOFF: float = 0.1 # seconds before the first restart of a crashed module, doubled per crash
+    MODULE_RESTART_BUDGET: int = 5 # crashes allowed within MODULE_RESTART_WINDOW before giving up
+    MODULE_RESTART_WINDOW: float = 60.0
     MODULE_NAME = None
+    LOG_QUEUE_SIZE: int = 10000 # records waiting for the log writer thread, more are dropped
+    LOG_REPEAT_BURST: int = 5 # records let through per call site within LOG_REPEAT_WINDOW
+    LOG_REPEAT_WINDOW: float = 10.0
+    LOG_STRUCTURED: bool = True # log files as JSON lines
+    STANDBY: bool = False # started by ModuleManager as a warm standby
 
     OEG_STATUS: int = 104
     PFEEDBACK_POSITION = 378
@@ -32,3 +67,54 @@ class Config:
     ANALOG_ACCELERATION_MAXIMUM = 7108
 
     COMMAND_MODE = 4303
+
+    MODBUS_MAX_READ_COUNT: int = 125 # Modbus limit for one read holding registers request
+    READ_BLOCK_MAX_GAP: int = 32 # max unused registers read to merge two reads into one block
+
+    # Platform geometry
+    SCREW_LEAD_MM: float = 5.08 # mm/rev
+    STROKE_MIN_MM: float = 2.0
+    STROKE_MAX_MM: float = 147.0
+    STROKE_NEUTRAL_MM: float = 74.5
+    # Measured on the platform | pitch/roll setpoints are refused while either is None
+    ACTUATOR_X_MM: Optional[float] = None # actuator distance forward of the pivot
+    ACTUATOR_Y_MM: Optional[float] = None # actuator distance sideways of the pivot
+    PITCH_LIMIT_DEG: float = 15.0
+    ROLL_LIMIT_DEG: float = 15.0
+
+    # Drive state published by the server to other modules through shared memory
+    STATE_SHM_NAME: str = "liikealusta_drive_state"
+    STATE_RING_SIZE: int = 64 # snapshots kept per drive
+    STATE_PUBLISH_HZ: int = 50 # while moving or faulted
+    STATE_IDLE_PUBLISH_HZ: int = 5
+    STATE_ACTIVE_HOLD: float = 2.0 # seconds publishing stays fast after the last new setpoint
+    STATE_HEARTBEAT_TIMEOUT: float = 1.0
+
+    DRIVE_PROFILE: str = "testing" # drive_profiles.PROFILES
+
+    # Setpoint smoothing before the drives | same limits as the testing drive profile
+    MOTION_VEL_LIMIT_MM_S: float = 50.0
+    MOTION_ACC_LIMIT_MM_S2: float = 254.0
+    MOTION_JERK_LIMIT_MM_S3: float = 2500.0
+    # Washout
+    WASHOUT_HEAVE_CUTOFF_HZ: float = 0.5
+    WASHOUT_HEAVE_SCALE: float = 0.5
+    TILT_COORDINATION_CUTOFF_HZ: float = 0.3
+    TILT_RATE_LIMIT_DEG_S: float = 3.0 # below what the operator notices as rotation
+    TILT_COORDINATION_LIMIT_DEG: float = 10.0
+
+    # Bulk trajectory buffer | POST /trajectory
+    BUFFER_START_DELAY: float = 0.1 # seconds from the first batch of a stream to its first row
+    BUFFER_MAX_AHEAD: float = 60.0 # seconds of motion that can be queued ahead of the stream time
+    BUFFER_MAX_ROWS: int = 100000
+    BUFFER_IDLE_TIMEOUT: float = 1.0 # seconds the buffer can stay empty before the stream ends
+    BUFFER_LIMIT_TOLERANCE: float = 0.05 # fraction velocity and acceleration may exceed the limits, position quantization
+
+    # Control tick recording | recordings/<start time>/<column>.npy
+    RECORDER_ENABLED: bool = True
+    RECORDER_KEEP: int = 10 # recordings kept per platform, older ones are deleted at startup
+    RECORDER_CAPACITY: int = 180000 # rows kept on disk, 1 h at 50 Hz
+    RECORDER_BUFFER_SIZE: int = 4096 # rows kept in memory between flushes
+    RECORDER_FLUSH_INTERVAL: float = 1.0
+
+    WS_TELEMETRY_INTERVAL: float = 0.1 # seconds between telemetry messages on /stream
@@ -0,0 +1,179 @@
+import asyncio
+import math
+import time
+from typing import Optional
+from setpoints import SetpointSlot, Setpoint
+from metrics import REGISTRY
+
+STOP_GATE = "stop" # held from an emergency stop until resume()
+
+class ControlLoop:
+    """
+    Fixed rate control loop. Every tick writes the latest setpoint to both drives.
+    Ticks that are missed are skipped so there is never a backlog to catch up.
+    With a pipeline (motion_cueing.MotionPipeline) the setpoint is filtered every tick
+    before it is written.
+    While a drive is gated (faulted) nothing is written, newest setpoint is still kept.
+    With a recorder (telemetry_recorder.TelemetryRecorder) every written tick is recorded
+    with the newest drive snapshots.
+    labels are added to the metrics, e.g. {"platform": name} when the server runs several platforms.
+    """
+    def __init__(self, clients, config, logger, slot: Optional[SetpointSlot] = None, pipeline=None, recorder=None,
+                 labels=None):
+        self.clients = clients
+        self.config = config
+        self.logger = logger
+        self.slot = slot if slot is not None else SetpointSlot()
+        self.period = 1.0 / config.POS_UPDATE_HZ
+        self.setpoint: Optional[Setpoint] = None # held and rewritten every tick
+        self.pipeline = pipeline
+        self.recorder = recorder
+        self.gated = {} # drive -> reason, writes are held while not empty
+        self.last_setpoint_time = None # loop time of the newest setpoint taken from the slot
+
+        self.jitter = REGISTRY.histogram("control_tick_jitter_seconds", "Tick start delay from its deadline", labels)
+        self.tick_duration = REGISTRY.histogram("control_tick_duration_seconds", "Time spent in one tick", labels)
+        self.ticks = 0
+        self.overruns = 0
+        self.missed_deadlines = 0
+        self.write_errors = 0
+        self.gated_ticks = 0
+        REGISTRY.counter("control_ticks", "Control loop ticks", labels, fn=lambda: self.ticks)
+        REGISTRY.counter("control_overruns", "Ticks that took longer than the period", labels, fn=lambda: self.overruns)
+        REGISTRY.counter("control_missed_deadlines", "Skipped control loop ticks", labels, fn=lambda: self.missed_deadlines)
+        REGISTRY.counter("control_write_errors", "Failed setpoint writes", labels, fn=lambda: self.write_errors)
+        REGISTRY.counter("control_gated_ticks", "Ticks not written because a drive is faulted", labels, fn=lambda: self.gated_ticks)
+
+        self.last_written: Optional[Setpoint] = None
+        self.last_positions: Optional[tuple[int, int]] = None # (left, right) last written to the drives
+        self._written = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def gate(self, drive, reason):
+        if drive not in self.gated:
+            self.logger.warning(f"Control loop writes gated by {drive}: {reason}")
+        self.gated[drive] = reason
+
+    def ungate(self, drive):
+        if self.gated.pop(drive, None) is not None:
+            self.logger.info(f"Control loop writes no longer gated by {drive}")
+
+    @property
+    def halted(self):
+        return STOP_GATE in self.gated
+
+    def halt(self, reason):
+        """
+        Emergency stop | holds every write until resume() and drops the held
+        and the pending setpoint so nothing old is written afterwards
+        """
+        self.gate(STOP_GATE, reason)
+        self.slot.take_nowait()
+        self.setpoint = None
+
+    def resume(self, setpoint: Setpoint):
+        """
+        Continues writing from setpoint, the current position of the drives.
+        The pipeline starts over from it instead of from where it was before the stop
+        """
+        if self.pipeline is not None:
+            self.pipeline.reset()
+        self.setpoint = None
+        self.slot.put(setpoint)
+        self.ungate(STOP_GATE)
+
+    async def wait_written(self) -> Optional[Setpoint]:
+        """
+        Waits for the next tick that writes a setpoint and returns it
+        """
+        await self._written.wait()
+        return self.last_written
+
+    async def tick(self):
+        setpoint = self.slot.take_nowait()
+        if setpoint is not None:
+            self.setpoint = setpoint
+            self.last_setpoint_time = asyncio.get_running_loop().time()
+
+        if self.gated:
+            self.gated_ticks += 1
+            return
+
+        if self.setpoint is None:
+            return
+
+        left, right = self.setpoint.left, self.setpoint.right
+        if self.pipeline is not None:
+            left, right = self.pipeline.step(self.setpoint)
+
+        try:
+            left_response, right_response = await self.clients.paired_write_register(
+                self.config.MODBUS_ANALOG_POSITION, left, right)
+        except Exception as e:
+            self.write_errors += 1
+            self.logger.error(f"Control loop failed to write setpoint: {e}")
+            return
+        if left_response.isError() or right_response.isError():
+            self.write_errors += 1
+            for side, response in (("left", left_response), ("right", right_response)):
+                if response.isError():
+                    self.logger.error(f"Control loop setpoint rejected by the {side} drive: {response}")
+            return
+
+        if self.recorder is not None:
+            self.recorder.record(time.time(), left, right, *self.clients.last_snapshots)
+
+        self.last_written = self.setpoint
+        self.last_positions = (left, right)
+        written, self._written = self._written, asyncio.Event()
+        written.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.logger.info(f"Starting control loop at {self.config.POS_UPDATE_HZ} Hz")
+        deadline = loop.time()
+
+        while True:
+            now = loop.time()
+            if now < deadline:
+                await asyncio.sleep(deadline - now)
+
+            start = loop.time()
+            self.jitter.observe(start - deadline)
+            await self.tick()
+            end = loop.time()
+            self.tick_duration.observe(end - start)
+            self.ticks += 1
+
+            if end - start > self.period:
+                self.overruns += 1
+
+            deadline += self.period
+            if end > deadline:
+                # Skip the ticks we could not make instead of running them late
+                missed = math.floor((end - deadline) / self.period) + 1
+                self.missed_deadlines += missed
+                deadline += missed * self.period
+
+    def stats(self):
+        return {
+            "rate_hz": self.config.POS_UPDATE_HZ,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "missed_deadlines": self.missed_deadlines,
+            "write_errors": self.write_errors,
+            "gated": dict(self.gated),
+            "gated_ticks": self.gated_ticks,
+            "jitter": self.jitter.summary(),
+            "tick_duration": self.tick_duration.summary(),
+        }
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from typing import Optional
+from metrics import REGISTRY
+from modbus_mux import ModbusMultiplexer
+from register_planner import plan_block_reads, snapshot_registers, decode_snapshot, DriveSnapshot
+
+DEFAULT_PLATFORM = "default"
+
+def platform_hosts(config) -> dict[str, dict[str, str]]:
+    """
+    Returns dict of platform name -> dict of drive name -> host.
+    Without PLATFORMS the single platform is SERVER_IP_LEFT and SERVER_IP_RIGHT
+    """
+    if config.PLATFORMS:
+        return config.PLATFORMS
+    return {DEFAULT_PLATFORM: {"left": config.SERVER_IP_LEFT, "right": config.SERVER_IP_RIGHT}}
+
+def drive_id(platform, drive):
+    """
+    Name of a drive in the pool and in metric labels | the default platform keeps plain left and right
+    """
+    return drive if platform == DEFAULT_PLATFORM else f"{platform}.{drive}"
+
+class DrivePool:
+    """
+    Connections to any number of named drives grouped into platforms, all on one event loop.
+    Batched operations run on every given drive at the same time and return
+    dict of drive id -> result, a failing drive does not fail the others.
+    ModbusClients is a two drive view of one platform in the pool.
+    """
+    def __init__(self, config, logger, platforms: Optional[dict[str, dict[str, str]]] = None):
+        self.config = config
+        self.logger = logger
+        platforms = platforms or platform_hosts(config)
+        # platform -> drive name -> drive id
+        self.platforms = {
+            platform: {drive: drive_id(platform, drive) for drive in drives}
+            for platform, drives in platforms.items()
+        }
+        self.hosts = {
+            drive_id(platform, drive): host
+            for platform, drives in platforms.items() for drive, host in drives.items()
+        }
+        self.clients: dict[str, ModbusMultiplexer] = {}
+        self.snapshot_blocks = plan_block_reads(
+            snapshot_registers(config),
+            max_count=config.MODBUS_MAX_READ_COUNT,
+            max_gap=config.READ_BLOCK_MAX_GAP
+        )
+        # Block holding position and velocity, its own round trip dates the feedback
+        self.feedback_block = next(i for i, block in enumerate(self.snapshot_blocks) if "position" in block.fields)
+        # Register address -> Config name for metric labels
+        self.register_names = {
+            value: name for name, value in vars(type(config)).items()
+            if name.isupper() and isinstance(value, int) and not isinstance(value, bool)
+        }
+        REGISTRY.gauge("pool_drives_connected", "Drives in the pool with an open connection",
+                       fn=lambda: sum(client.connected for client in self.clients.values()))
+
+    @property
+    def drives(self):
+        return list(self.hosts)
+
+    def create(self, drives=None):
+        """
+        Creates new connection objects for the drives (default all), old ones are closed
+        """
+        for drive in drives or self.drives:
+            old = self.clients.get(drive)
+            if old is not None:
+                old.close()
+            self.clients[drive] = ModbusMultiplexer(
+                host=self.hosts[drive],
+                port=self.config.SERVER_PORT,
+                timeout=self.config.MODBUS_TIMEOUT,
+                max_in_flight=self.config.MODBUS_MAX_IN_FLIGHT,
+                logger=self.logger,
+                drive=drive,
+                register_names=self.register_names
+            )
+
+    async def gather(self, operation, drives=None) -> dict:
+        """
+        Runs operation(client) for the drives (default all) concurrently.
+        Returns dict of drive id -> result or the exception it raised
+        """
+        drives = list(drives or self.drives)
+        results = await asyncio.gather(*(operation(self.clients[drive]) for drive in drives), return_exceptions=True)
+        return dict(zip(drives, results))
+
+    async def connect(self, drives=None) -> dict[str, bool]:
+        results = await self.gather(lambda client: client.connect(), drives)
+        return {drive: result is True for drive, result in results.items()}
+
+    async def read_registers(self, address, count=1, drives=None) -> dict:
+        return await self.gather(
+            lambda client: client.read_holding_registers(address=address, count=count, slave=self.config.SLAVE_ID),
+            drives
+        )
+
+    async def write_register(self, address, values: dict[str, int]) -> dict:
+        """
+        Writes values[drive] to every drive in values
+        """
+        return await self.gather(
+            lambda client: client.write_register(address=address, value=values[client.drive], slave=self.config.SLAVE_ID),
+            values
+        )
+
+    async def _read_block(self, client, block):
+        """
+        Returns tuple of (response, sent, received) | perf_counter times of this request
+        """
+        sent = time.perf_counter()
+        response = await client.read_holding_registers(address=block.address, count=block.count,
+                                                       slave=self.config.SLAVE_ID)
+        return response, sent, time.perf_counter()
+
+    async def read_blocks_timed(self, client):
+        """
+        Sends every snapshot block read at once, pipelined on the connection.
+        Returns tuple of (block_registers, sent, received) with the times of the
+        position and velocity block, block_registers is None if a read fails
+        """
+        results = await asyncio.gather(*(self._read_block(client, block) for block in self.snapshot_blocks))
+        if any(response.isError() for response, _, _ in results):
+            return None, None, None
+        _, sent, received = results[self.feedback_block]
+        return [response.registers for response, _, _ in results], sent, received
+
+    async def read_blocks(self, client):
+        block_registers, _, _ = await self.read_blocks_timed(client)
+        return block_registers
+
+    async def read_snapshots(self, drives=None) -> dict[str, Optional[DriveSnapshot]]:
+        """
+        Status, fault, position and velocity of the drives (default all) with the planned block reads.
+        Returns dict of drive id -> snapshot, None for drives that could not be read
+        """
+        results = await self.gather(self.read_blocks, drives)
+        return {
+            drive: decode_snapshot(self.snapshot_blocks, registers) if isinstance(registers, list) else None
+            for drive, registers in results.items()
+        }
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
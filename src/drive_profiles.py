@@ -0,0 +1,147 @@
+import asyncio
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional
+from register_codecs import encode_revs, decode_revs, encode_ucur
+from register_planner import plan_block_reads, decode_blocks
+
+@dataclass(frozen=True)
+class DriveProfile:
+    """
+    Drive parameters in engineering units. Same profile is applied to both drives.
+    """
+    name: str
+    position_max_mm: float
+    position_min_mm: float
+    velocity_max_mm_s: float
+    acceleration_max_mm_s2: float
+    peak_current_a: float
+    analog_input_channel: int = 2 # modbus ctrl
+
+    def encode(self, config):
+        """
+        Returns dict of config register name -> (address, list of register values)
+        """
+        lead = config.SCREW_LEAD_MM
+        return {
+            "ANALOG_POSITION_MAXIMUM": (config.ANALOG_POSITION_MAXIMUM, encode_revs(self.position_max_mm / lead)),
+            "ANALOG_POSITION_MINIMUM": (config.ANALOG_POSITION_MINIMUM, encode_revs(self.position_min_mm / lead)),
+            "ANALOG_VEL_MAXIMUM": (config.ANALOG_VEL_MAXIMUM, encode_revs(self.velocity_max_mm_s / lead)),
+            "ANALOG_ACCELERATION_MAXIMUM": (config.ANALOG_ACCELERATION_MAXIMUM, encode_revs(self.acceleration_max_mm_s2 / lead)),
+            "ANALOG_INPUT_CHANNEL": (config.ANALOG_INPUT_CHANNEL, [self.analog_input_channel]),
+            "IPEAK": (config.IPEAK, [encode_ucur(self.peak_current_a)]),
+        }
+
+    def analog_position_limits(self, config):
+        """
+        Returns (min, max) in revs as the drive holds them after encoding
+        """
+        lead = config.SCREW_LEAD_MM
+        return decode_revs(encode_revs(self.position_min_mm / lead)), decode_revs(encode_revs(self.position_max_mm / lead))
+
+PROFILES = {
+    # Max speed for actuator is 338 mm/s, for testing it is limited to 50 mm/s | 9.84 revs/s, 50 revs/s/s
+    # IPEAK is UCUR 9.7, 1 A is written as 128 (register_codecs.encode_ucur)
+    "testing": DriveProfile(
+        name="testing",
+        position_max_mm=147.0,
+        position_min_mm=2.0,
+        velocity_max_mm_s=50.0,
+        acceleration_max_mm_s2=254.0,
+        peak_current_a=1.0,
+    ),
+}
+
+def get_profile(name) -> DriveProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Invalid drive profile: {name}. Expected one of {', '.join(PROFILES)}.")
+    return PROFILES[name]
+
+class ProfileApplier:
+    """
+    Applies a DriveProfile to both drives with as little Modbus traffic as possible.
+    Current values are read back with block reads, only registers that differ are
+    written, both drives are written at the same time and the result is verified.
+    """
+    def __init__(self, clients, config, logger):
+        self.clients = clients
+        self.config = config
+        self.logger = logger
+
+    async def _read(self, client, blocks):
+        block_registers = []
+        for block in blocks:
+            response = await client.read_holding_registers(
+                address=block.address,
+                count=block.count,
+                slave=self.config.SLAVE_ID
+            )
+            if response.isError():
+                raise IOError(f"Error reading registers {block.address}-{block.address + block.count - 1}")
+            block_registers.append(response.registers)
+        return decode_blocks(blocks, block_registers)
+
+    def _diff(self, wanted, current):
+        return {name: (address, values) for name, (address, values) in wanted.items() if current[name] != values}
+
+    async def _write(self, client, diff):
+        # Writes to one drive are pipelined on its connection
+        responses = await asyncio.gather(*(
+            client.write_registers(address=address, values=values, slave=self.config.SLAVE_ID)
+            if len(values) > 1 else
+            client.write_register(address=address, value=values[0], slave=self.config.SLAVE_ID)
+            for address, values in diff.values()
+        ))
+        failed = [name for name, response in zip(diff, responses) if response.isError()]
+        if failed:
+            raise IOError(f"Error writing {', '.join(failed)}")
+
+    def _plan(self, wanted):
+        return plan_block_reads(
+            {name: (address, len(values)) for name, (address, values) in wanted.items()},
+            max_count=self.config.MODBUS_MAX_READ_COUNT,
+            max_gap=self.config.READ_BLOCK_MAX_GAP
+        )
+
+    async def apply_drive(self, client, profile: DriveProfile) -> Optional[bool]:
+        """
+        Applies the profile to one drive.
+        Returns True if the drive matches the profile afterwards,
+        False if verification fails and None if error
+        """
+        try:
+            wanted = profile.encode(self.config)
+            blocks = self._plan(wanted)
+
+            diff = self._diff(wanted, await self._read(client, blocks))
+            if not diff:
+                self.logger.info(f"Drive profile {profile.name} already applied on {client.drive}")
+                return True
+
+            self.logger.info(f"Applying drive profile {profile.name} on {client.drive}: {', '.join(diff)}")
+            await self._write(client, diff)
+
+            diff = self._diff(wanted, await self._read(client, blocks))
+            if diff:
+                self.logger.error(f"Drive profile {profile.name} verification failed on {client.drive}: {', '.join(diff)}")
+                return False
+
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Exception applying drive profile {profile.name} on {client.drive}: {e}")
+            return None
+
+    async def apply(self, profile: DriveProfile) -> Optional[bool]:
+        """
+        Applies the profile to both drives at the same time.
+        Returns True if both drives match the profile afterwards,
+        False if verification fails and None if error
+        """
+        left_applied, right_applied = await self.clients.paired(
+            partial(self.apply_drive, self.clients.client_left, profile),
+            partial(self.apply_drive, self.clients.client_right, profile)
+        )
+        if left_applied is None or right_applied is None:
+            return None
+        return left_applied and right_applied
@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import time
+from config import Config
+from pymodbus.exceptions import ModbusIOException
+from modbus_mux import (MBAP, encode_frame, read_pdu_length, READ_HOLDING_REGISTERS,
+                        WRITE_SINGLE_REGISTER, WRITE_MULTIPLE_REGISTERS)
+from utils import is_nth_bit_on
+from register_codecs import decode_revs, encode_revs, decode_upos16
+
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+
+HOMED_BIT = 1
+FAULT_BIT = 3
+STOP_BIT = 2
+HOME_BIT = 8
+FAULT_RESET_BIT = 15
+ENABLE_BIT = 1
+
+class DriveSimulator:
+    """
+    Emulates one Tritex drive over Modbus TCP for benchmarks and soak tests.
+    Only the registers in config.Config are meaningful, others read back what was written.
+    Position follows the analog position command with first order dynamics limited by
+    ANALOG_VEL_MAXIMUM and ANALOG_ACCELERATION_MAXIMUM.
+    The IEG_MOTION bits are level inputs like on the drive: the stop bit holds the motor
+    at zero velocity for as long as it is set, and only an IEG_MOTION write with the stop
+    bit cleared releases it. IEG_MODE writes (enable, fault reset), COMMAND_MODE and new
+    analog positions do not. Home requests are ignored while the stop is held.
+    """
+    def __init__(self, config, name="drive", latency=0.0, jitter=0.0, fault_rate=0.0,
+                 drop_rate=0.0, time_constant=0.05, homing_speed=20.0, seed=None, logger=None):
+        self.config = config
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.fault_rate = fault_rate # random faults per second
+        self.drop_rate = drop_rate # probability of not answering a request
+        self.time_constant = time_constant
+        self.homing_speed = homing_speed # revs/s
+        self.random = random.Random(seed)
+        self.logger = logger or logging.getLogger(name)
+
+        self.registers = [0] * 65536
+        self.position = 10.0 # revs
+        self.velocity = 0.0 # revs/s
+        self.homed = False
+        self.homing = False
+        self.stopped = False
+        self.stop_received = None # perf_counter() of the last stop command
+        self.enabled = False
+        self.fault_code = 0
+        self.rejected_writes = set() # addresses whose writes get an exception response
+
+        # Defaults until the client writes its own limits | same as init() writes
+        self._write(config.ANALOG_POSITION_MAXIMUM, [61406, 28])
+        self._write(config.ANALOG_POSITION_MINIMUM, [25801, 0])
+        self._write(config.ANALOG_VEL_MAXIMUM, [55214, 9])
+        self._write(config.ANALOG_ACCELERATION_MAXIMUM, [0, 50])
+
+        self.requests = 0
+        self.dropped = 0
+        self._server = None
+        self._physics_task = None
+        self._connections = set()
+
+    # Faults
+
+    def inject_fault(self, code):
+        self.fault_code = code
+        self.velocity = 0.0
+        self.logger.info(f"{self.name}: injected fault {code}")
+
+    def clear_fault(self):
+        self.fault_code = 0
+
+    # Physics
+
+    def _revs(self, address):
+        return decode_revs(self.registers[address:address + 2])
+
+    def target_position(self):
+        pos_min = self._revs(self.config.ANALOG_POSITION_MINIMUM)
+        pos_max = self._revs(self.config.ANALOG_POSITION_MAXIMUM)
+        percentile = decode_upos16(self.registers[self.config.MODBUS_ANALOG_POSITION])
+        return pos_min + percentile * (pos_max - pos_min)
+
+    def step(self, dt):
+        if self.fault_rate and self.fault_code == 0 and self.random.random() < self.fault_rate * dt:
+            self.inject_fault(self.random.choice([2, 3, 4, 5]))
+
+        vel_max = self._revs(self.config.ANALOG_VEL_MAXIMUM)
+        acc_max = self._revs(self.config.ANALOG_ACCELERATION_MAXIMUM)
+
+        if self.fault_code or self.stopped:
+            desired = 0.0
+        elif self.homing:
+            desired = -self.homing_speed
+            vel_max = max(vel_max, self.homing_speed)
+        elif self.enabled and self.homed and self.registers[self.config.COMMAND_MODE] == 2:
+            desired = (self.target_position() - self.position) / self.time_constant
+        else:
+            desired = 0.0
+
+        desired = max(-vel_max, min(desired, vel_max))
+        dv = max(-acc_max * dt, min(desired - self.velocity, acc_max * dt))
+        if self.fault_code:
+            dv = -self.velocity # faulted drive coasts down immediately
+        self.velocity += dv
+        self.position += self.velocity * dt
+
+        if self.homing and self.position <= 0.0:
+            self.position = 0.0
+            self.velocity = 0.0
+            self.homing = False
+            self.homed = True
+
+        self._publish()
+
+    def _publish(self):
+        status = 0
+        if self.homed:
+            status |= 1 << HOMED_BIT
+        if self.fault_code:
+            status |= 1 << FAULT_BIT
+        self.registers[self.config.OEG_STATUS] = status
+        self.registers[self.config.DRIVER_STATUS_ADDRESS] = status
+        self.registers[self.config.RECENT_FAULT_ADDRESS] = self.fault_code
+        self._write(self.config.PFEEDBACK_POSITION, encode_revs(self.position))
+        self._write(self.config.VFEEDBACK_VELOCITY, encode_revs(self.velocity))
+
+    async def _physics_loop(self, rate_hz=500):
+        previous = time.perf_counter()
+        while True:
+            await asyncio.sleep(1 / rate_hz)
+            now = time.perf_counter()
+            self.step(now - previous)
+            previous = now
+
+    # Register access
+
+    def _write(self, address, values):
+        self.registers[address:address + len(values)] = values
+
+    def _on_write(self, address, values):
+        self._write(address, values)
+        if address <= self.config.IEG_MODE < address + len(values):
+            value = self.registers[self.config.IEG_MODE]
+            if is_nth_bit_on(FAULT_RESET_BIT, value):
+                self.clear_fault()
+            self.enabled = is_nth_bit_on(ENABLE_BIT, value)
+        if address <= self.config.IEG_MOTION < address + len(values):
+            value = self.registers[self.config.IEG_MOTION]
+            if is_nth_bit_on(STOP_BIT, value):
+                self.stopped = True
+                self.homing = False
+                self.stop_received = time.perf_counter()
+            else:
+                self.stopped = False # the only write that releases the stop
+            if is_nth_bit_on(HOME_BIT, value) and not self.fault_code and not self.stopped:
+                self.homing = True
+                self.homed = False
+
+    def handle_pdu(self, pdu):
+        function_code = pdu[0]
+        if function_code == READ_HOLDING_REGISTERS:
+            address, count = struct.unpack_from(">HH", pdu, 1)
+            if count < 1 or count > 125 or address + count > len(self.registers):
+                return struct.pack(">BB", function_code | 0x80, ILLEGAL_DATA_ADDRESS)
+            values = self.registers[address:address + count]
+            return struct.pack(f">BB{count}H", function_code, count * 2, *values)
+
+        if function_code == WRITE_SINGLE_REGISTER:
+            address, value = struct.unpack_from(">HH", pdu, 1)
+            if address in self.rejected_writes:
+                return struct.pack(">BB", function_code | 0x80, ILLEGAL_DATA_ADDRESS)
+            self._on_write(address, [value])
+            return pdu[:5]
+
+        if function_code == WRITE_MULTIPLE_REGISTERS:
+            address, count, _ = struct.unpack_from(">HHB", pdu, 1)
+            if address + count > len(self.registers):
+                return struct.pack(">BB", function_code | 0x80, ILLEGAL_DATA_ADDRESS)
+            self._on_write(address, list(struct.unpack_from(f">{count}H", pdu, 6)))
+            return pdu[:5]
+
+        return struct.pack(">BB", function_code | 0x80, ILLEGAL_FUNCTION)
+
+    # Server
+
+    async def _respond(self, writer, tid, unit, pdu):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not writer.is_closing():
+            writer.write(encode_frame(tid, unit, self.handle_pdu(pdu)))
+
+    async def _handle_connection(self, reader, writer):
+        self.logger.info(f"{self.name}: client connected")
+        self._connections.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                tid, _, length, unit = MBAP.unpack(header)
+                pdu = await reader.readexactly(read_pdu_length(length, self.name))
+                self.requests += 1
+                if self.drop_rate and self.random.random() < self.drop_rate:
+                    self.dropped += 1
+                    continue
+                if self.latency or self.jitter:
+                    asyncio.create_task(self._respond(writer, tid, unit, pdu))
+                else:
+                    writer.write(encode_frame(tid, unit, self.handle_pdu(pdu)))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client went away or the simulator is shutting down
+            pass
+        except ModbusIOException as e:
+            # Like a drive, drops a connection it can not find the next frame on
+            self.logger.error(f"{self.name}: {e}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            self.logger.info(f"{self.name}: client disconnected")
+
+    async def start(self, host="127.0.0.1", port=502):
+        self._publish()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self._physics_task = asyncio.create_task(self._physics_loop())
+        self.logger.info(f"{self.name}: listening on {host}:{port}")
+        return self._server
+
+    async def close(self):
+        if self._physics_task is not None:
+            self._physics_task.cancel()
+        for writer in list(self._connections):
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Tritex drive simulator")
+    parser.add_argument("--hosts", nargs="+", default=["127.0.0.1", "127.0.0.2"],
+                        help="one simulated drive per host address")
+    parser.add_argument("--port", type=int, default=Config.SERVER_PORT, help="port number")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency in seconds")
+    parser.add_argument("--fault_rate", type=float, default=0.0, help="random faults per second")
+    parser.add_argument("--drop_rate", type=float, default=0.0, help="probability to not answer a request")
+    parser.add_argument("--seed", type=int, help="random seed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = Config()
+    simulators = []
+    for host in args.hosts:
+        simulator = DriveSimulator(config, name=host, latency=args.latency, jitter=args.jitter,
+                                   fault_rate=args.fault_rate, drop_rate=args.drop_rate, seed=args.seed)
+        await simulator.start(host, args.port)
+        simulators.append(simulator)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for simulator in simulators:
+            await simulator.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Optional
+from register_planner import DriveSnapshot
+from drive_pool import DEFAULT_PLATFORM
+
+MAGIC = 0x4C41534D
+HEADER = struct.Struct("<IIII") # magic, ring size, drive count, reserved
+# Command area | every field has a single writing process
+COMMANDS = struct.Struct("<QQQ") # fault reset requests (reader), fault reset done (owner), owner heartbeat ns (owner)
+COUNTER = struct.Struct("<Q")
+HEAD = struct.Struct("<Q") # records published for the drive
+VERSION = struct.Struct("<Q")
+PAYLOAD = struct.Struct("<QdHHxxxxdd") # seq, timestamp, status, fault, position, velocity
+RECORD_SIZE = VERSION.size + PAYLOAD.size
+
+COMMANDS_OFFSET = HEADER.size
+RESET_REQUESTS_OFFSET = COMMANDS_OFFSET
+RESET_DONE_OFFSET = COMMANDS_OFFSET + COUNTER.size
+HEARTBEAT_OFFSET = COMMANDS_OFFSET + 2 * COUNTER.size
+DRIVES_OFFSET = COMMANDS_OFFSET + COMMANDS.size
+DRIVE_COUNT = 2 # left, right
+
+def segment_name(config, platform):
+    """
+    Shared memory name of the platform | the default platform keeps STATE_SHM_NAME
+    """
+    return config.STATE_SHM_NAME if platform == DEFAULT_PLATFORM else f"{config.STATE_SHM_NAME}_{platform}"
+
+def _segment_size(ring_size):
+    return DRIVES_OFFSET + DRIVE_COUNT * (HEAD.size + ring_size * RECORD_SIZE)
+
+class _DriveStateSegment:
+    def __init__(self, shm, ring_size):
+        self.shm = shm
+        self.buf = shm.buf
+        self.ring_size = ring_size
+
+    def _head_offset(self, drive):
+        return DRIVES_OFFSET + drive * (HEAD.size + self.ring_size * RECORD_SIZE)
+
+    def _record_offset(self, drive, seq):
+        return self._head_offset(drive) + HEAD.size + ((seq - 1) % self.ring_size) * RECORD_SIZE
+
+    def _read_commands(self):
+        return COMMANDS.unpack_from(self.buf, COMMANDS_OFFSET)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+class DriveStateWriter(_DriveStateSegment):
+    """
+    Owner side of the shared drive state. Only the process that owns the
+    Modbus connections publishes snapshots. Each record is guarded with a
+    version counter (seqlock) so readers never need a lock.
+    """
+    def __init__(self, name, ring_size):
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=_segment_size(ring_size))
+        except FileExistsError:
+            # Left behind by a crashed owner
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=_segment_size(ring_size))
+
+        super().__init__(shm, ring_size)
+        self.buf[:_segment_size(ring_size)] = bytes(_segment_size(ring_size))
+        COMMANDS.pack_into(self.buf, COMMANDS_OFFSET, 0, 0, time.monotonic_ns())
+        # Magic last so readers only attach to an initialized segment
+        HEADER.pack_into(self.buf, 0, MAGIC, ring_size, DRIVE_COUNT, 0)
+        self.seqs = [0] * DRIVE_COUNT
+
+    def publish(self, drive, snapshot: DriveSnapshot):
+        seq = self.seqs[drive] + 1
+        offset = self._record_offset(drive, seq)
+        VERSION.pack_into(self.buf, offset, seq * 2 + 1) # odd = write in progress
+        PAYLOAD.pack_into(self.buf, offset + VERSION.size, seq, time.time(),
+                          snapshot.status, snapshot.fault, snapshot.position, snapshot.velocity)
+        VERSION.pack_into(self.buf, offset, seq * 2 + 2)
+        HEAD.pack_into(self.buf, self._head_offset(drive), seq)
+        self.seqs[drive] = seq
+
+    def heartbeat(self):
+        COUNTER.pack_into(self.buf, HEARTBEAT_OFFSET, time.monotonic_ns())
+
+    def fault_reset_requested(self):
+        requests, done, _ = self._read_commands()
+        return requests > done
+
+    def fault_reset_done(self):
+        requests, _, _ = self._read_commands()
+        COUNTER.pack_into(self.buf, RESET_DONE_OFFSET, requests)
+
+    def close(self, unlink=True):
+        super().close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+class DriveStateReader(_DriveStateSegment):
+    """
+    Consumer side of the shared drive state. Reads never block the owner.
+    """
+    def __init__(self, name):
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name != 'nt':
+            # Attaching registers the segment to this process' resource tracker
+            # which would unlink it when we exit. The owner is responsible for that.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+
+        magic, ring_size, drive_count, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or drive_count != DRIVE_COUNT:
+            shm.close()
+            raise ValueError(f"Shared memory {name} is not a drive state segment")
+        super().__init__(shm, ring_size)
+
+    def head(self, drive):
+        return HEAD.unpack_from(self.buf, self._head_offset(drive))[0]
+
+    def _read_record(self, drive, seq):
+        offset = self._record_offset(drive, seq)
+        for _ in range(10):
+            version = VERSION.unpack_from(self.buf, offset)[0]
+            payload = PAYLOAD.unpack_from(self.buf, offset + VERSION.size)
+            if version == VERSION.unpack_from(self.buf, offset)[0] and version == seq * 2 + 2:
+                record_seq, timestamp, status, fault, position, velocity = payload
+                return record_seq, timestamp, DriveSnapshot(status, fault, position, velocity)
+            if version > seq * 2 + 2:
+                return None # overwritten by a newer lap of the ring
+        return None
+
+    def latest(self, drive) -> Optional[tuple]:
+        """
+        Returns (seq, timestamp, DriveSnapshot) of the newest record or None
+        """
+        head = self.head(drive)
+        if head == 0:
+            return None
+        return self._read_record(drive, head)
+
+    def records_since(self, drive, last_seq):
+        """
+        Records published after last_seq, oldest first. At most ring size records.
+        """
+        head = self.head(drive)
+        first = max(last_seq + 1, head - self.ring_size + 1, 1)
+        records = []
+        for seq in range(first, head + 1):
+            record = self._read_record(drive, seq)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def owner_heartbeat_age(self):
+        """
+        Seconds since the owner process last published
+        """
+        _, _, heartbeat = self._read_commands()
+        return (time.monotonic_ns() - heartbeat) / 1e9
+
+    def request_fault_reset(self):
+        # Only fault poller writes the request counter
+        requests = COUNTER.unpack_from(self.buf, RESET_REQUESTS_OFFSET)[0]
+        COUNTER.pack_into(self.buf, RESET_REQUESTS_OFFSET, requests + 1)
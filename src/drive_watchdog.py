@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import Optional, Callable
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+from metrics import REGISTRY
+from modbus_mux import ModbusMultiplexer
+
+# Health states | the circuit is open while a drive is DOWN, requests fail fast
+# with ConnectionException because the connection is closed until the watchdog reconnects
+HEALTHY = "healthy"
+DEGRADED = "degraded" # requests have failed since the last response
+DOWN = "down"
+HEALTH_VALUES = {HEALTHY: 0, DEGRADED: 1, DOWN: 2}
+
+class DriveWatchdog:
+    """
+    Watches one drive connection. Sends a keepalive read when no response has
+    arrived for WATCHDOG_KEEPALIVE_INTERVAL seconds, so a dead link is noticed while
+    the drive is idle too. After WATCHDOG_FAILURE_THRESHOLD failed requests in a row
+    or a lost connection the circuit opens: the connection is closed and the watchdog
+    alone reconnects in the background with exponential backoff.
+    on_change(drive, state) is called on every health state change.
+    """
+    def __init__(self, client: ModbusMultiplexer, config, logger, on_change: Optional[Callable] = None):
+        self.client = client
+        self.config = config
+        self.logger = logger
+        self.on_change = on_change
+        self.state = HEALTHY if client.connected else DOWN
+        self.since = time.monotonic() # time of the last state change
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.healthy = asyncio.Event()
+        if self.state == HEALTHY:
+            self.healthy.set()
+        self._task: Optional[asyncio.Task] = None
+
+        drive = client.drive
+        REGISTRY.gauge("drive_health", "0 healthy, 1 degraded, 2 down", {"drive": drive},
+                       fn=lambda: HEALTH_VALUES[self.state])
+        REGISTRY.counter("drive_reconnects", "Connections restored by the watchdog", {"drive": drive},
+                         fn=lambda: self.reconnects)
+        self.reconnect_seconds = REGISTRY.histogram("drive_reconnect_seconds", "Connection lost to restored",
+                                                     {"drive": drive})
+
+    @property
+    def drive(self):
+        return self.client.drive
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        self.since = time.monotonic()
+        if state == HEALTHY:
+            self.healthy.set()
+        else:
+            self.healthy.clear()
+        log = self.logger.info if state == HEALTHY else self.logger.warning
+        log(f"{self.drive} drive connection {previous} -> {state}")
+        if self.on_change is not None:
+            self.on_change(self.drive, state)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait_healthy(self, timeout):
+        """
+        Returns True if the drive is healthy within timeout seconds
+        """
+        try:
+            await asyncio.wait_for(self.healthy.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _keepalive(self):
+        try:
+            response = await asyncio.wait_for(
+                self.client.read_holding_registers(address=self.config.DRIVER_STATUS_ADDRESS, count=1,
+                                                   slave=self.config.SLAVE_ID),
+                self.config.WATCHDOG_KEEPALIVE_TIMEOUT
+            )
+            return not response.isError()
+        except asyncio.TimeoutError:
+            self.client.consecutive_failures += 1
+            return False
+        except (ConnectionException, ModbusIOException):
+            return False
+
+    async def _reconnect(self):
+        """
+        Reconnects until it succeeds | backoff doubles up to WATCHDOG_RECONNECT_MAX
+        """
+        lost = self.since
+        delay = self.config.CONNECT_BACKOFF_INITIAL
+        attempts = 0
+        while True:
+            attempts += 1
+            self.reconnect_attempts += 1
+            if await self.client.connect() and await self._keepalive():
+                break
+            self.client.close()
+            self.logger.debug(f"{self.drive} reconnect attempt {attempts} failed, next in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.config.WATCHDOG_RECONNECT_MAX)
+
+        self.reconnects += 1
+        self.reconnect_seconds.observe(time.monotonic() - lost)
+        self.logger.info(f"{self.drive} drive reconnected after {attempts} attempts in {time.monotonic() - lost:.2f}s")
+        self._set_state(HEALTHY)
+
+    async def run(self):
+        client = self.client
+        interval = self.config.WATCHDOG_KEEPALIVE_INTERVAL
+        while True:
+            if not client.connected:
+                self._set_state(DOWN)
+                await self._reconnect()
+                continue
+
+            if client.consecutive_failures >= self.config.WATCHDOG_FAILURE_THRESHOLD:
+                self.logger.error(f"{self.drive} drive failed {client.consecutive_failures} requests in a row, reconnecting")
+                client.close() # open the circuit, callers fail fast until reconnected
+                continue
+
+            self._set_state(DEGRADED if client.consecutive_failures else HEALTHY)
+
+            idle = time.monotonic() - client.last_response
+            if idle >= interval:
+                await self._keepalive()
+                continue
+
+            # Wake up early if the connection drops
+            try:
+                await asyncio.wait_for(client.disconnected.wait(), interval - idle)
+            except asyncio.TimeoutError:
+                pass
+
+    def status(self):
+        return {
+            "state": self.state,
+            "seconds_in_state": time.monotonic() - self.since,
+            "consecutive_failures": self.client.consecutive_failures,
+            "reconnects": self.reconnects,
+            "reconnect_attempts": self.reconnect_attempts,
+        }
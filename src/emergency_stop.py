@@ -0,0 +1,235 @@
+import asyncio
+import time
+from typing import Optional
+from metrics import REGISTRY
+from pymodbus.exceptions import ModbusIOException
+from modbus_mux import (MBAP, encode_frame, encode_write_register, encode_read_holding_registers,
+                        decode_response, read_pdu_length, MAX_TID)
+
+STOP_VALUE = 4 # IEG_MOTION stop bit
+STOP_FRAMES = 16 # pre-encoded stop frames per drive, one transaction id each
+
+class StopConnection:
+    """
+    Dedicated Modbus TCP connection to one drive that carries nothing but stop
+    commands and its own keepalive reads, so a stop never waits behind motion traffic,
+    a semaphore or a reconnect of the main connection. The stop frames are encoded
+    once, sending one is a single socket write.
+    """
+    def __init__(self, drive, host, config, logger):
+        self.drive = drive
+        self.host = host
+        self.config = config
+        self.logger = logger
+        stop_pdu = encode_write_register(config.IEG_MOTION, STOP_VALUE)
+        self.stop_frames = [encode_frame(tid, config.SLAVE_ID, stop_pdu) for tid in range(1, STOP_FRAMES + 1)]
+        self._keepalive_pdu = encode_read_holding_registers(config.DRIVER_STATUS_ADDRESS, 1)
+        self._next_frame = 0
+        self._next_keepalive_tid = STOP_FRAMES
+        self._pending: dict[int, asyncio.Future] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.config.SERVER_PORT), self.config.MODBUS_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            self.logger.debug(f"Stop lane connection to {self.drive} failed: {e}")
+            return False
+        self._read_task = asyncio.create_task(self._read_loop())
+        return True
+
+    def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+        self._pending.clear()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(MBAP.size)
+                tid, _, length, _ = MBAP.unpack(header)
+                pdu = await self._reader.readexactly(read_pdu_length(length, self.host))
+                future = self._pending.pop(tid, None)
+                if future is not None and not future.done():
+                    future.set_result(decode_response(pdu))
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, OSError, ModbusIOException) as e:
+            self.logger.error(f"Stop lane connection to {self.drive} lost: {e}")
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result(None)
+            self._pending.clear()
+
+    def send_stop(self) -> Optional[asyncio.Future]:
+        """
+        Writes a pre-encoded stop frame right away.
+        Returns future of the response (None if the connection was lost) or None if not connected
+        """
+        if not self.connected:
+            return None
+        tid = self._next_frame + 1
+        self._next_frame = (self._next_frame + 1) % STOP_FRAMES
+        future = asyncio.get_running_loop().create_future()
+        previous = self._pending.pop(tid, None)
+        if previous is not None and not previous.done():
+            previous.set_result(None)
+        self._pending[tid] = future
+        self._writer.write(self.stop_frames[tid - 1])
+        return future
+
+    async def _keepalive(self):
+        self._next_keepalive_tid += 1
+        if self._next_keepalive_tid > MAX_TID:
+            self._next_keepalive_tid = STOP_FRAMES + 1
+        tid = self._next_keepalive_tid
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tid] = future
+        self._writer.write(encode_frame(tid, self.config.SLAVE_ID, self._keepalive_pdu))
+        try:
+            response = await asyncio.wait_for(future, self.config.ESTOP_KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            response = None
+        finally:
+            self._pending.pop(tid, None)
+        return response is not None and not response.isError()
+
+    async def run(self):
+        """
+        Keeps the connection up | reconnects with backoff, checks it with a keepalive read
+        """
+        delay = self.config.CONNECT_BACKOFF_INITIAL
+        while True:
+            if not self.connected:
+                if not await self.connect():
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.config.CONNECT_BACKOFF_MAX)
+                    continue
+                delay = self.config.CONNECT_BACKOFF_INITIAL
+                self.logger.info(f"Stop lane connected to {self.drive}")
+
+            await asyncio.sleep(self.config.ESTOP_KEEPALIVE_INTERVAL)
+            if self.connected and not await self._keepalive():
+                self.logger.error(f"Stop lane keepalive to {self.drive} failed, reconnecting")
+                self.close()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def stop_task(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.close()
+
+class EmergencyStopLane:
+    """
+    Top priority stop path. Every drive has its own StopConnection, a stop is
+    written to all of them at once and resent every ESTOP_RESEND_INTERVAL until
+    acknowledged or ESTOP_DEADLINE passes. A drive whose stop connection is down
+    gets the stop through its main connection instead, written past its in-flight limit.
+    Command to wire time is measured for every stop and compared to ESTOP_WIRE_BOUND.
+    """
+    def __init__(self, config, logger, hosts: dict[str, str]):
+        self.config = config
+        self.logger = logger
+        self.connections = {drive: StopConnection(drive, host, config, logger) for drive, host in hosts.items()}
+        self.stop_pdu = encode_write_register(config.IEG_MOTION, STOP_VALUE)
+        self.wire = REGISTRY.histogram("estop_wire_seconds", "Stop command to stop frame written to the socket")
+        self.ack = REGISTRY.histogram("estop_ack_seconds", "Stop command to acknowledged by the drive")
+        self.bound_violations = REGISTRY.counter("estop_bound_violations", "Stops written later than ESTOP_WIRE_BOUND")
+        self.stops = REGISTRY.counter("estop_commands", "Emergency stop commands")
+        self.last_wire_latency: Optional[float] = None
+
+    def start(self):
+        for connection in self.connections.values():
+            connection.start()
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.stop_task()
+
+    def _send(self, connection: StopConnection, fallback=None) -> Optional[asyncio.Future]:
+        """
+        Writes one stop to the drive without yielding to the event loop.
+        Returns future of the response or None if neither connection is up
+        """
+        future = connection.send_stop()
+        if future is None and fallback is not None and fallback.connected:
+            future = fallback.send_now(self.config.SLAVE_ID, self.stop_pdu)
+        return future
+
+    async def _stop_drive(self, connection: StopConnection, commanded, future, fallback=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config.ESTOP_DEADLINE
+        while True:
+            if future is None:
+                await asyncio.sleep(self.config.ESTOP_RESEND_INTERVAL)
+            else:
+                try:
+                    # Shielded so a resend does not drop the acknowledgement of the previous stop
+                    response = await asyncio.wait_for(asyncio.shield(future), self.config.ESTOP_RESEND_INTERVAL)
+                    if response is not None and not response.isError():
+                        self.ack.observe(time.perf_counter() - commanded)
+                        return True
+                    if response is not None:
+                        self.logger.error(f"{connection.drive} drive rejected stop: {response}")
+                except asyncio.TimeoutError:
+                    pass
+                except Exception as e:
+                    self.logger.error(f"Stop through the main connection of {connection.drive} failed: {e}")
+
+            if loop.time() >= deadline:
+                return False
+            future = self._send(connection, fallback)
+
+    async def stop(self, fallbacks: Optional[dict] = None) -> bool:
+        """
+        Stops every drive. fallbacks maps drive -> ModbusMultiplexer used if its stop connection is down.
+        The first stop frames are written before this coroutine yields for the first time.
+        Returns True when every drive acknowledged the stop
+        """
+        commanded = time.perf_counter()
+        fallbacks = fallbacks or {}
+        futures = {drive: self._send(connection, fallbacks.get(drive)) for drive, connection in self.connections.items()}
+        self.last_wire_latency = time.perf_counter() - commanded
+        self.stops.inc()
+        self.wire.observe(self.last_wire_latency)
+        if self.last_wire_latency > self.config.ESTOP_WIRE_BOUND:
+            self.bound_violations.inc()
+            self.logger.critical(f"Stop written {self.last_wire_latency * 1000:.3f} ms after command, "
+                                 f"bound is {self.config.ESTOP_WIRE_BOUND * 1000:.3f} ms")
+
+        tasks = [
+            self._stop_drive(connection, commanded, futures[drive], fallbacks.get(drive))
+            for drive, connection in self.connections.items()
+        ]
+        results = await asyncio.gather(*tasks)
+        if all(results):
+            self.logger.info("Emergency stop acknowledged by every drive")
+        else:
+            failed = [drive for drive, ok in zip(self.connections, results) if not ok]
+            self.logger.critical(f"Emergency stop not acknowledged by {failed} within {self.config.ESTOP_DEADLINE}s")
+        return all(results)
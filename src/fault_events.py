@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Optional
+from metrics import REGISTRY
+from drive_pool import DEFAULT_PLATFORM
+
+# Fault events from the fault poller to the server, one JSON object per line:
+# {"event": "fault", "platform": "default", "drive": "left", "fault": 3, "critical": false, "timestamp": ...}
+# {"event": "recovered", "platform": "default", "drive": "left", "timestamp": ...}
+# timestamp is the time.time() of the drive state snapshot the event is based on.
+FAULT = "fault"
+RECOVERED = "recovered"
+
+def use_unix_socket():
+    # Windows has no AF_UNIX support in asyncio, localhost TCP is used there
+    return hasattr(socket, "AF_UNIX") and os.name != "nt"
+
+class FaultEventServer:
+    """
+    Receives fault events in the server. on_event(event) is called for every event.
+    """
+    def __init__(self, config, logger, on_event):
+        self.config = config
+        self.logger = logger
+        self.on_event = on_event
+        self.reaction = REGISTRY.histogram("fault_event_delay_seconds", "Drive state snapshot to fault event handled")
+        self.events = {
+            kind: REGISTRY.counter("fault_events", "Fault events received from the fault poller", {"event": kind})
+            for kind in (FAULT, RECOVERED)
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if use_unix_socket():
+            path = self.config.FAULT_EVENT_SOCKET
+            if os.path.exists(path):
+                os.unlink(path) # left over from a previous run
+            self._server = await asyncio.start_unix_server(self._handle_connection, path=path)
+            self.logger.info(f"Listening for fault events on {path}")
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, "127.0.0.1", self.config.FAULT_EVENT_PORT)
+            self.logger.info(f"Listening for fault events on 127.0.0.1:{self.config.FAULT_EVENT_PORT}")
+
+    async def _handle_connection(self, reader, writer):
+        self.logger.info("Fault poller connected to fault events")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    self.logger.error(f"Invalid fault event: {line!r}")
+                    continue
+
+                self.on_event(event)
+                if event.get("event") in self.events:
+                    self.events[event["event"]].inc()
+                if "timestamp" in event:
+                    self.reaction.observe(max(0.0, time.time() - event["timestamp"]))
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            self.logger.error(f"Fault event connection lost: {e}")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            writer.close()
+            self.logger.warning("Fault poller disconnected from fault events")
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if use_unix_socket() and os.path.exists(self.config.FAULT_EVENT_SOCKET):
+                os.unlink(self.config.FAULT_EVENT_SOCKET)
+
+class FaultEventClient:
+    """
+    Sends fault events from the fault poller. Never blocks the polling loop,
+    if the server is not reachable the event is dropped and the current
+    state of every drive is sent again once the connection is back.
+    """
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.state = {} # (platform, drive) -> last event, resent after reconnect
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting: Optional[asyncio.Task] = None
+        self._last_attempt = None
+        self.retry_interval = 1.0
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _connect(self):
+        try:
+            if use_unix_socket():
+                _, writer = await asyncio.open_unix_connection(self.config.FAULT_EVENT_SOCKET)
+            else:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.config.FAULT_EVENT_PORT)
+        except OSError as e:
+            self.logger.debug(f"Fault event server not available: {e}")
+            return
+
+        self._writer = writer
+        for event in self.state.values():
+            self._write(event)
+
+    def _write(self, event):
+        try:
+            self._writer.write(json.dumps(event).encode() + b"\n")
+        except (OSError, AttributeError) as e:
+            self.logger.error(f"Failed to send fault event: {e}")
+            self._writer = None
+
+    def ensure_connected(self):
+        """
+        Starts a background connection attempt if not connected
+        """
+        if self.connected or (self._connecting is not None and not self._connecting.done()):
+            return
+        now = time.monotonic()
+        if self._last_attempt is None or now - self._last_attempt >= self.retry_interval:
+            self._last_attempt = now
+            self._connecting = asyncio.create_task(self._connect())
+
+    def send(self, event_type, drive, timestamp, platform=DEFAULT_PLATFORM, **fields):
+        event = {"event": event_type, "platform": platform, "drive": drive, "timestamp": timestamp, **fields}
+        self.state[(platform, drive)] = event
+        if self.connected:
+            self._write(event)
+        else:
+            self.ensure_connected()
+
+    def close(self):
+        if self._connecting is not None:
+            self._connecting.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -1,41 +1,156 @@
-from pymodbus.client import ModbusTcpClient
-import pymodbus.pdu.register_message as pdu_reg
 import atexit
-from time import sleep
-from config import Config
 from setup_logging import setup_logging
-from ModbusClients import ModbusClients
 from launch_params import handle_launch_params
+from drive_state import DriveStateReader, segment_name
+from drive_pool import platform_hosts
+from fault_events import FaultEventClient, FAULT, RECOVERED
 import asyncio
+import sys
+
+DRIVES = ("left", "right")
+CRITICAL_FAULTS = (1, 7, 8)
+
+async def attach_drive_state(config, logger, platform):
+    """
+    Waits until the server has created the shared drive state of the platform
+    """
+    name = segment_name(config, platform)
+    while True:
+        try:
+            return DriveStateReader(name)
+        except (FileNotFoundError, ValueError):
+            logger.debug(f"Drive state {name} not available yet")
+            await asyncio.sleep(0.5)
+
+async def wait_for_activation(drive_states, last_seqs, config, logger):
+    """
+    Warm standby | already attached to the drive state and connected to the server
+    but takes no action until the supervisor writes a line to stdin.
+    Keeps last_seqs at the newest records so after takeover only the snapshots
+    published since the previous poller died are checked.
+    Returns False if stdin closes, i.e. the supervisor is gone
+    """
+    logger.info("Fault poller started as standby")
+    activation = asyncio.create_task(asyncio.to_thread(sys.stdin.readline))
+    while not activation.done():
+        for platform, drive_state in drive_states.items():
+            for drive in (0, 1):
+                last_seqs[platform][drive] = drive_state.head(drive)
+        await asyncio.wait({activation}, timeout=config.POLLING_TIME_INTERVAL)
+
+    if not activation.result():
+        return False
+    logger.info("Standby fault poller activated")
+    return True
+
+def next_interval(config, interval, active):
+    """
+    Polls every FAULT_POLL_FAST seconds while the platform moves or a fault was seen
+    recently, otherwise backs off up to POLLING_TIME_INTERVAL
+    """
+    if active:
+        return config.FAULT_POLL_FAST
+    return min(interval * 2, config.POLLING_TIME_INTERVAL)
+
+def close_drive_states(drive_states):
+    for drive_state in drive_states.values():
+        drive_state.close()
 
 async def main():
-    logger = setup_logging("faul_poller", "faul_poller.log")
     config = handle_launch_params()
-    clients = ModbusClients(config=config, logger=logger)
-    atexit.register(clients.cleanup)
+    logger = setup_logging("faul_poller", "faul_poller.log", config)
+    # One shared drive state segment per platform, all polled in the same loop
+    drive_states = {}
+    for platform in platform_hosts(config):
+        drive_states[platform] = await attach_drive_state(config, logger, platform)
+    atexit.register(close_drive_states, drive_states)
+    events = FaultEventClient(config, logger)
+    events.ensure_connected()
+    last_seqs = {platform: [0, 0] for platform in drive_states}
+
+    if config.STANDBY and not await wait_for_activation(drive_states, last_seqs, config, logger):
+        events.close()
+        close_drive_states(drive_states)
+        return
+
+    logger.info(f"Starting polling loop for platforms {list(drive_states)} with polling time interval: "
+                f"{config.FAULT_POLL_FAST}-{config.POLLING_TIME_INTERVAL}")
+    loop = asyncio.get_running_loop()
+    faulted = {platform: [None, None] for platform in drive_states} # fault code of drives currently in fault state
+    last_reset_request = {platform: None for platform in drive_states}
+    last_fault_time = None
+    stale = set() # platforms whose drive state the server has stopped publishing
+    interval = config.FAULT_POLL_FAST
 
-    await clients.connect()
-    logger.info(f"Starting polling loop with polling time interval: {config.POLLING_TIME_INTERVAL}")
+    # A previous poller may have left the server gated on a drive that has recovered since,
+    # start by telling the server the current state of every drive
+    for platform, drive_state in drive_states.items():
+        for drive in (0, 1):
+            latest = drive_state.latest(drive)
+            if latest is not None and not latest[2].is_faulted:
+                events.send(RECOVERED, DRIVES[drive], latest[1], platform=platform)
 
     try:
         while(True):
-            await asyncio.sleep(config.POLLING_TIME_INTERVAL)
-            
-            clients.check_and_reset_tids()
-
-            if (await clients.check_fault_stauts()):
-                left_response, right_response = clients.get_recent_fault()
-                print("Fault Poller fault status left: " + str(left_response))
-                # print("Fault Poller fault status right" + str(right_response))
-                # Check that its not a critical fault
-                if (left_response not in [1, 7, 8] and right_response not in [1, 7, 8]):
-                    await clients.fault_reset()
+            await asyncio.sleep(interval)
+            now = loop.time()
+            moving = False
+
+            for platform, drive_state in drive_states.items():
+                if drive_state.owner_heartbeat_age() > config.STATE_HEARTBEAT_TIMEOUT:
+                    if platform not in stale:
+                        logger.warning(f"Server has stopped publishing drive state of platform {platform}")
+                    stale.add(platform)
+                else:
+                    stale.discard(platform)
+
+                # Every snapshot published since the last poll so short faults are not missed
+                platform_faulted = faulted[platform]
+                for drive in (0, 1):
+                    records = drive_state.records_since(drive, last_seqs[platform][drive])
+                    if not records:
+                        continue
+                    last_seqs[platform][drive] = records[-1][0]
+
+                    for _, timestamp, snapshot in records:
+                        if abs(snapshot.velocity) > config.MOTION_VELOCITY_THRESHOLD:
+                            moving = True
+                        if snapshot.is_faulted and platform_faulted[drive] is None:
+                            platform_faulted[drive] = snapshot.fault
+                            last_fault_time = now
+                            last_reset_request[platform] = None
+                            logger.error(f"Fault on {platform} {DRIVES[drive]} drive: {snapshot.fault}")
+                            events.send(FAULT, DRIVES[drive], timestamp, platform=platform, fault=snapshot.fault,
+                                        critical=snapshot.fault in CRITICAL_FAULTS)
+
+                    _, timestamp, snapshot = records[-1]
+                    if platform_faulted[drive] is not None and not snapshot.is_faulted:
+                        logger.info(f"{platform} {DRIVES[drive]} drive recovered from fault {platform_faulted[drive]}")
+                        platform_faulted[drive] = None
+                        events.send(RECOVERED, DRIVES[drive], timestamp, platform=platform)
+
+                left_fault, right_fault = platform_faulted
+                if left_fault is not None or right_fault is not None:
+                    last_fault_time = now
+                    # Check that its not a critical fault, retry the reset if the fault stays
+                    if (left_fault not in CRITICAL_FAULTS and right_fault not in CRITICAL_FAULTS) and \
+                    (last_reset_request[platform] is None or
+                     now - last_reset_request[platform] > config.FAULT_RESET_RETRY_INTERVAL):
+                        drive_state.request_fault_reset()
+                        last_reset_request[platform] = now
+
+            if not events.connected:
+                events.ensure_connected()
+
+            recent_fault = last_fault_time is not None and now - last_fault_time < config.FAULT_RECENT_WINDOW
+            interval = next_interval(config, interval, moving or recent_fault)
     except KeyboardInterrupt:
         logger.info("Polling stopped by user")
     except Exception as e:
         logger.error(f"Unexpected error in polling loop: {str(e)}")
     finally:
-        clients.cleanup()
+        events.close()
+        close_drive_states(drive_states)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
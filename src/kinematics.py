@@ -0,0 +1,158 @@
+import math
+import numpy as np
+from register_codecs import encode_upos16, encode_upos16_batch, decode_upos16
+
+class GeometryNotConfigured(Exception):
+    """
+    Pose to stroke conversion asked for before ACTUATOR_X_MM and ACTUATOR_Y_MM are set
+    """
+    def __init__(self):
+        super().__init__("Platform geometry is not configured, set ACTUATOR_X_MM and ACTUATOR_Y_MM "
+                         "(--actuator_x_mm, --actuator_y_mm) to the measured values")
+
+class PlatformKinematics:
+    """
+    Inverse kinematics for the two actuator platform.
+    Maps (pitch, roll[, heave]) to actuator strokes and MODBUS_ANALOG_POSITION values.
+
+    Platform pivots around its center. Actuator attachment points are
+    ACTUATOR_X_MM forward of the pivot and ACTUATOR_Y_MM to the left (+) and right (-).
+    Positive pitch lowers the front, positive roll raises the left side. Angles in degrees.
+
+    Stroke offsets are precomputed into a (pitch, roll) table at init so a
+    lookup is bilinear interpolation instead of trig calls.
+
+    Without the measured geometry only the stroke <-> position conversions work,
+    pose conversions raise GeometryNotConfigured.
+    """
+    def __init__(self, config, table_step_deg=0.25):
+        self.stroke_min = config.STROKE_MIN_MM
+        self.stroke_max = config.STROKE_MAX_MM
+        self.stroke_neutral = config.STROKE_NEUTRAL_MM
+        self.x = config.ACTUATOR_X_MM
+        self.y = config.ACTUATOR_Y_MM
+        self.pitch_limit = config.PITCH_LIMIT_DEG
+        self.roll_limit = config.ROLL_LIMIT_DEG
+        self.step = table_step_deg
+        self.configured = self.x is not None and self.y is not None
+        if not self.configured:
+            return
+
+        self.pitch_count = int(round(2 * self.pitch_limit / self.step)) + 1
+        self.roll_count = int(round(2 * self.roll_limit / self.step)) + 1
+        pitch = np.linspace(-self.pitch_limit, self.pitch_limit, self.pitch_count)
+        roll = np.linspace(-self.roll_limit, self.roll_limit, self.roll_count)
+        pitch_grid, roll_grid = np.meshgrid(pitch, roll, indexing="ij")
+
+        # Vertical offset (mm) of each attachment point | rows = pitch, cols = roll
+        self.table_left = self._exact_offsets(pitch_grid, roll_grid, self.y)
+        self.table_right = self._exact_offsets(pitch_grid, roll_grid, -self.y)
+        # Plain lists for the scalar path, indexing numpy arrays one value at a time is slow
+        self._rows_left = self.table_left.tolist()
+        self._rows_right = self.table_right.tolist()
+
+    def _exact_offsets(self, pitch_deg, roll_deg, y):
+        # z component of Ry(pitch) * Rx(roll) * (x, y, 0)
+        pitch = np.radians(pitch_deg)
+        roll = np.radians(roll_deg)
+        return -self.x * np.sin(pitch) + y * np.sin(roll) * np.cos(pitch)
+
+    def _check_configured(self):
+        if not self.configured:
+            raise GeometryNotConfigured()
+
+    def exact_strokes(self, pitch, roll, heave=0.0):
+        """
+        Strokes (mm) computed directly with trig. Used to verify the table
+        """
+        self._check_configured()
+        pitch = math.radians(pitch)
+        roll = math.radians(roll)
+        common = -self.x * math.sin(pitch)
+        lateral = self.y * math.sin(roll) * math.cos(pitch)
+        base = self.stroke_neutral + heave
+        return self._clamp(base + common + lateral), self._clamp(base + common - lateral)
+
+    def _clamp(self, stroke):
+        return max(self.stroke_min, min(stroke, self.stroke_max))
+
+    def strokes(self, pitch, roll, heave=0.0):
+        """
+        Returns tuple of (left, right) strokes in mm clamped to the stroke limits
+        """
+        self._check_configured()
+        # Fractional table indices, angles outside the table are clamped to its edge
+        pi = (max(-self.pitch_limit, min(pitch, self.pitch_limit)) + self.pitch_limit) / self.step
+        ri = (max(-self.roll_limit, min(roll, self.roll_limit)) + self.roll_limit) / self.step
+        p0 = min(int(pi), self.pitch_count - 2)
+        r0 = min(int(ri), self.roll_count - 2)
+        fp = pi - p0
+        fr = ri - r0
+
+        base = self.stroke_neutral + heave
+        results = []
+        for rows in (self._rows_left, self._rows_right):
+            row0 = rows[p0]
+            row1 = rows[p0 + 1]
+            top = row0[r0] + (row0[r0 + 1] - row0[r0]) * fr
+            bottom = row1[r0] + (row1[r0 + 1] - row1[r0]) * fr
+            results.append(self._clamp(base + top + (bottom - top) * fp))
+
+        return results[0], results[1]
+
+    def stroke_to_position(self, stroke):
+        """
+        Stroke in mm to MODBUS_ANALOG_POSITION value 0-65535
+        """
+        return encode_upos16((stroke - self.stroke_min) / (self.stroke_max - self.stroke_min))
+
+    def position_to_stroke(self, position):
+        """
+        MODBUS_ANALOG_POSITION value 0-65535 to stroke in mm
+        """
+        return self.stroke_min + decode_upos16(position) * (self.stroke_max - self.stroke_min)
+
+    def positions(self, pitch, roll, heave=0.0):
+        """
+        Returns tuple of (left, right) MODBUS_ANALOG_POSITION values
+        """
+        left, right = self.strokes(pitch, roll, heave)
+        return self.stroke_to_position(left), self.stroke_to_position(right)
+
+    def strokes_batch(self, pitch, roll, heave=None, clip=True):
+        """
+        Vectorized strokes for a whole trajectory.
+        Returns array of shape (n, 2) | columns left, right in mm.
+        With clip=False strokes outside the stroke limits are returned as is, for validation
+        """
+        self._check_configured()
+        pitch = np.clip(np.asarray(pitch, dtype=np.float64), -self.pitch_limit, self.pitch_limit)
+        roll = np.clip(np.asarray(roll, dtype=np.float64), -self.roll_limit, self.roll_limit)
+        pi = (pitch + self.pitch_limit) / self.step
+        ri = (roll + self.roll_limit) / self.step
+        p0 = np.minimum(pi.astype(np.intp), self.pitch_count - 2)
+        r0 = np.minimum(ri.astype(np.intp), self.roll_count - 2)
+        fp = pi - p0
+        fr = ri - r0
+
+        base = self.stroke_neutral
+        if heave is not None:
+            base = base + np.asarray(heave, dtype=np.float64)
+
+        out = np.empty((pitch.shape[0], 2), dtype=np.float64)
+        for column, table in enumerate((self.table_left, self.table_right)):
+            top = table[p0, r0] + (table[p0, r0 + 1] - table[p0, r0]) * fr
+            bottom = table[p0 + 1, r0] + (table[p0 + 1, r0 + 1] - table[p0 + 1, r0]) * fr
+            out[:, column] = base + top + (bottom - top) * fp
+
+        if not clip:
+            return out
+        return np.clip(out, self.stroke_min, self.stroke_max, out=out)
+
+    def positions_batch(self, pitch, roll, heave=None):
+        """
+        Vectorized MODBUS_ANALOG_POSITION values for a whole trajectory.
+        Returns uint16 array of shape (n, 2) | columns left, right
+        """
+        strokes = self.strokes_batch(pitch, roll, heave)
+        return encode_upos16_batch((strokes - self.stroke_min) / (self.stroke_max - self.stroke_min))
@@ -10,37 +10,49 @@ def handle_launch_params():
     parser.add_argument("--server_left", type=str, help="left side motor ip")
     parser.add_argument("--server_right", type=str, help="right side motor ip")
     parser.add_argument("--slaveid", type=int, help="drivers slave id")
-    parser.add_argument("--polling_time_interval", type=int, help="polling time interval")
-    parser.add_argument("--start_tid", type=int, help="start tid")
-    parser.add_argument("--end_tid", type=int, help="end tid")
-    parser.add_argument("--web_server_port", type=int, help="end tid")
+    parser.add_argument("--polling_time_interval", type=float, help="polling time interval")
+    parser.add_argument("--web_server_port", type=int, help="web server port")
+    parser.add_argument("--pos_update_hz", type=int, help="control loop rate")
+    parser.add_argument("--drive_profile", type=str, help="drive parameter profile name")
+    parser.add_argument("--actuator_x_mm", type=float, help="measured actuator distance forward of the pivot")
+    parser.add_argument("--actuator_y_mm", type=float, help="measured actuator distance sideways of the pivot")
+    parser.add_argument("--platform", type=str, action="append",
+                        help="NAME=LEFT_IP,RIGHT_IP, give once per platform")
+    parser.add_argument("--standby", action="store_true", help="start as a warm standby, activated through stdin")
 
     config = Config()
     config.MODULE_NAME = module_name
 
-    if ("fault_poller.py" in module_name):
-        config.START_TID = 30000
-        config.LAST_TID = 40000
-    elif (module_name == "palvelin.py"):
-        config.START_TID = 1
-        config.LAST_TID = 10000
-
     args = parser.parse_args()
     if (args.port):
         config.SERVER_PORT = args.port
     if (args.server_left):
         config.SERVER_IP_LEFT = args.server_left
     if (args.server_right):
-        config.SERVER_IP_RIGHT = args.server2_right
+        config.SERVER_IP_RIGHT = args.server_right
     if (args.slaveid):
         config.SLAVE_ID = args.slaveid
     if (args.polling_time_interval):
-        config.POLLING_TIME_INTERVAL = args.time_interval
-    if (args.start_tid):
-        config.START_TID = args.start_tid
-    if (args.end_tid):
-        config.LAST_TID = args.end_tid
+        config.POLLING_TIME_INTERVAL = args.polling_time_interval
     if (args.web_server_port):
         config.WEB_SERVER_PORT = args.web_server_port
+    if (args.pos_update_hz):
+        config.POS_UPDATE_HZ = args.pos_update_hz
+    if (args.drive_profile):
+        config.DRIVE_PROFILE = args.drive_profile
+    if (args.actuator_x_mm):
+        config.ACTUATOR_X_MM = args.actuator_x_mm
+    if (args.actuator_y_mm):
+        config.ACTUATOR_Y_MM = args.actuator_y_mm
+    if (args.platform):
+        config.PLATFORMS = {}
+        for platform in args.platform:
+            name, _, hosts = platform.partition("=")
+            left, _, right = hosts.partition(",")
+            if not name or not left or not right:
+                parser.error(f"--platform {platform}: expected NAME=LEFT_IP,RIGHT_IP")
+            config.PLATFORMS[name] = {"left": left, "right": right}
+    if (args.standby):
+        config.STANDBY = True
 
     return config
\ No newline at end of file
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from bisect import bisect_left
+
+# Seconds | from 100 µs up to 1 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class Histogram:
+    """
+    Fixed bucket histogram. observe() is O(log buckets) and does not allocate
+    so it can be called from the control path.
+    """
+    type = "histogram"
+
+    def __init__(self, name, description="", buckets=LATENCY_BUCKETS, labels=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        # last slot is the +Inf bucket
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket containing the q:th (0-1) percentile.
+        Returns None if nothing has been observed
+        """
+        if self.count == 0:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+            "last": self.last,
+        }
+
+    def reset(self):
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def samples(self):
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+            cumulative += bucket_count
+            yield "_bucket", {**self.labels, "le": _format_value(bound)}, cumulative
+        yield "_sum", self.labels, self.sum
+        yield "_count", self.labels, self.count
+
+class Counter:
+    """
+    Monotonic counter. With fn the value is read from fn() at scrape time
+    so existing int counters can be exposed without touching the hot path.
+    """
+    type = "counter"
+
+    def __init__(self, name, description="", labels=None, fn=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.fn = fn
+        self._value = 0
+
+    def inc(self, amount=1):
+        self._value += amount
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+    def samples(self):
+        yield "_total", self.labels, self.value
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name, description="", labels=None, fn=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.fn = fn
+        self._value = 0.0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+    def samples(self):
+        yield "", self.labels, self.value
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class MetricsRegistry:
+    """
+    Process wide collection of metrics rendered in Prometheus text format.
+    Getting a metric that already exists with the same name and labels returns it.
+    """
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = cls(name, labels=labels, **kwargs)
+            self._metrics[key] = metric
+        elif kwargs.get("fn") is not None:
+            # New owner of the metric, e.g. a recreated object
+            metric.fn = kwargs["fn"]
+        return metric
+
+    def histogram(self, name, description="", labels=None, buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, labels, description=description, buckets=buckets)
+
+    def counter(self, name, description="", labels=None, fn=None):
+        return self._get_or_create(Counter, name, labels, description=description, fn=fn)
+
+    def gauge(self, name, description="", labels=None, fn=None):
+        return self._get_or_create(Gauge, name, labels, description=description, fn=fn)
+
+    def render(self):
+        families = {}
+        for metric in self._metrics.values():
+            families.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].description}")
+            lines.append(f"# TYPE {name} {metrics[0].type}")
+            for metric in metrics:
+                for suffix, labels, value in metric.samples():
+                    lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+async def monitor_loop_lag(interval=0.1, registry=REGISTRY):
+    """
+    Measures how late the event loop wakes up from a sleep.
+    Lag means something is blocking the loop.
+    """
+    lag = registry.histogram("event_loop_lag_seconds", "Event loop wake up delay")
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, time.perf_counter() - start - interval))
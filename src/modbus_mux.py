@@ -0,0 +1,269 @@
+import asyncio
+import struct
+import time
+from typing import Optional
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+from metrics import REGISTRY
+
+# Modbus TCP framing | transaction id, protocol id, length, unit id
+MBAP = struct.Struct(">HHHB")
+READ_HOLDING_REGISTERS = 3
+WRITE_SINGLE_REGISTER = 6
+WRITE_MULTIPLE_REGISTERS = 16
+MAX_TID = 0xFFFF
+MIN_LENGTH = 2 # MBAP length covers the unit id and at least a function code
+OPERATION_NAMES = {
+    READ_HOLDING_REGISTERS: "read",
+    WRITE_SINGLE_REGISTER: "write",
+    WRITE_MULTIPLE_REGISTERS: "write_multiple",
+}
+
+def read_pdu_length(length, host):
+    """
+    Bytes of PDU that follow an MBAP header. Raises ModbusIOException
+    if the length is malformed, the stream can not be resynchronized after it
+    """
+    if length < MIN_LENGTH:
+        raise ModbusIOException(f"Malformed frame from {host}: MBAP length {length}")
+    return length - 1
+
+def encode_frame(tid, slave, pdu):
+    # length counts unit id + pdu
+    return MBAP.pack(tid, 0, len(pdu) + 1, slave) + pdu
+
+def encode_read_holding_registers(address, count):
+    return struct.pack(">BHH", READ_HOLDING_REGISTERS, address, count)
+
+def encode_write_register(address, value):
+    return struct.pack(">BHH", WRITE_SINGLE_REGISTER, address, value)
+
+def encode_write_registers(address, values):
+    count = len(values)
+    return struct.pack(f">BHHB{count}H", WRITE_MULTIPLE_REGISTERS, address, count, count * 2, *values)
+
+class ModbusResponse:
+    """
+    Decoded response. Has the same isError() and registers interface
+    as pymodbus responses so callers don't need to care which one they got.
+    """
+    __slots__ = ("function_code", "registers", "exception_code")
+
+    def __init__(self, function_code, registers=None, exception_code=None):
+        self.function_code = function_code
+        self.registers = registers if registers is not None else []
+        self.exception_code = exception_code
+
+    def isError(self):
+        return self.exception_code is not None
+
+    def __repr__(self):
+        if self.isError():
+            return f"ModbusResponse(fc={self.function_code}, exception={self.exception_code})"
+        return f"ModbusResponse(fc={self.function_code}, registers={self.registers})"
+
+def decode_response(pdu) -> ModbusResponse:
+    function_code = pdu[0]
+    if function_code & 0x80:
+        return ModbusResponse(function_code & 0x7F, exception_code=pdu[1])
+    if function_code == READ_HOLDING_REGISTERS:
+        byte_count = pdu[1]
+        return ModbusResponse(function_code, list(struct.unpack_from(f">{byte_count // 2}H", pdu, 2)))
+    return ModbusResponse(function_code)
+
+class ModbusMultiplexer:
+    """
+    One Modbus TCP connection to a drive shared by any number of coroutines.
+    Assigns transaction ids itself, sends requests back to back without waiting
+    for the previous response (pipelining) and matches responses by transaction id.
+    Every request has its own timeout.
+    Request latency is recorded per operation and register, labeled with drive.
+    """
+    def __init__(self, host, port, timeout=1.0, max_in_flight=8, logger=None, drive=None, register_names=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.logger = logger
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_tid = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        # Connection health | read by DriveWatchdog
+        self.last_response = 0.0 # time.monotonic() of the last response
+        self.consecutive_failures = 0 # timeouts and connection errors since the last response
+        self.disconnected = asyncio.Event()
+
+        self.drive = drive or host
+        self.register_names = register_names or {}
+        self._latency = {}
+        self.requests = REGISTRY.counter("modbus_requests", "Modbus requests sent", {"drive": self.drive})
+        self.tid_wraps = REGISTRY.counter("modbus_tid_wraps", "Transaction id wrap arounds", {"drive": self.drive})
+        self.errors = {
+            kind: REGISTRY.counter("modbus_errors", "Failed Modbus requests", {"drive": self.drive, "kind": kind})
+            for kind in ("timeout", "exception_response", "connection")
+        }
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        """
+        Returns True if connected, False if connection fails
+        """
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            if self.logger:
+                self.logger.debug(f"Connection to {self.host}:{self.port} failed: {e}")
+            return False
+
+        self.last_response = time.monotonic()
+        self.consecutive_failures = 0
+        self.disconnected.clear()
+        self._read_task = asyncio.create_task(self._read_loop())
+        return True
+
+    def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.disconnected.set()
+        self._fail_pending(ConnectionException(f"Connection to {self.host} closed"))
+
+    def _fail_pending(self, exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exception)
+        self._pending.clear()
+
+    def _allocate_tid(self):
+        for _ in range(MAX_TID):
+            self._next_tid += 1
+            if self._next_tid > MAX_TID:
+                self._next_tid = 1
+                self.tid_wraps.inc()
+            if self._next_tid not in self._pending:
+                return self._next_tid
+        raise ModbusIOException("No free transaction ids")
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(MBAP.size)
+                tid, _, length, _ = MBAP.unpack(header)
+                pdu = await self._reader.readexactly(read_pdu_length(length, self.host))
+                future = self._pending.pop(tid, None)
+                if future is None or future.done():
+                    # Response to a request that already timed out
+                    continue
+                future.set_result(decode_response(pdu))
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, OSError, ModbusIOException) as e:
+            if self.logger:
+                self.logger.error(f"Connection to {self.host} lost: {e}")
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self.disconnected.set()
+            self._fail_pending(ConnectionException(f"Connection to {self.host} lost"))
+
+    def _latency_histogram(self, pdu):
+        key = pdu[:3]
+        histogram = self._latency.get(key)
+        if histogram is None:
+            address = int.from_bytes(pdu[1:3], "big")
+            histogram = REGISTRY.histogram("modbus_request_seconds", "Modbus request round trip time", {
+                "drive": self.drive,
+                "operation": OPERATION_NAMES.get(pdu[0], str(pdu[0])),
+                "register": self.register_names.get(address, str(address)),
+            })
+            self._latency[key] = histogram
+        return histogram
+
+    async def execute(self, slave, pdu) -> ModbusResponse:
+        if not self.connected:
+            self.errors["connection"].inc()
+            raise ConnectionException(f"Not connected to {self.host}")
+
+        async with self._in_flight:
+            if not self.connected:
+                self.errors["connection"].inc()
+                raise ConnectionException(f"Connection to {self.host} lost")
+            tid = self._allocate_tid()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tid] = future
+            self.requests.inc()
+            start = time.perf_counter()
+            self._writer.write(encode_frame(tid, slave, pdu))
+            try:
+                response = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.errors["timeout"].inc()
+                self.consecutive_failures += 1
+                raise ModbusIOException(f"Request {tid} to {self.host} timed out after {self.timeout}s")
+            except ConnectionException:
+                self.errors["connection"].inc()
+                self.consecutive_failures += 1
+                raise
+            finally:
+                self._pending.pop(tid, None)
+
+            self.last_response = time.monotonic()
+            self.consecutive_failures = 0
+            self._latency_histogram(pdu).observe(time.perf_counter() - start)
+            if response.isError():
+                self.errors["exception_response"].inc()
+            return response
+
+    def send_now(self, slave, pdu) -> asyncio.Future:
+        """
+        Writes the request to the socket right away, past the in-flight limit.
+        For stop commands that must not wait behind other requests.
+        Returns future of the response. It fails with ModbusIOException after the
+        request timeout, callers that resend earlier may drop it
+        """
+        if not self.connected:
+            self.errors["connection"].inc()
+            raise ConnectionException(f"Not connected to {self.host}")
+        tid = self._allocate_tid()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[tid] = future
+        self.requests.inc()
+        self._writer.write(encode_frame(tid, slave, pdu))
+
+        def expire():
+            if not future.done():
+                self.errors["timeout"].inc()
+                self.consecutive_failures += 1
+                future.set_exception(ModbusIOException(f"Request {tid} to {self.host} timed out after {self.timeout}s"))
+
+        def done(future):
+            timer.cancel()
+            # The tid may already serve a newer request if the response popped it
+            if self._pending.get(tid) is future:
+                del self._pending[tid]
+            if not future.cancelled():
+                future.exception() # a dropped future does not log an unretrieved exception
+
+        timer = loop.call_later(self.timeout, expire)
+        future.add_done_callback(done)
+        return future
+
+    async def read_holding_registers(self, address, count=1, slave=1):
+        return await self.execute(slave, encode_read_holding_registers(address, count))
+
+    async def write_register(self, address, value, slave=1):
+        return await self.execute(slave, encode_write_register(address, value))
+
+    async def write_registers(self, address, values, slave=1):
+        return await self.execute(slave, encode_write_registers(address, values))
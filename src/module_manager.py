@@ -1,29 +1,88 @@
+import asyncio
 import subprocess
 import os
 import sys
 import signal
 import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Callable
 import psutil
+from metrics import REGISTRY
+
+@dataclass
+class ModuleStats:
+    module: str
+    pid: Optional[int] = None
+    starts: int = 0
+    restarts: int = 0
+    launch_time: Optional[float] = None # time.monotonic() of the current run
+    total_uptime: float = 0.0 # seconds over finished runs
+    last_exit_code: Optional[int] = None
+    exit_codes: deque = field(default_factory=lambda: deque(maxlen=10))
+    gave_up: bool = False
+    standby_pid: Optional[int] = None
+    takeovers: int = 0 # restarts served by promoting the standby
+
+    @property
+    def running(self):
+        return self.launch_time is not None
+
+    def uptime(self):
+        """
+        Seconds the current run has been up, 0 if not running
+        """
+        return time.monotonic() - self.launch_time if self.running else 0.0
+
+    def to_dict(self):
+        return {
+            "pid": self.pid,
+            "running": self.running,
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "uptime": self.uptime(),
+            "total_uptime": self.total_uptime + self.uptime(),
+            "last_exit_code": self.last_exit_code,
+            "exit_codes": list(self.exit_codes),
+            "gave_up": self.gave_up,
+            "standby_pid": self.standby_pid,
+            "takeovers": self.takeovers,
+        }
 
 class ModuleManager:
-    def __init__(self, logger):
+    """
+    Launches the helper modules as asyncio subprocesses and supervises them.
+    A supervised module is awaited directly so its exit is noticed immediately,
+    it is restarted with exponential backoff until it exits more than
+    restart_budget times within restart_window seconds.
+    With standby a second, already started copy of the module waits (--standby)
+    and is activated through its stdin the moment the active one exits.
+    """
+    def __init__(self, logger, restart_backoff_initial=0.1, restart_backoff_max=10.0,
+                 restart_budget=5, restart_window=60.0, module_dir=None):
         self.processes = {}
+        self.module_dir = module_dir or os.path.dirname(os.path.abspath(__file__)) # modules are <module_dir>/<module>.py
+        self.modules: dict[str, ModuleStats] = {}
         self.logger = logger
+        self.restart_backoff_initial = restart_backoff_initial
+        self.restart_backoff_max = restart_backoff_max
+        self.restart_budget = restart_budget
+        self.restart_window = restart_window
+        self._supervisors: dict[str, asyncio.Task] = {}
+        self._standbys: dict[str, asyncio.Task] = {} # module -> task launching its standby process
 
-    def launch_module(self, module_path, args=None):
+    async def launch_module(self, module_path, args=None, stdin=None):
         """Launch a Python module and return PID or none if error"""
         try:
+            file_path = os.path.join(self.module_dir, f"{module_path}.py")
+
+            cmd = [sys.executable, file_path]
             if args:
                 cmd.extend(args)
-                
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            src_dir = os.path.join(base_dir, 'src')
-            file_path = os.path.join(src_dir, f"{module_path}.py")
-
-            cmd =  ['python', file_path]
-            
-            process = subprocess.Popen(
-                cmd,
+
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=stdin,
                 creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
             )
 
@@ -35,58 +94,248 @@ class ModuleManager:
             }
             self.logger.info(f"Launched {module_path} with PID: {process.pid}")
             return pid
-            
+
         except Exception as e:
             self.logger.error(f"Failed to launch process {module_path}: {e}")
             return None
 
+    def supervise(self, module_path, args=None, on_start: Optional[Callable] = None,
+                  on_exit: Optional[Callable] = None, on_give_up: Optional[Callable] = None,
+                  standby=False):
+        """
+        Launches the module and keeps it running. With standby the module must
+        support --standby and start working when a line is written to its stdin.
+        on_start(stats) is called after every launch, on_exit(stats) when the process
+        exits and on_give_up(stats) when the restart budget is used up.
+        Returns ModuleStats of the module
+        """
+        stats = self.modules.setdefault(module_path, ModuleStats(module_path))
+        REGISTRY.gauge("module_up", "1 if the module process is running", {"module": module_path},
+                       fn=lambda: int(stats.running))
+        REGISTRY.gauge("module_uptime_seconds", "Uptime of the current module process", {"module": module_path},
+                       fn=stats.uptime)
+        REGISTRY.counter("module_restarts", "Module process restarts", {"module": module_path},
+                         fn=lambda: stats.restarts)
+        REGISTRY.counter("module_takeovers", "Module restarts served by the standby process", {"module": module_path},
+                         fn=lambda: stats.takeovers)
+
+        if module_path not in self._supervisors or self._supervisors[module_path].done():
+            self._supervisors[module_path] = asyncio.create_task(
+                self._supervise(stats, args, on_start, on_exit, on_give_up, standby)
+            )
+        return stats
+
+    def _start_standby(self, stats: ModuleStats, args):
+        """
+        Launches the next standby process in the background
+        """
+        async def launch():
+            pid = await self.launch_module(stats.module, list(args or []) + ["--standby"], stdin=asyncio.subprocess.PIPE)
+            stats.standby_pid = pid
+            return pid
+        self._standbys[stats.module] = asyncio.create_task(launch())
+
+    def _discard(self, pid):
+        """
+        Terminates a process from inside the event loop without waiting for it
+        """
+        process_info = self.processes.pop(pid, None)
+        if process_info is not None and process_info['process'].returncode is None:
+            try:
+                process_info['process'].terminate()
+            except ProcessLookupError:
+                pass
+
+    def _discard_standby(self, task):
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        self._discard(task.result())
+
+    async def _promote_standby(self, stats: ModuleStats):
+        """
+        Activates the standby process if it is up.
+        Returns its PID or None if there is no usable standby
+        """
+        task = self._standbys.pop(stats.module, None)
+        stats.standby_pid = None
+        if task is None or not task.done() or task.result() is None:
+            # Standby still starting, a fresh launch is not slower than waiting for it
+            if task is not None:
+                task.add_done_callback(self._discard_standby)
+            return None
+
+        pid = task.result()
+        process = self.processes[pid]['process']
+        if process.returncode is not None:
+            self.logger.error(f"Standby {stats.module} (PID: {pid}) had exited with code {process.returncode}")
+            self.processes.pop(pid, None)
+            return None
+
+        try:
+            process.stdin.write(b"activate\n")
+            await process.stdin.drain()
+        except (ConnectionError, OSError) as e:
+            self.logger.error(f"Failed to activate standby {stats.module} (PID: {pid}): {e}")
+            self._discard(pid)
+            return None
+
+        stats.takeovers += 1
+        self.logger.info(f"Standby {stats.module} (PID: {pid}) took over")
+        return pid
+
+    async def _supervise(self, stats: ModuleStats, args, on_start, on_exit, on_give_up, standby):
+        exits = deque() # monotonic times of recent exits
+        backoff = self.restart_backoff_initial
+        pid = None
+        while True:
+            if pid is None:
+                pid = await self.launch_module(stats.module, args)
+            if standby and stats.module not in self._standbys:
+                self._start_standby(stats, args)
+
+            if pid is not None:
+                process = self.processes[pid]['process']
+                stats.pid = pid
+                stats.starts += 1
+                stats.launch_time = time.monotonic()
+                if on_start is not None:
+                    on_start(stats)
+
+                exit_code = await process.wait()
+
+                uptime = stats.uptime()
+                stats.total_uptime += uptime
+                stats.launch_time = None
+                stats.last_exit_code = exit_code
+                stats.exit_codes.append(exit_code)
+                self.processes.pop(pid, None)
+                self.logger.warning(f"{stats.module} (PID: {pid}) exited with code {exit_code} after {uptime:.1f}s")
+                if on_exit is not None:
+                    on_exit(stats)
+
+                # A run that stayed up for the whole window starts the backoff over
+                if uptime >= self.restart_window:
+                    backoff = self.restart_backoff_initial
+
+            now = time.monotonic()
+            exits.append(now)
+            while exits and now - exits[0] > self.restart_window:
+                exits.popleft()
+            if len(exits) > self.restart_budget:
+                stats.gave_up = True
+                self.logger.critical(f"{stats.module} exited {len(exits)} times within {self.restart_window}s, not restarting")
+                standby_task = self._standbys.pop(stats.module, None)
+                if standby_task is not None:
+                    standby_task.add_done_callback(self._discard_standby)
+                if on_give_up is not None:
+                    on_give_up(stats)
+                return
+
+            stats.restarts += 1
+            pid = await self._promote_standby(stats) if standby else None
+            if pid is None:
+                self.logger.info(f"Restarting {stats.module} in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.restart_backoff_max)
+
+    def stats(self):
+        return {module: stats.to_dict() for module, stats in self.modules.items()}
+
     def cleanup_module(self, pid):
         """Cleanup a specific module by PID"""
         if pid not in self.processes:
             self.logger.error(f"No process found with PID: {pid}")
             return False
-            
+
         process_info = self.processes[pid]
         process = process_info['process']
-        
+
         try:
             # Check if the process is still running and is a Python process
             ps_process = psutil.Process(pid)
             process_name = ps_process.name().lower()
 
-            print(f"process_name {process_name}")
-
             if 'python' not in process_name:
                 self.logger.error(f"Process with PID {pid} is not a Python process: {process_name}")
                 del self.processes[pid]
                 return False
 
-            # First try graceful termination
+            # First try graceful termination | through psutil since the event loop
+            # owning the asyncio process may already be closed
             if os.name == 'nt':  # Windows
-                process.send_signal(signal.CTRL_C_EVENT)
+                ps_process.send_signal(signal.CTRL_C_EVENT)
             else:  # Unix-like
-                process.terminate()
-                
-            # Wait for process to exit
-            process.wait(timeout=5)
-            
-        except subprocess.TimeoutExpired:
+                ps_process.terminate()
+
+            # Wait for process to exit | cleanup runs from atexit without an event loop
+            ps_process.wait(timeout=5)
+
+        except psutil.TimeoutExpired:
             # Force kill if it doesn't stop
-            process.kill()
+            ps_process.kill()
             self.logger.warning(f"Force killed process {process_info['module']} with PID {process.pid}")
 
+        except psutil.NoSuchProcess:
+            pass
+
         except Exception as e:
             self.logger.error(f"Error during module cleanup: {e}")
             return False
-            
+
         finally:
             # Cleanup regardless of success
-            del self.processes[pid]
-            self.logger.error(f"Cleaned up module with PID {pid}")
-            return True
+            self.processes.pop(pid, None)
+            self.logger.info(f"Cleaned up module with PID {pid}")
+        return True
+
+    async def stop_all(self, timeout=5.0):
+        """
+        Stops the supervisors and terminates the active and standby processes.
+        Runs on the event loop at shutdown so the subprocess transports are
+        closed while the loop that owns them is still running
+        """
+        tasks = list(self._supervisors.values()) + list(self._standbys.values())
+        self._supervisors.clear()
+        self._standbys.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        async def stop(pid, process_info):
+            process = process_info['process']
+            if process.returncode is None:
+                try:
+                    process.terminate()
+                except ProcessLookupError:
+                    pass
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self.logger.warning(f"Force killed process {process_info['module']} with PID {pid}")
+            self.processes.pop(pid, None)
+            self.logger.info(f"Stopped module {process_info['module']} with PID {pid}")
+
+        await asyncio.gather(*(stop(pid, info) for pid, info in list(self.processes.items())),
+                             return_exceptions=True)
 
     def cleanup_all(self):
-        """Cleanup all running modules"""
+        """
+        Last resort cleanup from atexit, kills whatever stop_all did not stop
+        """
+        # Supervisors must not restart what we are stopping
+        for task in self._supervisors.values():
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass # event loop already closed
+        self._supervisors.clear()
+        for task in self._standbys.values():
+            try:
+                task.cancel()
+            except RuntimeError:
+                pass
+        self._standbys.clear()
         for pid in list(self.processes.keys()):
             self.cleanup_module(pid)
-
@@ -0,0 +1,198 @@
+import math
+from dataclasses import dataclass
+
+GRAVITY = 9.81
+
+@dataclass
+class MotionCue:
+    pitch: float # deg, positive lowers the front
+    roll: float # deg, positive raises the left side
+    heave: float = 0.0 # mm
+    surge_acc: float = 0.0 # m/s^2, forward positive
+    sway_acc: float = 0.0 # m/s^2, left positive
+    heave_acc: float = 0.0 # m/s^2, up positive
+
+class HighPass:
+    """
+    First order high pass filter. O(1) state per sample.
+    """
+    def __init__(self, cutoff_hz, dt):
+        rc = 1.0 / (2 * math.pi * cutoff_hz)
+        self.a = rc / (rc + dt)
+        self.x = 0.0
+        self.y = 0.0
+
+    def step(self, x):
+        self.y = self.a * (self.y + x - self.x)
+        self.x = x
+        return self.y
+
+class LowPass:
+    """
+    First order low pass filter. O(1) state per sample.
+    """
+    def __init__(self, cutoff_hz, dt):
+        rc = 1.0 / (2 * math.pi * cutoff_hz)
+        self.alpha = dt / (rc + dt)
+        self.y = None
+
+    def step(self, x):
+        if self.y is None:
+            self.y = x
+        self.y += self.alpha * (x - self.y)
+        return self.y
+
+class WashoutFilter:
+    """
+    Classical washout. Onset of heave acceleration is reproduced with heave motion that
+    washes back to neutral, sustained surge/sway acceleration is reproduced by tilting
+    the platform (tilt coordination) slowly enough that the tilt itself is not noticed.
+    Tilt commands from the simulator are passed through.
+    Returns (pitch deg, roll deg, heave mm)
+    """
+    def __init__(self, config, dt):
+        self.dt = dt
+        self.heave_scale = config.WASHOUT_HEAVE_SCALE
+        # Heave | 2nd order high pass on acceleration, leaky double integration back to neutral
+        self.heave_acc_hp = [HighPass(config.WASHOUT_HEAVE_CUTOFF_HZ, dt) for _ in range(2)]
+        self.heave_vel_hp = HighPass(config.WASHOUT_HEAVE_CUTOFF_HZ, dt)
+        self.heave_pos_hp = HighPass(config.WASHOUT_HEAVE_CUTOFF_HZ, dt)
+        self.heave_vel = 0.0
+        self.heave_pos = 0.0
+        # Tilt coordination | low frequency part of surge/sway, rate limited
+        self.surge_lp = LowPass(config.TILT_COORDINATION_CUTOFF_HZ, dt)
+        self.sway_lp = LowPass(config.TILT_COORDINATION_CUTOFF_HZ, dt)
+        self.tilt_rate_step = config.TILT_RATE_LIMIT_DEG_S * dt
+        self.tilt_limit = config.TILT_COORDINATION_LIMIT_DEG
+        self.tilt_pitch = 0.0
+        self.tilt_roll = 0.0
+
+    def _rate_limit(self, current, target):
+        return current + max(-self.tilt_rate_step, min(target - current, self.tilt_rate_step))
+
+    def _tilt_angle(self, acceleration):
+        angle = math.degrees(math.asin(max(-1.0, min(acceleration / GRAVITY, 1.0))))
+        return max(-self.tilt_limit, min(angle, self.tilt_limit))
+
+    def step(self, cue: MotionCue):
+        acc = cue.heave_acc
+        for hp in self.heave_acc_hp:
+            acc = hp.step(acc)
+        self.heave_vel = self.heave_vel_hp.step(self.heave_vel + acc * self.dt)
+        self.heave_pos = self.heave_pos_hp.step(self.heave_pos + self.heave_vel * self.dt)
+
+        # Forward acceleration pushes the operator back -> raise the front
+        self.tilt_pitch = self._rate_limit(self.tilt_pitch, -self._tilt_angle(self.surge_lp.step(cue.surge_acc)))
+        # Acceleration to the left pushes the operator right -> lower the right side
+        self.tilt_roll = self._rate_limit(self.tilt_roll, self._tilt_angle(self.sway_lp.step(cue.sway_acc)))
+
+        return (cue.pitch + self.tilt_pitch,
+                cue.roll + self.tilt_roll,
+                cue.heave + self.heave_pos * 1000 * self.heave_scale)
+
+FOLLOW_TOLERANCE = 1.05 # position quantization of recorded commands
+
+class JerkLimiter:
+    """
+    Follows a target position with limited velocity, acceleration and jerk.
+    Braking starts early enough to stop at the target with acc_max, including
+    the time it takes to ramp the braking acceleration up with the jerk limit.
+    """
+    def __init__(self, vel_max, acc_max, jerk_max, dt):
+        self.vel_max = vel_max
+        self.acc_max = acc_max
+        self.jerk_step = jerk_max * dt
+        self.ramp_time = acc_max / jerk_max
+        self.dt = dt
+        self.position = None
+        self.velocity = 0.0
+        self.acceleration = 0.0
+
+    def reset(self, position):
+        self.position = position
+        self.velocity = 0.0
+        self.acceleration = 0.0
+
+    def follows(self, target):
+        """
+        True if target is within one tick at vel_max of the current position
+        """
+        return self.position is not None and abs(target - self.position) <= self.vel_max * self.dt * FOLLOW_TOLERANCE
+
+    def track(self, position):
+        """
+        Takes a position that is already limited as the output, keeping the
+        state continuous for when limiting takes over again
+        """
+        if self.position is None:
+            self.reset(position)
+            return
+        velocity = max(-self.vel_max, min((position - self.position) / self.dt, self.vel_max))
+        self.acceleration = max(-self.acc_max, min((velocity - self.velocity) / self.dt, self.acc_max))
+        self.velocity = velocity
+        self.position = position
+
+    def step(self, target):
+        if self.position is None:
+            self.reset(target)
+            return target
+
+        # Distance left once the braking acceleration has been ramped up
+        error = target - self.position - self.velocity * (self.ramp_time / 2 + self.dt)
+        # Fastest velocity from which we can still stop at the target
+        desired_vel = math.copysign(min(self.vel_max, math.sqrt(2 * self.acc_max * abs(error))), error)
+        desired_acc = (desired_vel - self.velocity) / (self.ramp_time + self.dt)
+        desired_acc = max(-self.acc_max, min(desired_acc, self.acc_max))
+        self.acceleration += max(-self.jerk_step, min(desired_acc - self.acceleration, self.jerk_step))
+
+        self.velocity += self.acceleration * self.dt
+        self.velocity = max(-self.vel_max, min(self.velocity, self.vel_max))
+        self.position += self.velocity * self.dt
+
+        # Settle instead of dithering around the target
+        if abs(target - self.position) < 0.01 and abs(self.velocity) < self.jerk_step and abs(self.acceleration) < self.jerk_step:
+            self.reset(target)
+
+        return self.position
+
+class MotionPipeline:
+    """
+    Runs every control tick between the newest setpoint and the MODBUS_ANALOG_POSITION write.
+    Motion cues go through washout and kinematics, direct position setpoints skip those.
+    Both then go through a per actuator jerk, acceleration and velocity limiter in mm.
+    Smoothed setpoints (replayed recordings) are written as is once the limiter has
+    caught up with them, until one jumps further than the limiter could move in a tick.
+    """
+    def __init__(self, config, kinematics, dt):
+        self.config = config
+        self.kinematics = kinematics
+        self.dt = dt
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the filter and limiter state, the next setpoint is taken as the current position
+        """
+        config = self.config
+        self.washout = WashoutFilter(config, self.dt)
+        self.limiters = [
+            JerkLimiter(config.MOTION_VEL_LIMIT_MM_S, config.MOTION_ACC_LIMIT_MM_S2, config.MOTION_JERK_LIMIT_MM_S3, self.dt)
+            for _ in range(2)
+        ]
+
+    def step(self, setpoint):
+        """
+        Returns tuple of (left, right) MODBUS_ANALOG_POSITION values
+        """
+        if setpoint.cue is not None:
+            strokes = self.kinematics.strokes(*self.washout.step(setpoint.cue))
+        else:
+            strokes = (self.kinematics.position_to_stroke(setpoint.left),
+                       self.kinematics.position_to_stroke(setpoint.right))
+            if setpoint.smoothed and all(limiter.follows(stroke) for limiter, stroke in zip(self.limiters, strokes)):
+                for limiter, stroke in zip(self.limiters, strokes):
+                    limiter.track(stroke)
+                return setpoint.left, setpoint.right
+
+        left, right = (limiter.step(stroke) for limiter, stroke in zip(self.limiters, strokes))
+        return self.kinematics.stroke_to_position(left), self.kinematics.stroke_to_position(right)
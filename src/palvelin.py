@@ -1,7 +1,6 @@
 from flask import Flask
-import psutil
 import asyncio
-from quart import Quart, request, make_response, jsonify
+from quart import Quart, request, make_response, jsonify, websocket, g
 from ModbusClients import ModbusClients
 import atexit
 from setup_logging import setup_logging
@@ -10,118 +9,375 @@ from module_manager import ModuleManager
 import subprocess
 from time import sleep
 from utils import is_nth_bit_on, IEG_MODE_bitmask_enable
+from register_codecs import revs_to_upos16, UPOS16_MAX
 import math
+import time
+from dataclasses import asdict
+from setpoints import Setpoint, parse_setpoint
+from control_loop import ControlLoop
+from drive_state import DriveStateWriter, segment_name
+from drive_pool import DrivePool, DEFAULT_PLATFORM
+from metrics import REGISTRY, monitor_loop_lag
+from kinematics import PlatformKinematics, GeometryNotConfigured
+from motion_cueing import MotionPipeline
+from drive_profiles import get_profile
+from startup import StartupPipeline
+from fault_events import FaultEventServer, FAULT, RECOVERED
+from telemetry_recorder import TelemetryRecorder, new_recording_path, prune_recordings
+from playback import load_trajectory, TrajectoryPlayer
+from trajectory_buffer import TrajectoryBuffer, parse_batch
+from drive_watchdog import HEALTHY, DOWN
+import os
+from typing import Optional
+
+class Platform:
+    """
+    One motion platform of the server. Has the same attributes as app had with a
+    single platform so the per platform functions below take either.
+    """
+    def __init__(self, name, clients: ModbusClients, config, logger):
+        self.name = name
+        self.clients = clients
+        self.app_config = config
+        self.logger = logger
+        self.drive_state = None
+        self.startup = None
+        self.kinematics = None
+        self.recorder = None
+        self.player = None
+        self.buffer = None
+        self.control_loop = None
+        self.publish_task = None
+
+    @property
+    def labels(self):
+        # Metrics of the default platform keep their names without labels
+        return None if self.name == DEFAULT_PLATFORM else {"platform": self.name}
+
+def get_platform(app, args) -> Optional[Platform]:
+    """
+    Platform of the request | ?platform=<name>, default is the first platform
+    """
+    name = args.get('platform')
+    if name is None:
+        return next(iter(app.platforms.values()))
+    return app.platforms.get(name)
+
+async def shutdown(app):
+    app.logger.info("shutdown function executed!")
+    await app.module_manager.stop_all()
+    for platform in app.platforms.values():
+        platform.clients.cleanup()
+        if platform.drive_state is not None:
+            platform.drive_state.close()
+        if platform.recorder is not None:
+            platform.recorder.close()
+    if app.fault_events is not None:
+        app.fault_events.close()
+
+def supervise_fault_poller(app):
+    """
+    System must not run without the fault poller. Setpoint writes are held
+    from the moment it exits until it is running again and if it keeps
+    crashing the motors are stopped. One fault poller watches every platform.
+    """
+    def on_start(stats):
+        app.fault_poller_pid = stats.pid
+        for platform in app.platforms.values():
+            platform.control_loop.ungate("fault_poller")
+
+    def on_exit(stats):
+        for platform in app.platforms.values():
+            platform.control_loop.gate("fault_poller", f"exited with code {stats.last_exit_code}")
+
+    def on_give_up(stats):
+        app.logger.critical("fault_poller keeps crashing, stopping motors")
+        app.stop_task = asyncio.create_task(stop_all(app, "fault_poller keeps crashing"))
+
+    args = []
+    for name, hosts in (app.app_config.PLATFORMS or {}).items():
+        args += ["--platform", f"{name}={hosts['left']},{hosts['right']}"]
+    return app.module_manager.supervise("fault_poller", args=args, on_start=on_start, on_exit=on_exit,
+                                        on_give_up=on_give_up, standby=True)
+
+def halt_platform(platform, reason):
+    """
+    Stops every setpoint source of the platform and holds the control loop
+    so nothing is written after the stop until the platform is enabled again
+    """
+    if platform.player is not None:
+        platform.player.stop()
+    platform.buffer.clear()
+    platform.control_loop.halt(reason)
 
-def cleanup(app):
-    app.logger.info("cleanup function executed!")
-    app.module_manager.cleanup_all()
-    if app.clients is not None:
-        app.clients.cleanup()
+async def stop_all(app, reason="emergency stop"):
+    """
+    Stops every platform at once. Returns True if every drive acknowledged the stop
+    """
+    for platform in app.platforms.values():
+        halt_platform(platform, reason)
+    results = await asyncio.gather(*(platform.clients.stop() for platform in app.platforms.values()))
+    return all(results)
 
-async def monitor_fault_poller(app):
+def handle_fault_event(app, event):
     """
-    Heathbeat monitor that makes sure fault poller
-    stays alive and if it dies it restarts it
+    Fault poller pushes fault and recovery events, setpoint writes are held
+    while any drive of the platform is faulted
     """
-    while True:
-        if hasattr(app, 'fault_poller_pid'):
-            pid = app.fault_poller_pid
-            if pid and not psutil.pid_exists(pid):
-                app.logger.warning(f"fault_poller (PID: {pid}) is not running, restarting...")
-                new_pid = app.module_manager.launch_module("fault_poller")
-                app.fault_poller_pid = new_pid
-                app.logger.info(f"Restarted fault_poller with PID: {new_pid}")
-                del app.module_manager.processes[pid]
-        await asyncio.sleep(10)  # Check every 10 seconds
+    platform = app.platforms.get(event.get("platform", DEFAULT_PLATFORM))
+    if platform is None:
+        app.logger.error(f"Fault event for unknown platform: {event}")
+        return
+    drive = event.get("drive")
+    if event.get("event") == FAULT:
+        platform.control_loop.gate(drive, f"fault {event.get('fault')}" + (" (critical)" if event.get("critical") else ""))
+    elif event.get("event") == RECOVERED:
+        platform.control_loop.ungate(drive)
+
+def handle_drive_health(app, drive, state):
+    """
+    Setpoint writes are held while a drive connection is down, the watchdog reconnects it
+    """
+    if state == DOWN:
+        app.control_loop.gate(f"{drive} connection", "connection down")
+    elif state == HEALTHY:
+        app.control_loop.ungate(f"{drive} connection")
 
-async def get_modbuscntrl_val(clients, config):
-        pfeedback_client_left = await clients.client_left.read_holding_registers(address=config.PFEEDBACK_POSITION, count=2, slave=config.SLAVE_ID)
-        pfeedback_client_right = await clients.client_right.read_holding_registers(address=config.PFEEDBACK_POSITION, count=2, slave=config.SLAVE_ID)
-        
-        UPOS16_MAX = 65535
-        revs_left = convert_to_revs(pfeedback_client_left)
-        revs_right = convert_to_revs(pfeedback_client_right)
+def is_active(app, snapshots):
+    """
+    Platform is moving, faulted or has received setpoints recently
+    """
+    config = app.app_config
+    for snapshot in snapshots:
+        if snapshot is not None and (snapshot.is_faulted or abs(snapshot.velocity) > config.MOTION_VELOCITY_THRESHOLD):
+            return True
+    last_setpoint = app.control_loop.last_setpoint_time
+    return last_setpoint is not None and asyncio.get_running_loop().time() - last_setpoint < config.STATE_ACTIVE_HOLD
+
+async def publish_drive_state(app):
+    """
+    Server owns the drive connections. Publishes drive snapshots to shared memory
+    for the other modules and runs fault resets they request.
+    Publishes at STATE_PUBLISH_HZ while active and STATE_IDLE_PUBLISH_HZ when idle
+    to keep bus load down.
+    """
+    writer = app.drive_state
+    config = app.app_config
+    interval = 1 / config.STATE_PUBLISH_HZ
+    while True:
+        await asyncio.sleep(interval)
+        writer.heartbeat()
+        if not app.clients.connected:
+            continue
 
-        ## Percentile = x - pos_min / (pos_max - pos_min)
-        POS_MIN_REVS = 0.393698024
-        POS_MAX_REVS = 28.937007874015748031496062992126
-        modbus_percentile_left = (revs_left - POS_MIN_REVS) / (POS_MAX_REVS - POS_MIN_REVS)
-        modbus_percentile_right = (revs_right - POS_MIN_REVS) / (POS_MAX_REVS - POS_MIN_REVS)
-        modbus_percentile = max(0, min(modbus_percentile, 1))
+        left_snapshot, right_snapshot = await app.clients.read_snapshot()
+        if left_snapshot is not None and right_snapshot is not None:
+            writer.publish(0, left_snapshot)
+            writer.publish(1, right_snapshot)
 
-        position_client_right = math.floor(modbus_percentile_left * UPOS16_MAX)
-        position_client_left = math.floor(modbus_percentile_right * UPOS16_MAX)
+        active = is_active(app, (left_snapshot, right_snapshot))
+        interval = 1 / (config.STATE_PUBLISH_HZ if active else config.STATE_IDLE_PUBLISH_HZ)
 
-        return position_client_left, position_client_right
+        if writer.fault_reset_requested():
+            app.logger.info("Fault reset requested by fault poller")
+            if await app.clients.fault_reset():
+                writer.fault_reset_done()
 
+async def get_modbuscntrl_val(clients, config):
+        """
+        Reads position feedback of both drives and scales it to MODBUS_ANALOG_POSITION value.
+        Feedback is one round trip old, the position is predicted to when the next write reaches the drives.
+        Returns tuple of (left, right)
+        """
+        left_snapshot, right_snapshot = await clients.read_snapshot()
+        if left_snapshot is None or right_snapshot is None:
+            raise IOError("Failed to read position feedback")
 
-def convert_to_revs(pfeedback):
-    decimal = pfeedback[0] / 65535
-    num = pfeedback[1]
-    return num + decimal
+        left_estimate, right_estimate = clients.predict_at_write()
+        pos_min_revs, pos_max_revs = get_profile(config.DRIVE_PROFILE).analog_position_limits(config)
 
-async def init(app):
-    try:
-        logger = setup_logging("server", "server.log")
-        module_manager = ModuleManager(logger)
-        config = handle_launch_params()
-        clients = ModbusClients(config=config, logger=logger)
+        position_client_left = revs_to_upos16(left_estimate.position, pos_min_revs, pos_max_revs)
+        position_client_right = revs_to_upos16(right_estimate.position, pos_min_revs, pos_max_revs)
 
-        fault_poller_pid = module_manager.launch_module("fault_poller")
-        app.monitor_task = asyncio.create_task(monitor_fault_poller(app))
+        return position_client_left, position_client_right
 
-        # Connect to both drivers
-        await clients.connect()   
+def current_position(platform):
+    """
+    Position the platform is commanded to, or the measured one before the first write.
+    Returns tuple of (left, right) MODBUS_ANALOG_POSITION values or None if not known
+    """
+    if platform.control_loop.last_positions is not None:
+        return platform.control_loop.last_positions
+    left_snapshot, right_snapshot = platform.clients.last_snapshots
+    if left_snapshot is None or right_snapshot is None:
+        return None
+    pos_min_revs, pos_max_revs = get_profile(platform.app_config.DRIVE_PROFILE).analog_position_limits(platform.app_config)
+    return (revs_to_upos16(left_snapshot.position, pos_min_revs, pos_max_revs),
+            revs_to_upos16(right_snapshot.position, pos_min_revs, pos_max_revs))
+
+async def stream_acks(app, sent):
+    """
+    Acks setpoints of this connection once the control loop has written them
+    """
+    acked = None
+    while True:
+        setpoint = await app.control_loop.wait_written()
+        if setpoint is acked or setpoint is not sent.get("last"):
+            continue
+        acked = setpoint
+        await websocket.send_json({
+            "ack": setpoint.seq,
+            "replaced": app.control_loop.slot.replaced,
+            "latency_ms": (time.perf_counter() - setpoint.received) * 1000
+        })
+
+async def stream_telemetry(app):
+    """
+    Sends drive snapshots to the websocket client every WS_TELEMETRY_INTERVAL seconds.
+    Snapshots are the ones publish_drive_state last read so the bus load does not
+    grow with the number of clients
+    """
+    sent = None
+    while True:
+        await asyncio.sleep(app.app_config.WS_TELEMETRY_INTERVAL)
+        snapshots = app.clients.last_snapshots
+        left_snapshot, right_snapshot = snapshots
+        if left_snapshot is None or right_snapshot is None or snapshots is sent:
+            continue
+        sent = snapshots
+        await websocket.send_json({
+            "telemetry": {"left": asdict(left_snapshot), "right": asdict(right_snapshot)}
+        })
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PLAYBACK_DIRS = ("trajectories", "recordings")
+
+def resolve_playback_file(name):
+    """
+    Trajectory files can only be played from the trajectories and recordings directories.
+    Returns absolute path or None if not found
+    """
+    for directory in PLAYBACK_DIRS:
+        root = os.path.join(BASE_DIR, directory)
+        path = os.path.realpath(os.path.join(root, name))
+        if path.startswith(os.path.realpath(root) + os.sep) and os.path.exists(path):
+            return path
+    return None
 
-        app.app_config = config
-        app.logger = logger
-        
-        app.module_manager = module_manager
-        app.is_process_done = True
-        app.fault_poller_pid = fault_poller_pid
-        app.clients = clients
+def is_playing(app):
+    return app.player is not None and app.player.state in ("playing", "paused")
 
-        atexit.register(lambda: cleanup(app))
-        
-        homed = await clients.home()
-        if homed: ## Prepare motor parameters for operation
-            #MAX POSITION LIMITS FOR BOTH MOTORS | 147 mm
-            await clients.client_right.write_registers(address=config.ANALOG_POSITION_MAXIMUM, values=[61406, 28], slave=config.SLAVE_ID)
-            await clients.client_left.write_registers(address=config.ANALOG_POSITION_MAXIMUM, values=[61406, 28], slave=config.SLAVE_ID)
+def is_streaming(app):
+    return is_playing(app) or (app.buffer is not None and app.buffer.active)
 
-            #MIN POSITION LIMITS FOR BOTH MOTORS || 2 mm
-            await clients.client_right.write_registers(address=config.ANALOG_POSITION_MINIMUM, values=[25801, 0], slave=config.SLAVE_ID)
-            await clients.client_left.write_registers(address=config.ANALOG_POSITION_MINIMUM, values=[25801, 0], slave=config.SLAVE_ID)
+def setpoint_error(app):
+    """
+    Returns the reason setpoints are not accepted right now or None
+    """
+    if app.control_loop.halted:
+        return "Motors stopped, enable them with /enable"
+    if is_streaming(app):
+        return "Trajectory playback in progress"
+    return None
 
-            #Analog max velocity. Max speed for actuator is set to 338mm/sec, for testing we'll set it to 50mm/sec.
-            #REVS = speed/lead. REVS = 50mm/s / 5.08mm/rev = 9,842519685039370078740157480315 REVS 
-            await clients.client_right.write_registers(address=config.ANALOG_VEL_MAXIMUM, values=[55214, 9], slave=config.SLAVE_ID)
-            await clients.client_left.write_registers(address=config.ANALOG_VEL_MAXIMUM, values=[55214, 9], slave=config.SLAVE_ID)
+async def enable_platform(platform):
+    """
+    Puts the drives in analog position mode at their current position and
+    lets the control loop write again, holding that position until new setpoints arrive
+    """
+    clients = platform.clients
+    config = platform.app_config
+    (position_client_left, position_client_right) = await get_modbuscntrl_val(clients, config)
 
-            #Analog max acceleration. This is set to 50 REVS/S/S for testing. | 254 mm/s/s
-            await clients.client_right.write_registers(address=config.ANALOG_ACCELERATION_MAXIMUM, values=[0, 50], slave=config.SLAVE_ID)
-            await clients.client_left.write_registers(address=config.ANALOG_ACCELERATION_MAXIMUM, values=[0, 50], slave=config.SLAVE_ID)
+    await clients.paired_write_register(config.MODBUS_ANALOG_POSITION, position_client_left, position_client_right)
 
-            #Analog input channel set to modbus ctrl
-            await clients.client_right.write_register(address=config.ANALOG_INPUT_CHANNEL,value=2,slave=config.SLAVE_ID)
-            await clients.client_left.write_register(address=config.ANALOG_INPUT_CHANNEL,value=2,slave=config.SLAVE_ID)
+    # Finally - Ready for operation
+    await clients.paired_write_register(config.COMMAND_MODE, 2, 2)
 
-            (position_client_right, position_client_left) = await get_modbuscntrl_val(clients, config)
+    # Enable motors
+    await clients.paired_write_register(config.IEG_MODE, IEG_MODE_bitmask_enable(2), IEG_MODE_bitmask_enable(2))
 
-            await clients.client_right.write_register(address=config.MODBUS_ANALOG_POSITION, value=position_client_right, slave=config.SLAVE_ID)
-            await clients.client_left.write_register(address=config.MODBUS_ANALOG_POSITION, value=position_client_left, slave=config.SLAVE_ID)
+    # The stop bit of an emergency stop stays set until IEG_MOTION is written without it
+    left_response, right_response = await clients.paired_write_register(config.IEG_MOTION, 0, 0)
+    if left_response.isError() or right_response.isError():
+        raise IOError(f"Drives did not release the stop: left {left_response}, right {right_response}")
 
-            # TODO Ipeak pitää varmistaa vielä onhan 128 arvo = 1 Ampeeri 
-            await clients.client_right.write_register(address=config.IPEAK,value=128,slave=config.SLAVE_ID)
-            await clients.client_left.write_register(address=config.IPEAK,value=128,slave=config.SLAVE_ID)
+    platform.control_loop.resume(Setpoint(seq=0, left=position_client_left, right=position_client_right, received=time.perf_counter()))
 
-            # Finally - Ready for operation
-            await clients.client_right.write_register(address=config.COMMAND_MODE, value=2, slave=config.SLAVE_ID)
-            await clients.client_left.write_register(address=config.COMMAND_MODE, value=2, slave=config.SLAVE_ID)
+async def prepare_platform(platform):
+    """
+    Connects, homes and configures both drives of the platform, then starts its control loop
+    """
+    clients = platform.clients
+    ready = await platform.startup.run()
+    if ready: ## Both drives homed and configured, prepare for operation
+        await enable_platform(platform)
+        clients.watch(lambda drive, state: handle_drive_health(platform, drive, state))
+        platform.control_loop.start()
+    return ready
+
+def create_platform(name, pool, config, logger):
+    clients = ModbusClients(config=config, logger=logger, pool=pool, platform=name)
+    # Stop connections come up first so /stop works during homing too
+    clients.estop.start()
+    platform = Platform(name, clients, config, logger)
+    platform.drive_state = DriveStateWriter(segment_name(config, name), config.STATE_RING_SIZE)
+    platform.startup = StartupPipeline(clients, config, logger, get_profile(config.DRIVE_PROFILE))
+    platform.kinematics = PlatformKinematics(config)
+    if not platform.kinematics.configured:
+        logger.warning(f"Platform {name} geometry is not configured, only position setpoints are accepted")
+    if config.RECORDER_ENABLED:
+        recordings_dir = os.path.join(BASE_DIR, 'recordings')
+        suffix = "" if name == DEFAULT_PLATFORM else f"-{name}"
+        # Room for the new recording | every recording preallocates RECORDER_CAPACITY rows
+        prune_recordings(recordings_dir, config.RECORDER_KEEP - 1, suffix, logger)
+        path = new_recording_path(recordings_dir, suffix)
+        platform.recorder = TelemetryRecorder(path, config.RECORDER_CAPACITY, config.RECORDER_BUFFER_SIZE,
+                                              config.RECORDER_FLUSH_INTERVAL, logger, labels=platform.labels)
+    platform.control_loop = ControlLoop(clients, config, logger,
+                                        pipeline=MotionPipeline(config, platform.kinematics, 1 / config.POS_UPDATE_HZ),
+                                        recorder=platform.recorder, labels=platform.labels)
+    platform.buffer = TrajectoryBuffer(config, platform.kinematics, platform.control_loop.slot, logger,
+                                       labels=platform.labels, current=lambda: current_position(platform))
+    return platform
 
-            # Enable motors
-            await clients.client_right.write_register(address=config.IEG_MODE, value=IEG_MODE_bitmask_enable(2), slave=config.SLAVE_ID)
-            await clients.client_left.write_register(address=config.IEG_MODE, value=IEG_MODE_bitmask_enable(2), slave=config.SLAVE_ID)
+async def init(app):
+    try:
+        config = handle_launch_params()
+        logger = setup_logging("server", "server.log", config)
+        module_manager = ModuleManager(
+            logger,
+            restart_backoff_initial=config.MODULE_RESTART_BACKOFF,
+            restart_budget=config.MODULE_RESTART_BUDGET,
+            restart_window=config.MODULE_RESTART_WINDOW
+        )
+        app.app_config = config
+        app.logger = logger
+        
+        app.module_manager = module_manager
+        app.is_process_done = True
+        app.fault_poller_pid = None
+        app.fault_events = None
+        # Every drive of every platform in one pool on this event loop
+        app.pool = DrivePool(config, logger)
+        app.platforms = {name: create_platform(name, app.pool, config, logger) for name in app.pool.platforms}
+
+        app.fault_events = FaultEventServer(config, logger, lambda event: handle_fault_event(app, event))
+        await app.fault_events.start()
+        supervise_fault_poller(app)
+
+        # Only a last resort, shutdown() stops the modules while the event loop runs
+        atexit.register(app.module_manager.cleanup_all)
+        for platform in app.platforms.values():
+            platform.publish_task = asyncio.create_task(publish_drive_state(platform))
+        app.loop_lag_task = asyncio.create_task(monitor_loop_lag())
+
+        # Platforms start up independently, one failing does not hold the others
+        tasks = {name: asyncio.create_task(prepare_platform(platform)) for name, platform in app.platforms.items()}
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for name, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                logger.error(f"Platform {name} initialization failed: {result}")
         
     except Exception as e:
         logger.error(f"Initialization failed: {e}")
@@ -130,36 +386,238 @@ async def create_app():
     app = Quart(__name__)
     await init(app)
 
+    @app.after_serving
+    async def stop_modules():
+        await shutdown(app)
+
+    @app.before_request
+    async def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    async def record_latency(response):
+        route = request.url_rule.rule if request.url_rule is not None else "unknown"
+        REGISTRY.histogram("http_request_seconds", "Quart handler time", {"route": route}).observe(
+            time.perf_counter() - g.request_start
+        )
+        return response
+
+    @app.route("/metrics", methods=['GET'])
+    async def metrics():
+        return REGISTRY.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+    @app.route("/health", methods=['GET'])
+    async def health():
+        platform = get_platform(app, request.args)
+        if platform is None:
+            return jsonify({"error": "Unknown platform"}), 404
+        return jsonify(platform.clients.health())
+
+    @app.route("/modules", methods=['GET'])
+    async def modules():
+        return jsonify(app.module_manager.stats())
+
     @app.route("/write", methods=['get'])
     async def write():
+        platform = get_platform(app, request.args)
+        if platform is None:
+            return jsonify({"error": "Unknown platform"}), 404
+        error = setpoint_error(platform)
+        if error is not None:
+            return jsonify({"error": error}), 409
+
         direction = request.args.get('direction')  
         if (direction == "r"):
-            (position_client_right, position_client_left) = await get_modbuscntrl_val(app.clients, app.config)
+            (position_client_left, position_client_right) = await get_modbuscntrl_val(platform.clients, app.app_config)
 
-            position_client_right = max(0, min((position_client_right * 1.1), 1))
+            position_client_right = max(0, min(math.floor(position_client_right * 1.1), UPOS16_MAX))
 
-            await app.clients.client_right.write_register(address=app.config.MODBUS_ANALOG_POSITION, value=position_client_right, slave=app.config.SLAVE_ID)
-            await app.clients.client_left.write_register(address=app.config.MODBUS_ANALOG_POSITION, value=position_client_left, slave=app.config.SLAVE_ID)
+            platform.control_loop.slot.put(Setpoint(seq=0, left=position_client_left, right=position_client_right, received=time.perf_counter()))
 
         elif (direction == "l"):
-            (position_client_right, position_client_left) = await get_modbuscntrl_val(app.clients, app.config)
+            (position_client_left, position_client_right) = await get_modbuscntrl_val(platform.clients, app.app_config)
 
-            position_client_left = max(0, min((position_client_left * 0.9), 1))
+            position_client_left = max(0, min(math.floor(position_client_left * 0.9), UPOS16_MAX))
 
-            await app.clients.client_right.write_register(address=app.config.MODBUS_ANALOG_POSITION, value=position_client_right, slave=app.config.SLAVE_ID)
-            await app.clients.client_left.write_register(address=app.config.MODBUS_ANALOG_POSITION, value=position_client_left, slave=app.config.SLAVE_ID)
+            platform.control_loop.slot.put(Setpoint(seq=0, left=position_client_left, right=position_client_right, received=time.perf_counter()))
         else:
             app.logger.error("Wrong parameter use direction (l | r)")
+            return jsonify({"error": "Wrong parameter use direction (l | r)"}), 400
+
+        return jsonify({"left": position_client_left, "right": position_client_right})
+
+    @app.websocket("/stream")
+    async def stream():
+        """
+        Continuous setpoint stream. Newest received setpoint replaces
+        any that the control loop has not written yet. Acks and telemetry
+        are sent back on the same socket. ?platform=<name> selects the platform.
+        """
+        platform = get_platform(app, websocket.args)
+        if platform is None:
+            await websocket.send_json({"error": "Unknown platform"})
+            return
+        sent = {}
+        tasks = [
+            asyncio.create_task(stream_acks(platform, sent)),
+            asyncio.create_task(stream_telemetry(platform))
+        ]
+        try:
+            while True:
+                message = await websocket.receive()
+                error = setpoint_error(platform)
+                if error is not None:
+                    await websocket.send_json({"error": error})
+                    continue
+                try:
+                    setpoint = parse_setpoint(message, platform.kinematics)
+                except GeometryNotConfigured as e:
+                    await websocket.send_json({"error": str(e)})
+                    continue
+                if setpoint is None:
+                    await websocket.send_json({"error": "Invalid setpoint. Use [seq, left, right] with positions 0-65535 or {seq, pitch, roll, heave}"})
+                    continue
+                sent["last"] = setpoint
+                platform.control_loop.slot.put(setpoint)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @app.route("/playback/start", methods=['GET'])
+    async def playback_start():
+        """
+        Plays a trajectory from trajectories/ or recordings/ | ?file=<name>&rate=1.0&loop=0&platform=<name>
+        """
+        platform = get_platform(app, request.args)
+        if platform is None:
+            return jsonify({"error": "Unknown platform"}), 404
+        if platform.control_loop.halted:
+            return jsonify({"error": "Motors stopped, enable them with /enable"}), 409
+        path = resolve_playback_file(request.args.get('file', ''))
+        if path is None:
+            return jsonify({"error": "Trajectory not found"}), 404
+        try:
+            rate = float(request.args.get('rate', 1.0))
+            trajectory = await asyncio.to_thread(load_trajectory, path)
+            if trajectory.is_cue and not platform.kinematics.configured:
+                return jsonify({"error": str(GeometryNotConfigured())}), 409
+            player = TrajectoryPlayer(trajectory, platform.control_loop.slot, app.logger, rate=rate,
+                                      loop=request.args.get('loop') == "1", min_interval=1 / app.app_config.POS_UPDATE_HZ)
+        except (ValueError, OSError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        if platform.player is not None:
+            platform.player.stop()
+        platform.buffer.clear()
+        platform.player = player
+        player.start()
+        return jsonify(player.status())
+
+    @app.route("/playback/<command>", methods=['GET'])
+    async def playback_control(command):
+        platform = get_platform(app, request.args)
+        if platform is None:
+            return jsonify({"error": "Unknown platform"}), 404
+        player = platform.player
+        if player is None:
+            return jsonify({"error": "No trajectory loaded"}), 404
+        try:
+            if command == "pause":
+                player.pause()
+            elif command == "resume":
+                player.resume()
+            elif command == "seek":
+                player.seek(float(request.args.get('t', 0.0)))
+            elif command == "rate":
+                player.set_rate(float(request.args.get('rate', 1.0)))
+            elif command == "stop":
+                player.stop()
+            elif command != "status":
+                return jsonify({"error": "Use start, pause, resume, seek, rate, stop or status"}), 400
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(player.status())
+
+    @app.route("/trajectory", methods=['POST'])
+    async def trajectory_submit():
+        """
+        Queues a batch of timestamped setpoints played from the server clock | ?platform=<name>
+        Body is columnar JSON or binary rows, see trajectory_buffer.parse_batch
+        """
+        platform = get_platform(app, request.args)
+        if platform is None:
+            return jsonify({"error": "Unknown platform"}), 404
+        if platform.control_loop.halted:
+            return jsonify({"error": "Motors stopped, enable them with /enable"}), 409
+        if is_playing(platform):
+            return jsonify({"error": "Trajectory playback in progress"}), 409
+        data = await request.get_data()
+        try:
+            columns = parse_batch(data, request.mimetype)
+            status = platform.buffer.submit(columns)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except GeometryNotConfigured as e:
+            return jsonify({"error": str(e)}), 409
+        return jsonify(status)
+
+    @app.route("/trajectory/<command>", methods=['GET'])
+    async def trajectory_control(command):
+        platform = get_platform(app, request.args)
+        if platform is None:
+            return jsonify({"error": "Unknown platform"}), 404
+        if command == "clear":
+            platform.buffer.clear()
+        elif command != "status":
+            return jsonify({"error": "Use clear or status"}), 400
+        return jsonify(platform.buffer.status())
 
     @app.route('/stop', methods=['GET'])
     async def stop_motors():
+        """
+        Stops the platform given with ?platform=<name>, without it every platform
+        """
+        success = False
+        name = request.args.get('platform')
+        if name is not None and name not in app.platforms:
+            return jsonify({"error": "Unknown platform"}), 404
         try:
-            success = await app.clients.stop()
+            if name is None:
+                success = await stop_all(app)
+            else:
+                platform = app.platforms[name]
+                halt_platform(platform, "emergency stop")
+                success = await platform.clients.stop()
             if not success:
                 pass # do something crazy :O
         except Exception as e:
             app.logger.error("Failed to stop motors?") # Mitäs sitten :D
 
+        return jsonify({"stopped": success}), 200 if success else 500
+
+    @app.route('/enable', methods=['GET'])
+    async def enable_motors():
+        """
+        Enables the platform given with ?platform=<name> after a stop, without it every stopped platform.
+        Motion continues from the position the drives are at now
+        """
+        name = request.args.get('platform')
+        if name is not None and name not in app.platforms:
+            return jsonify({"error": "Unknown platform"}), 404
+        platforms = [app.platforms[name]] if name is not None else list(app.platforms.values())
+        enabled = {}
+        for platform in platforms:
+            if not platform.control_loop.halted:
+                continue
+            try:
+                await enable_platform(platform)
+                enabled[platform.name] = True
+            except Exception as e:
+                app.logger.error(f"Failed to enable platform {platform.name}: {e}")
+                enabled[platform.name] = False
+
+        return jsonify({"enabled": enabled}), 200 if all(enabled.values()) else 500
+
     return app
 if __name__ == '__main__':
     async def run_app():
@@ -0,0 +1,294 @@
+import asyncio
+import csv
+import os
+import time
+from typing import Optional
+import numpy as np
+from numpy.lib.format import open_memmap
+from setpoints import Setpoint, UPOS16_MAX
+from motion_cueing import MotionCue
+from telemetry_recorder import ROWS_FILE
+
+CUE_FIELDS = ("pitch", "roll", "heave", "ax", "ay", "az")
+CHECK_CHUNK = 65536 # rows checked at a time so validation stays O(1) memory
+
+class Trajectory:
+    """
+    Timestamped setpoints backed by memory maps. Rows are read one at a time,
+    nothing proportional to the trajectory length is kept in memory.
+    Columns: time (seconds, non decreasing) and either left, right (0-65535)
+    or pitch, roll and optionally heave, ax, ay, az like the /stream messages.
+    Cue rows become setpoints with only the cue, MotionPipeline converts them.
+    Smoothed positions (commanded columns of a recording) bypass the limiter when played.
+    A recording that has wrapped around its ring starts at offset.
+    """
+    def __init__(self, columns, length, offset=0, name="", smoothed=False):
+        if "time" not in columns:
+            raise ValueError("Trajectory has no time column")
+        if not ("left" in columns and "right" in columns) and not ("pitch" in columns and "roll" in columns):
+            raise ValueError("Trajectory needs left and right or pitch and roll columns")
+        self.columns = columns
+        self.length = length
+        self.offset = offset
+        self.name = name
+        self.is_cue = "left" not in columns
+        self.smoothed = smoothed and not self.is_cue
+        self._times = columns["time"]
+        self._check_times()
+
+    def __len__(self):
+        return self.length
+
+    def _index(self, i):
+        return (self.offset + i) % self._times.shape[0] if self.offset else i
+
+    def _check_times(self):
+        previous = -np.inf
+        for start in range(0, self.length, CHECK_CHUNK):
+            end = min(start + CHECK_CHUNK, self.length)
+            chunk = np.array([self.time(i) for i in range(start, end)]) if self.offset else np.asarray(self._times[start:end])
+            if chunk.size and (chunk[0] < previous or np.any(np.diff(chunk) < 0)):
+                raise ValueError("Trajectory time column is not in increasing order")
+            if chunk.size:
+                previous = chunk[-1]
+
+    def time(self, i):
+        return float(self._times[self._index(i)])
+
+    @property
+    def duration(self):
+        return self.time(self.length - 1) - self.time(0) if self.length else 0.0
+
+    def index_at(self, t):
+        """
+        Index of the last row at or before trajectory time t (seconds from the first row)
+        """
+        target = self.time(0) + t
+        low, high = 0, self.length
+        while low < high:
+            middle = (low + high) // 2
+            if self.time(middle) <= target:
+                low = middle + 1
+            else:
+                high = middle
+        return max(low - 1, 0)
+
+    def setpoint(self, i, seq) -> Optional[Setpoint]:
+        """
+        Returns None if the row is not a valid setpoint
+        """
+        row = self._index(i)
+        if self.is_cue:
+            values = {field: float(self.columns[field][row]) if field in self.columns else 0.0 for field in CUE_FIELDS}
+            cue = MotionCue(pitch=values["pitch"], roll=values["roll"], heave=values["heave"],
+                            surge_acc=values["ax"], sway_acc=values["ay"], heave_acc=values["az"])
+            return Setpoint(seq=seq, left=None, right=None, received=time.perf_counter(), cue=cue)
+        left, right = self.columns["left"][row], self.columns["right"][row]
+        if not (0 <= left <= UPOS16_MAX and 0 <= right <= UPOS16_MAX):
+            return None
+        return Setpoint(seq=seq, left=int(left), right=int(right), received=time.perf_counter(), smoothed=self.smoothed)
+
+def csv_to_npy(path, cache_path):
+    """
+    Converts a CSV trajectory with a header row to a structured .npy file.
+    Streams the rows twice (count, fill) so memory use does not grow with the file
+    """
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        names = [name.strip() for name in next(reader)]
+        rows = sum(1 for row in reader if row)
+
+    array = open_memmap(cache_path, mode="w+", dtype=[(name, np.float64) for name in names], shape=(rows,))
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        next(reader)
+        i = 0
+        for row in reader:
+            if row:
+                array[i] = tuple(float(value) for value in row)
+                i += 1
+    array.flush()
+    del array
+
+def load_trajectory(path) -> Trajectory:
+    """
+    Opens a telemetry recording directory, a .npy file (structured with named fields
+    or 2D with columns time, left, right) or a CSV file with a header row.
+    CSV files are converted once to a .npy next to them.
+    A recording replays its commanded positions, which already went through
+    MotionPipeline, so they are not smoothed again. Positions of .npy and CSV files
+    are smoothed like /write setpoints and cues go through washout like /stream cues
+    """
+    name = os.path.basename(os.path.normpath(path))
+    if os.path.isdir(path):
+        rows = int(np.load(os.path.join(path, ROWS_FILE))[0])
+        columns = {
+            "time": np.load(os.path.join(path, "time.npy"), mmap_mode="r"),
+            "left": np.load(os.path.join(path, "commanded_left.npy"), mmap_mode="r"),
+            "right": np.load(os.path.join(path, "commanded_right.npy"), mmap_mode="r"),
+        }
+        capacity = columns["time"].shape[0]
+        if rows <= capacity:
+            return Trajectory(columns, rows, name=name, smoothed=True)
+        return Trajectory(columns, capacity, offset=rows % capacity, name=name, smoothed=True)
+
+    if path.lower().endswith(".csv"):
+        cache_path = os.path.splitext(path)[0] + ".npy"
+        if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+            csv_to_npy(path, cache_path)
+        path = cache_path
+
+    array = np.load(path, mmap_mode="r")
+    if array.dtype.names:
+        return Trajectory({field: array[field] for field in array.dtype.names}, array.shape[0], name=name)
+    if array.ndim == 2 and array.shape[1] >= 3:
+        return Trajectory({"time": array[:, 0], "left": array[:, 1], "right": array[:, 2]}, array.shape[0], name=name)
+    raise ValueError(f"Unsupported trajectory array shape {array.shape}")
+
+class TrajectoryPlayer:
+    """
+    Plays a trajectory into the control loop's setpoint slot on an absolute schedule
+    so timing does not drift. Wakes up at most once per control tick and puts the
+    newest row that is due, rows that the control loop could not write anyway are skipped.
+    Runs as a server task, independent of HTTP clients.
+    """
+    def __init__(self, trajectory: Trajectory, slot, logger, rate=1.0, loop=False, min_interval=0.0):
+        if rate <= 0:
+            raise ValueError(f"Invalid rate: {rate}. Expected > 0.")
+        self.trajectory = trajectory
+        self.slot = slot
+        self.logger = logger
+        self.rate = rate
+        self.loop = loop
+        self.min_interval = min_interval
+        self.state = "stopped" # stopped | playing | paused | finished
+        self.index = 0 # next row to play
+        self.seq = 0
+        self.loops = 0
+        self.invalid_rows = 0
+        self._base_wall = 0.0
+        self._base_time = 0.0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _rebase(self):
+        # Row at self.index is due now
+        self._base_wall = asyncio.get_running_loop().time()
+        self._base_time = self.trajectory.time(self.index) if self.index < len(self.trajectory) else 0.0
+
+    def _due(self, i):
+        return self._base_wall + (self.trajectory.time(i) - self._base_time) / self.rate
+
+    def _position(self):
+        """
+        Trajectory time (seconds from the first row) being played now
+        """
+        if self.state != "playing":
+            index = min(self.index, len(self.trajectory) - 1)
+            return self.trajectory.time(index) - self.trajectory.time(0) if len(self.trajectory) else 0.0
+        elapsed = (asyncio.get_running_loop().time() - self._base_wall) * self.rate
+        return self._base_time + elapsed - self.trajectory.time(0)
+
+    def _notify(self):
+        self._changed.set()
+
+    def start(self):
+        if len(self.trajectory) == 0:
+            raise ValueError("Trajectory is empty")
+        self.state = "playing"
+        self._rebase()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def stop(self):
+        self.state = "stopped"
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def pause(self):
+        if self.state == "playing":
+            self.state = "paused"
+            self._notify()
+
+    def resume(self):
+        if self.state == "paused":
+            self.state = "playing"
+            self._rebase()
+            self._notify()
+
+    def seek(self, seconds):
+        self.index = self.trajectory.index_at(max(0.0, seconds))
+        if self.state == "finished":
+            self.state = "paused"
+        self._rebase()
+        self._notify()
+
+    def set_rate(self, rate):
+        if rate <= 0:
+            raise ValueError(f"Invalid rate: {rate}. Expected > 0.")
+        self.rate = rate
+        self._rebase()
+        self._notify()
+
+    async def _wait(self, timeout=None):
+        """
+        Sleeps until timeout or a control call
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        length = len(self.trajectory)
+        self.logger.info(f"Playing trajectory {self.trajectory.name} ({length} rows, "
+                         f"{self.trajectory.duration:.1f}s) at rate {self.rate}")
+        last_put = -np.inf
+        while True:
+            if self.state == "paused":
+                await self._wait()
+                continue
+
+            if self.index >= length:
+                if not self.loop:
+                    self.state = "finished"
+                    self.logger.info(f"Trajectory {self.trajectory.name} finished")
+                    return
+                self.index = 0
+                self.loops += 1
+                self._rebase()
+
+            wake = max(self._due(self.index), last_put + self.min_interval)
+            now = loop.time()
+            if wake > now:
+                await self._wait(wake - now)
+                continue # state, index or rate may have changed
+
+            # Newest row that is due, the ones before it are skipped
+            elapsed = (now - self._base_wall) * self.rate
+            index = max(self.index, self.trajectory.index_at(self._base_time + elapsed - self.trajectory.time(0)))
+            setpoint = self.trajectory.setpoint(index, self.seq)
+            if setpoint is None:
+                self.invalid_rows += 1
+            else:
+                self.slot.put(setpoint)
+                self.seq += 1
+            last_put = now
+            self.index = index + 1
+
+    def status(self):
+        return {
+            "trajectory": self.trajectory.name,
+            "state": self.state,
+            "rows": len(self.trajectory),
+            "index": self.index,
+            "position": self._position(),
+            "duration": self.trajectory.duration,
+            "rate": self.rate,
+            "loop": self.loop,
+            "loops": self.loops,
+            "invalid_rows": self.invalid_rows,
+        }
@@ -0,0 +1,153 @@
+import numpy as np
+
+# Tritex register formats. Every format has a scalar path for single values
+# (precomputed scale factors, integer masks, no division) and a NumPy batch path
+# for whole arrays (trajectories, recordings).
+#
+# UVEL32 | 24 bit velocity, 2^-24 resolution, registers (low 16 bits, high 8 bits)
+# UACC32 | 20 bit acceleration, 2^-20 resolution, registers (low 16 bits, high 4 bits)
+# UCUR   | 9.7 current, 128 = 1 A
+# Revs   | 16.16 position in revs, registers (fraction * 65535, whole revs), signed for velocity feedback
+# UPOS16 | MODBUS_ANALOG_POSITION, 0-65535 between ANALOG_POSITION_MINIMUM and ANALOG_POSITION_MAXIMUM
+
+UVEL32_RESOLUTION = 0.000000059604644775390625 # 2^-24
+UACC32_RESOLUTION = 0.00000095367431640625 # 2^-20
+UVEL32_SCALE = 1 << 24
+UACC32_SCALE = 1 << 20
+UCUR_SCALE = 128
+REVS_FRACTION = 65535
+UPOS16_MAX = 65535
+
+# UVEL32
+
+def encode_uvel32(value):
+    scaled = int(value * UVEL32_SCALE) & 0xFFFFFF
+    return scaled & 0xFFFF, scaled >> 16
+
+def combine_uvel32(low, high):
+    """
+    Raw 24 bit value
+    """
+    return ((high & 0xFF) << 16) | (low & 0xFFFF)
+
+def decode_uvel32(low, high):
+    return combine_uvel32(low, high) * UVEL32_RESOLUTION
+
+def encode_uvel32_batch(values):
+    """
+    Returns uint16 array of shape (n, 2) | columns low, high
+    """
+    scaled = (np.asarray(values, dtype=np.float64) * UVEL32_SCALE).astype(np.int64) & 0xFFFFFF
+    return np.stack((scaled & 0xFFFF, scaled >> 16), axis=-1).astype(np.uint16)
+
+def decode_uvel32_batch(registers):
+    registers = np.asarray(registers, dtype=np.int64)
+    return (((registers[..., 1] & 0xFF) << 16) | registers[..., 0]) * UVEL32_RESOLUTION
+
+# UACC32
+
+def encode_uacc32(value):
+    scaled = int(value * UACC32_SCALE) & 0xFFFFF
+    return scaled & 0xFFFF, scaled >> 16
+
+def combine_uacc32(low, high):
+    """
+    Raw 20 bit value
+    """
+    return ((high & 0x0F) << 16) | (low & 0xFFFF)
+
+def decode_uacc32(low, high):
+    return combine_uacc32(low, high) * UACC32_RESOLUTION
+
+def encode_uacc32_batch(values):
+    """
+    Returns uint16 array of shape (n, 2) | columns low, high
+    """
+    scaled = (np.asarray(values, dtype=np.float64) * UACC32_SCALE).astype(np.int64) & 0xFFFFF
+    return np.stack((scaled & 0xFFFF, scaled >> 16), axis=-1).astype(np.uint16)
+
+def decode_uacc32_batch(registers):
+    registers = np.asarray(registers, dtype=np.int64)
+    return (((registers[..., 1] & 0x0F) << 16) | registers[..., 0]) * UACC32_RESOLUTION
+
+# UCUR 9.7
+
+def encode_ucur(amps):
+    return round(amps * UCUR_SCALE) & 0xFFFF
+
+def decode_ucur(register):
+    return register / UCUR_SCALE
+
+def encode_ucur_batch(amps):
+    return (np.rint(np.asarray(amps, dtype=np.float64) * UCUR_SCALE).astype(np.int64) & 0xFFFF).astype(np.uint16)
+
+def decode_ucur_batch(registers):
+    return np.asarray(registers, dtype=np.float64) / UCUR_SCALE
+
+# Revs 16.16
+
+def encode_revs(revs):
+    """
+    Returns [fraction, whole revs] | negative values wrap like the drive's two's complement
+    """
+    whole = int(revs // 1)
+    fraction = int((revs - whole) * REVS_FRACTION)
+    return [fraction & 0xFFFF, whole & 0xFFFF]
+
+def decode_revs(registers):
+    return registers[1] + registers[0] / REVS_FRACTION
+
+def decode_signed_revs(registers):
+    whole = registers[1]
+    if whole & 0x8000:
+        whole -= 0x10000
+    return whole + registers[0] / REVS_FRACTION
+
+def encode_revs_batch(revs):
+    """
+    Returns uint16 array of shape (n, 2) | columns fraction, whole revs
+    """
+    revs = np.asarray(revs, dtype=np.float64)
+    whole = np.floor(revs)
+    fraction = ((revs - whole) * REVS_FRACTION).astype(np.int64)
+    return np.stack((fraction & 0xFFFF, whole.astype(np.int64) & 0xFFFF), axis=-1).astype(np.uint16)
+
+def decode_revs_batch(registers, signed=False):
+    """
+    registers is an array of shape (n, 2) | columns fraction, whole revs
+    """
+    registers = np.asarray(registers)
+    whole = registers[..., 1].astype(np.int64)
+    if signed:
+        whole = np.where(whole & 0x8000, whole - 0x10000, whole)
+    return whole + registers[..., 0] / REVS_FRACTION
+
+# UPOS16
+
+def encode_upos16(fraction):
+    """
+    Fraction 0-1 of the analog position range to MODBUS_ANALOG_POSITION value, clamped
+    """
+    if fraction <= 0.0:
+        return 0
+    if fraction >= 1.0:
+        return UPOS16_MAX
+    return int(fraction * UPOS16_MAX)
+
+def decode_upos16(value):
+    return value / UPOS16_MAX
+
+def encode_upos16_batch(fraction):
+    return np.floor(np.clip(np.asarray(fraction, dtype=np.float64), 0.0, 1.0) * UPOS16_MAX).astype(np.uint16)
+
+def decode_upos16_batch(values):
+    return np.asarray(values, dtype=np.float64) / UPOS16_MAX
+
+def revs_to_upos16(revs, min_revs, max_revs):
+    """
+    Position in revs to MODBUS_ANALOG_POSITION value between the analog position limits
+    """
+    return encode_upos16((revs - min_revs) / (max_revs - min_revs))
+
+def revs_to_upos16_batch(revs, min_revs, max_revs):
+    return encode_upos16_batch((np.asarray(revs, dtype=np.float64) - min_revs) / (max_revs - min_revs))
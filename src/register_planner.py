@@ -0,0 +1,88 @@
+from dataclasses import dataclass, field
+from utils import is_nth_bit_on
+from register_codecs import decode_revs, decode_signed_revs
+
+MODBUS_MAX_READ_COUNT = 125
+
+@dataclass
+class ReadBlock:
+    address: int
+    count: int
+    # name -> (offset inside the block, register count)
+    fields: dict = field(default_factory=dict)
+
+@dataclass
+class DriveSnapshot:
+    status: int
+    fault: int
+    position: float # revs
+    velocity: float # revs/s
+
+    @property
+    def is_faulted(self):
+        # 4th bit 2^4 indicates if motor is in the fault state
+        return is_nth_bit_on(3, self.status)
+
+    @property
+    def is_homed(self):
+        return is_nth_bit_on(1, self.status)
+
+def snapshot_registers(config):
+    """
+    Registers needed for one full drive state snapshot.
+    Returns dict of name -> (address, register count)
+    """
+    return {
+        "status": (config.DRIVER_STATUS_ADDRESS, 1),
+        "fault": (config.RECENT_FAULT_ADDRESS, 1),
+        "position": (config.PFEEDBACK_POSITION, 2),
+        "velocity": (config.VFEEDBACK_VELOCITY, 2),
+    }
+
+def plan_block_reads(registers, max_count=MODBUS_MAX_READ_COUNT, max_gap=32):
+    """
+    Groups register reads into the fewest contiguous block reads.
+    Two reads are merged when the unused gap between them is at most max_gap
+    registers and the merged block still fits into max_count registers.
+    Returns list of ReadBlocks ordered by address
+    """
+    if max_count < 1 or max_count > MODBUS_MAX_READ_COUNT:
+        raise ValueError(f"Invalid max_count: {max_count}. Expected 1-{MODBUS_MAX_READ_COUNT}.")
+
+    blocks = []
+    for name, (address, count) in sorted(registers.items(), key=lambda item: item[1][0]):
+        if count > max_count:
+            raise ValueError(f"Register {name} count {count} exceeds max_count {max_count}")
+
+        if blocks:
+            block = blocks[-1]
+            block_end = block.address + block.count
+            new_end = max(block_end, address + count)
+            if address - block_end <= max_gap and new_end - block.address <= max_count:
+                block.count = new_end - block.address
+                block.fields[name] = (address - block.address, count)
+                continue
+
+        blocks.append(ReadBlock(address=address, count=count, fields={name: (0, count)}))
+
+    return blocks
+
+def decode_blocks(blocks, block_registers):
+    """
+    Slices the registers of each block read back into named fields.
+    Returns dict of name -> list of registers
+    """
+    values = {}
+    for block, registers in zip(blocks, block_registers):
+        for name, (offset, count) in block.fields.items():
+            values[name] = registers[offset:offset + count]
+    return values
+
+def decode_snapshot(blocks, block_registers) -> DriveSnapshot:
+    values = decode_blocks(blocks, block_registers)
+    return DriveSnapshot(
+        status=values["status"][0],
+        fault=values["fault"][0],
+        position=decode_revs(values["position"]),
+        velocity=decode_signed_revs(values["velocity"]),
+    )
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+from motion_cueing import MotionCue
+from register_codecs import UPOS16_MAX
+
+@dataclass
+class Setpoint:
+    seq: int
+    left: Optional[int] # MODBUS_ANALOG_POSITION value 0-65535, None for a cue MotionPipeline converts
+    right: Optional[int]
+    received: float # time.perf_counter() when received
+    cue: Optional[MotionCue] = None # tilt and acceleration the positions were computed from
+    smoothed: bool = False # positions already went through MotionPipeline, e.g. a recording being replayed
+
+class SetpointSlot:
+    """
+    Holds only the newest setpoint. A put() replaces the setpoint
+    that has not been taken yet so the consumer never works through a backlog.
+    """
+    def __init__(self):
+        self._setpoint: Optional[Setpoint] = None
+        self._event = asyncio.Event()
+        self.replaced = 0
+
+    def put(self, setpoint):
+        if self._setpoint is not None:
+            self.replaced += 1
+        self._setpoint = setpoint
+        self._event.set()
+
+    def take_nowait(self) -> Optional[Setpoint]:
+        setpoint = self._setpoint
+        self._setpoint = None
+        self._event.clear()
+        return setpoint
+
+    async def take(self) -> Setpoint:
+        await self._event.wait()
+        return self.take_nowait()
+
+def parse_setpoint(message, kinematics=None) -> Optional[Setpoint]:
+    """
+    Parses a compact setpoint message.
+    Accepts JSON array [seq, left, right] or object {"seq": .., "left": .., "right": ..}
+    With kinematics also {"seq": .., "pitch": .., "roll": .., "heave": .., "ax": .., "ay": .., "az": ..}
+    in degrees, mm and m/s^2 (surge, sway, heave acceleration). Only pitch and roll are required.
+    Returns None if message is invalid
+    """
+    try:
+        data = json.loads(message)
+        cue = None
+        if isinstance(data, list):
+            seq, left, right = data
+        elif isinstance(data, dict) and kinematics is not None and "pitch" in data:
+            seq = data["seq"]
+            cue = MotionCue(
+                pitch=float(data["pitch"]),
+                roll=float(data["roll"]),
+                heave=float(data.get("heave", 0.0)),
+                surge_acc=float(data.get("ax", 0.0)),
+                sway_acc=float(data.get("ay", 0.0)),
+                heave_acc=float(data.get("az", 0.0)),
+            )
+            left, right = kinematics.positions(cue.pitch, cue.roll, cue.heave)
+        elif isinstance(data, dict):
+            seq, left, right = data["seq"], data["left"], data["right"]
+        else:
+            return None
+
+        seq, left, right = int(seq), int(left), int(right)
+        if not (0 <= left <= UPOS16_MAX and 0 <= right <= UPOS16_MAX):
+            return None
+
+        return Setpoint(seq=seq, left=left, right=right, received=time.perf_counter(), cue=cue)
+
+    except (ValueError, TypeError, KeyError):
+        return None
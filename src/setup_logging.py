@@ -1,15 +1,128 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from config import Config
+from metrics import REGISTRY
+
+# Attributes every LogRecord has, anything else was given with extra= and goes to the structured record as is
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "suppressed"}
+
+class RepeatFilter(logging.Filter):
+    """
+    Lets through burst records per call site (file and line) within window seconds,
+    the rest are dropped before they reach the queue. The next record let through
+    from that call site tells how many were suppressed.
+    CRITICAL records always pass.
+    """
+    def __init__(self, burst, window):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.sites = {} # (pathname, lineno) -> [window start, records in window, suppressed]
+        self.suppressed = 0
+        self._lock = threading.Lock() # records can come from worker threads too
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self._lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                pending = site[2] if site is not None else 0
+                self.sites[key] = [now, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                pending = 0
+            else:
+                site[2] += 1
+                self.suppressed += 1
+                return False
+        record.suppressed = pending
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Never blocks the caller. A record is dropped if the listener has fallen
+    queue size records behind.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread, only the message is merged here
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Blocking put, a full queue must not keep the listener from stopping
+        self.queue.put(self._sentinel)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" ({suppressed} similar messages suppressed)"
+        return text
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line
+    """
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "timestamp": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging(name, filename, config=None):
+    """
+    Logger whose records are written to the file and the console by a background
+    listener thread, logging calls only put the record on a queue. Repeated records
+    from the same call site are sampled by RepeatFilter. With LOG_STRUCTURED
+    the file gets JSON lines, the console stays plain text.
+    """
+    config = config or Config()
+    logger = logging.getLogger(name)
+    if any(isinstance(handler, DroppingQueueHandler) for handler in logger.handlers):
+        return logger
 
-def setup_logging(name, filename):
-    log_dir = "logs"
     parent_log_dir = os.path.join(os.path.dirname(__file__), '..', 'logs')
     if not os.path.exists(parent_log_dir):
         os.makedirs(parent_log_dir)
-    
-    log_format = format='%(asctime)s - %(levelname)s - %(message)s'
-    formatter = logging.Formatter(log_format)
+
+    log_format = '%(asctime)s - %(levelname)s - %(message)s'
 
     # Set up file handler
     log_file = os.path.join(parent_log_dir, filename)
@@ -20,16 +133,28 @@ def setup_logging(name, filename):
         backupCount=1,
         encoding='utf-8'
     )
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(JsonFormatter() if config.LOG_STRUCTURED else TextFormatter(log_format))
 
     #setup console
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(TextFormatter(log_format))
+
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    repeat_filter = RepeatFilter(config.LOG_REPEAT_BURST, config.LOG_REPEAT_WINDOW)
+    queue_handler.addFilter(repeat_filter)
+    listener = DrainingQueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Writes out what is still queued on exit
+    atexit.register(listener.stop)
+
+    REGISTRY.counter("log_records_suppressed", "Repeated log records dropped by sampling", {"logger": name},
+                     fn=lambda: repeat_filter.suppressed)
+    REGISTRY.counter("log_records_dropped", "Log records dropped because the log queue was full", {"logger": name},
+                     fn=lambda: queue_handler.dropped)
 
     # config root logger
-    logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(queue_handler)
 
-    return logger 
\ No newline at end of file
+    return logger
@@ -0,0 +1,67 @@
+import asyncio
+from drive_profiles import ProfileApplier, DriveProfile
+from metrics import REGISTRY
+
+# Seconds | startup stages take from milliseconds (already configured) up to the homing timeout
+STARTUP_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+class StartupPipeline:
+    """
+    Brings both drives up as a dependency graph instead of one step at a time.
+    Every drive runs its own chain connect -> home -> configure, so a drive that
+    is homed gets its parameters while the other one is still moving.
+    Enabling waits for both chains (palvelin.init) since the platform needs both actuators.
+    """
+    STAGES = ("connect", "home", "configure")
+
+    def __init__(self, clients, config, logger, profile: DriveProfile):
+        self.clients = clients
+        self.config = config
+        self.logger = logger
+        self.profile = profile
+        self.applier = ProfileApplier(clients, config, logger)
+        self.state = {"left": "pending", "right": "pending"}
+        self.durations = {"left": {}, "right": {}}
+
+    async def _stage(self, drive, stage, coro):
+        self.state[drive] = stage
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await coro
+        duration = loop.time() - start
+        self.durations[drive][stage] = duration
+        REGISTRY.histogram("startup_stage_seconds", "Time spent in a drive startup stage",
+                           {"drive": self.clients.drive_ids[drive], "stage": stage}, buckets=STARTUP_BUCKETS).observe(duration)
+        if not result:
+            self.state[drive] = "failed"
+            self.logger.error(f"Startup of {drive} drive failed at {stage} after {duration:.2f}s")
+        return result
+
+    async def run_drive(self, client, drive) -> bool:
+        if not await self._stage(drive, "connect", self.clients.connect_drive(client)):
+            return False
+        if not await self._stage(drive, "home", self.clients.home_drive(client)):
+            return False
+        if not await self._stage(drive, "configure", self.applier.apply_drive(client, self.profile)):
+            return False
+        self.state[drive] = "ready"
+        return True
+
+    async def run(self) -> bool:
+        """
+        Returns True when both drives are connected, homed and configured
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.clients.create_clients()
+        left_ready, right_ready = await asyncio.gather(
+            self.run_drive(self.clients.client_left, "left"),
+            self.run_drive(self.clients.client_right, "right")
+        )
+        self.logger.info(f"Drive startup finished in {loop.time() - start:.2f}s. "
+                         f"Left: {self.state['left']} {self._format(self.durations['left'])} | "
+                         f"right: {self.state['right']} {self._format(self.durations['right'])}")
+        return left_ready and right_ready
+
+    def _format(self, durations):
+        return ", ".join(f"{stage} {duration:.2f}s" for stage, duration in durations.items())
@@ -0,0 +1,97 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class StateEstimate:
+    position: float # revs
+    velocity: float # revs/s
+    acceleration: float # revs/s^2
+    time: float # time.perf_counter() the estimate is for
+
+class ActuatorEstimator:
+    """
+    Constant acceleration (alpha-beta-gamma) estimator for one actuator.
+    Feedback read over Modbus is already old when it arrives, it was sampled by
+    the drive about half a round trip before the response. Each measurement is
+    placed at that time, the state is predicted to it and corrected with the
+    position and velocity residuals. predict(t) extrapolates to any time, e.g. to
+    when the next write reaches the drive.
+    """
+    def __init__(self, config):
+        self.position_gain = config.ESTIMATOR_POSITION_GAIN
+        self.velocity_gain = config.ESTIMATOR_VELOCITY_GAIN
+        self.acceleration_gain = config.ESTIMATOR_ACCELERATION_GAIN
+        self.max_horizon = config.ESTIMATOR_MAX_HORIZON
+        self.latency_smoothing = config.ESTIMATOR_LATENCY_SMOOTHING
+        self.state: Optional[StateEstimate] = None
+        self.latency: Optional[float] = None # smoothed request round trip in seconds
+        self.updates = 0
+
+    def reset(self):
+        self.state = None
+        self.updates = 0
+
+    def observe_latency(self, round_trip):
+        if self.latency is None:
+            self.latency = round_trip
+        else:
+            self.latency += self.latency_smoothing * (round_trip - self.latency)
+
+    def _extrapolate(self, state: StateEstimate, at):
+        # Past max_horizon the constant acceleration assumption is not trusted
+        dt = max(0.0, min(at - state.time, self.max_horizon))
+        return (state.position + state.velocity * dt + 0.5 * state.acceleration * dt * dt,
+                state.velocity + state.acceleration * dt)
+
+    def update(self, position, velocity, sent, received):
+        """
+        Adds one position and velocity feedback from a request sent and answered
+        at the given time.perf_counter() times
+        """
+        round_trip = received - sent
+        self.observe_latency(round_trip)
+        sampled = received - round_trip / 2
+
+        state = self.state
+        if state is None or sampled <= state.time:
+            # First measurement or out of order response, start from the measurement
+            self.state = StateEstimate(position, velocity, 0.0 if state is None else state.acceleration, sampled)
+            self.updates += 1
+            return self.state
+
+        dt = sampled - state.time
+        predicted_position, predicted_velocity = self._extrapolate(state, sampled)
+        position_residual = position - predicted_position
+        velocity_residual = velocity - predicted_velocity
+        acceleration = state.acceleration
+        if dt <= self.max_horizon:
+            acceleration += self.acceleration_gain * velocity_residual / dt
+        else:
+            acceleration = 0.0 # too long since the last measurement to tell
+
+        self.state = StateEstimate(
+            position=predicted_position + self.position_gain * position_residual,
+            velocity=predicted_velocity + self.velocity_gain * velocity_residual,
+            acceleration=acceleration,
+            time=sampled,
+        )
+        self.updates += 1
+        return self.state
+
+    def predict(self, at=None) -> Optional[StateEstimate]:
+        """
+        Estimated state at time.perf_counter() time at (default now), None before the first update
+        """
+        if self.state is None:
+            return None
+        at = time.perf_counter() if at is None else at
+        position, velocity = self._extrapolate(self.state, at)
+        return StateEstimate(position, velocity, self.state.acceleration, at)
+
+    def predict_at_write(self, now=None) -> Optional[StateEstimate]:
+        """
+        Estimated state when a write sent now reaches the drive | half a round trip from now
+        """
+        now = time.perf_counter() if now is None else now
+        return self.predict(now + (self.latency or 0.0) / 2)
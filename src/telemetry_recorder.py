@@ -0,0 +1,177 @@
+import os
+import re
+import shutil
+import threading
+import time
+import numpy as np
+from numpy.lib.format import open_memmap
+from metrics import REGISTRY
+
+# Fixed width columns | every column is its own .npy file so NumPy maps it without parsing
+COLUMNS = (
+    ("time", np.float64), # time.time() of the control tick
+    ("commanded_left", np.uint16), # MODBUS_ANALOG_POSITION written
+    ("commanded_right", np.uint16),
+    ("position_left", np.float64), # PFEEDBACK revs
+    ("position_right", np.float64),
+    ("velocity_left", np.float64), # VFEEDBACK revs/s
+    ("velocity_right", np.float64),
+    ("status_left", np.uint16),
+    ("status_right", np.uint16),
+    ("fault_left", np.uint16),
+    ("fault_right", np.uint16),
+)
+ROWS_FILE = "rows.npy" # int64[1], rows written so far | file index = row % capacity
+
+class TelemetryRecorder:
+    """
+    Records every control tick into preallocated in-memory ring buffers.
+    A background thread copies new rows to memory-mapped column files every
+    flush_interval seconds, so record() never allocates, touches the disk or
+    blocks the event loop. Files are a ring of capacity rows, oldest are overwritten.
+    """
+    def __init__(self, path, capacity, buffer_size=4096, flush_interval=1.0, logger=None, labels=None):
+        self.path = path
+        self.capacity = capacity
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.logger = logger
+        os.makedirs(path, exist_ok=True)
+
+        self.buffers = {name: np.zeros(buffer_size, dtype=dtype) for name, dtype in COLUMNS}
+        self.files = {
+            name: open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=(capacity,))
+            for name, dtype in COLUMNS
+        }
+        self.rows = open_memmap(os.path.join(path, ROWS_FILE), mode="w+", dtype=np.int64, shape=(1,))
+        # Columns as attributes | one lookup less per value in record()
+        (self._time, self._commanded_left, self._commanded_right, self._position_left, self._position_right,
+         self._velocity_left, self._velocity_right, self._status_left, self._status_right,
+         self._fault_left, self._fault_right) = (self.buffers[name] for name, _ in COLUMNS)
+
+        self.head = 0 # rows recorded, only written by record()
+        self.flushed = 0 # rows copied to the files, only written by the flush thread
+        self.written = 0 # rows in the files
+        self.dropped = 0
+        REGISTRY.counter("telemetry_rows", "Control ticks recorded", labels, fn=lambda: self.head)
+        REGISTRY.counter("telemetry_dropped_rows", "Recorded rows overwritten before they were flushed",
+                         labels, fn=lambda: self.dropped)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, timestamp, commanded_left, commanded_right, left_snapshot, right_snapshot):
+        """
+        Called from the control loop. Snapshots may be None before the first read
+        """
+        i = self.head % self.buffer_size
+        self._time[i] = timestamp
+        self._commanded_left[i] = commanded_left
+        self._commanded_right[i] = commanded_right
+        if left_snapshot is not None:
+            self._position_left[i] = left_snapshot.position
+            self._velocity_left[i] = left_snapshot.velocity
+            self._status_left[i] = left_snapshot.status
+            self._fault_left[i] = left_snapshot.fault
+        else:
+            self._position_left[i] = self._velocity_left[i] = np.nan
+            self._status_left[i] = self._fault_left[i] = 0
+        if right_snapshot is not None:
+            self._position_right[i] = right_snapshot.position
+            self._velocity_right[i] = right_snapshot.velocity
+            self._status_right[i] = right_snapshot.status
+            self._fault_right[i] = right_snapshot.fault
+        else:
+            self._position_right[i] = self._velocity_right[i] = np.nan
+            self._status_right[i] = self._fault_right[i] = 0
+        self.head += 1
+
+    def _copy(self, start, end):
+        """
+        Copies rows [start, end) from the buffers to the files, splitting at the wrap of either ring
+        """
+        while start < end:
+            buffer_index = start % self.buffer_size
+            file_index = self.written % self.capacity
+            count = min(end - start, self.buffer_size - buffer_index, self.capacity - file_index)
+            for name, buffer in self.buffers.items():
+                self.files[name][file_index:file_index + count] = buffer[buffer_index:buffer_index + count]
+            start += count
+            self.written += count
+
+    def flush(self):
+        head = self.head
+        start = self.flushed
+        if head - start > self.buffer_size:
+            # Flush thread fell a whole buffer behind
+            self.dropped += head - start - self.buffer_size
+            start = head - self.buffer_size
+        if start == head:
+            return
+
+        self._copy(start, head)
+        self.flushed = head
+        for column in self.files.values():
+            column.flush()
+        # Row count last so a reader never sees rows that are not in the files yet
+        self.rows[0] = self.written
+        self.rows.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Failed to flush telemetry: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+def new_recording_path(base_dir, suffix=""):
+    return os.path.join(base_dir, time.strftime("%Y%m%d-%H%M%S") + suffix)
+
+def prune_recordings(base_dir, keep, suffix="", logger=None):
+    """
+    Deletes the oldest recordings named like new_recording_path(base_dir, suffix)
+    so that at most keep of them remain. Returns list of deleted paths
+    """
+    pattern = re.compile(r"\d{8}-\d{6}" + re.escape(suffix))
+    try:
+        names = sorted(name for name in os.listdir(base_dir)
+                       if pattern.fullmatch(name) and os.path.isdir(os.path.join(base_dir, name)))
+    except FileNotFoundError:
+        return []
+    removed = []
+    for name in names[:max(len(names) - keep, 0)]:
+        path = os.path.join(base_dir, name)
+        try:
+            shutil.rmtree(path)
+            removed.append(path)
+        except OSError as e:
+            if logger:
+                logger.error(f"Failed to delete old recording {path}: {e}")
+    if removed and logger:
+        logger.info(f"Deleted {len(removed)} old recordings from {base_dir}")
+    return removed
+
+def load_recording(path):
+    """
+    Opens a recording as read only memory maps.
+    Returns dict of column name -> array in time order
+    """
+    rows = int(np.load(os.path.join(path, ROWS_FILE))[0])
+    columns = {}
+    for name, _ in COLUMNS:
+        column = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        capacity = column.shape[0]
+        if rows <= capacity:
+            columns[name] = column[:rows]
+        else:
+            # Ring has wrapped, oldest row is at the write position
+            split = rows % capacity
+            columns[name] = np.concatenate((column[split:], column[:split]))
+    return columns
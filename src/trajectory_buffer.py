@@ -0,0 +1,309 @@
+import asyncio
+import json
+import time
+from typing import Callable, Optional
+import numpy as np
+from metrics import REGISTRY
+from register_codecs import UPOS16_MAX, encode_upos16_batch, decode_upos16_batch
+from setpoints import Setpoint
+
+# Binary batch | one little endian row per setpoint: time (s), left, right (MODBUS_ANALOG_POSITION 0-65535)
+BINARY_ROW = np.dtype([("time", "<f8"), ("left", "<u2"), ("right", "<u2")])
+CONTEXT_ROWS = 2 # queued rows before a batch that its velocity and acceleration are checked against
+COMPACT_ROWS = 4096 # played rows dropped from the buffer at a time
+
+def parse_batch(data: bytes, mimetype) -> dict:
+    """
+    Parses a batch of timestamped setpoints. Either binary (application/octet-stream) rows of BINARY_ROW
+    or columnar JSON {"time": [...], "left": [...], "right": [...]} with positions 0-65535 or
+    {"time": [...], "pitch": [...], "roll": [...], "heave": [...]} in degrees and mm, heave is optional.
+    Times are seconds on the client's own timeline.
+    Returns dict of column name -> float64 array. Raises ValueError if the batch is invalid
+    """
+    if mimetype == "application/octet-stream":
+        if len(data) == 0 or len(data) % BINARY_ROW.itemsize:
+            raise ValueError(f"Binary batch must be a whole number of {BINARY_ROW.itemsize} byte rows")
+        rows = np.frombuffer(data, dtype=BINARY_ROW)
+        return {name: rows[name].astype(np.float64) for name in BINARY_ROW.names}
+
+    try:
+        body = json.loads(data)
+    except ValueError:
+        raise ValueError("Batch is not valid JSON")
+    if not isinstance(body, dict) or "time" not in body:
+        raise ValueError("Batch needs a time column")
+    if "left" in body and "right" in body:
+        names = ("time", "left", "right")
+    elif "pitch" in body and "roll" in body:
+        names = ("time", "pitch", "roll", "heave") if "heave" in body else ("time", "pitch", "roll")
+    else:
+        raise ValueError("Batch needs left and right or pitch and roll columns")
+
+    try:
+        columns = {name: np.asarray(body[name], dtype=np.float64) for name in names}
+    except (TypeError, ValueError):
+        raise ValueError("Batch columns must be arrays of numbers")
+    length = columns["time"].shape
+    if len(length) != 1 or length[0] == 0 or any(column.shape != length for column in columns.values()):
+        raise ValueError("Batch columns must be non empty arrays of the same length")
+    return columns
+
+def _first(mask, offset=0):
+    """
+    Index of the first True in mask, shifted to batch rows, or None
+    """
+    rows = np.flatnonzero(mask)
+    return int(rows[0]) + offset if rows.size else None
+
+def validate_batch(columns, kinematics, config, context_times=None, context_positions=None):
+    """
+    Checks the whole batch in one vectorized pass: increasing times, stroke limits and
+    velocity and acceleration limits in mm per actuator. The context rows queued before the
+    batch are included so a batch continues smoothly from the previous one.
+    Pose rows are converted with the kinematics, washout is only for live motion cues.
+    Returns tuple of (times, positions) | positions is uint16 array of shape (n, 2).
+    Raises ValueError naming the first invalid row
+    """
+    times = columns["time"]
+    span = kinematics.stroke_max - kinematics.stroke_min
+    if not np.all(np.isfinite(times)):
+        raise ValueError(f"Row {_first(~np.isfinite(times))}: time is not a number")
+
+    if "left" in columns:
+        positions = np.column_stack((columns["left"], columns["right"]))
+        invalid = ~np.isfinite(positions) | (positions < 0) | (positions > UPOS16_MAX)
+        if invalid.any():
+            raise ValueError(f"Row {_first(invalid.any(axis=1))}: position outside 0-{UPOS16_MAX}")
+        positions = np.rint(positions).astype(np.uint16)
+        strokes = kinematics.stroke_min + decode_upos16_batch(positions) * span
+    else:
+        pitch, roll = columns["pitch"], columns["roll"]
+        heave = columns.get("heave")
+        invalid = ~(np.abs(pitch) <= kinematics.pitch_limit) | ~(np.abs(roll) <= kinematics.roll_limit)
+        if invalid.any():
+            raise ValueError(f"Row {_first(invalid)}: pitch or roll over the limit "
+                             f"{kinematics.pitch_limit}/{kinematics.roll_limit} deg")
+        strokes = kinematics.strokes_batch(pitch, roll, heave, clip=False)
+        invalid = ~((strokes >= kinematics.stroke_min) & (strokes <= kinematics.stroke_max)).all(axis=1)
+        if invalid.any():
+            raise ValueError(f"Row {_first(invalid)}: stroke outside "
+                             f"{kinematics.stroke_min}-{kinematics.stroke_max} mm")
+        positions = encode_upos16_batch((strokes - kinematics.stroke_min) / span)
+
+    # Derivatives over the context and the batch | every difference involves at least one batch row
+    context = 0
+    all_times, all_strokes = times, strokes
+    if context_times is not None and len(context_times):
+        context = len(context_times)
+        all_times = np.concatenate((context_times, times))
+        all_strokes = np.concatenate((kinematics.stroke_min + decode_upos16_batch(context_positions) * span, strokes))
+
+    dt = np.diff(all_times)
+    if np.any(dt <= 0):
+        raise ValueError(f"Row {_first(dt <= 0, 1 - context)}: times must be increasing")
+
+    tolerance = 1 + config.BUFFER_LIMIT_TOLERANCE
+    velocity = np.diff(all_strokes, axis=0) / dt[:, None]
+    over = np.abs(velocity).max(axis=1) > config.MOTION_VEL_LIMIT_MM_S * tolerance
+    over[:max(context - 1, 0)] = False # between context rows, checked with their own batch
+    if over.any():
+        row = _first(over)
+        raise ValueError(f"Row {row + 1 - context}: velocity {np.abs(velocity[row]).max():.1f} mm/s over the limit "
+                         f"{config.MOTION_VEL_LIMIT_MM_S} mm/s")
+
+    acceleration = np.diff(velocity, axis=0) / ((dt[1:] + dt[:-1]) / 2)[:, None]
+    over = np.abs(acceleration).max(axis=1) > config.MOTION_ACC_LIMIT_MM_S2 * tolerance
+    over[:max(context - 2, 0)] = False
+    if over.any():
+        row = _first(over)
+        raise ValueError(f"Row {max(row + 2 - context, 0)}: acceleration {np.abs(acceleration[row]).max():.1f} mm/s^2 "
+                         f"over the limit {config.MOTION_ACC_LIMIT_MM_S2} mm/s^2")
+
+    return times, positions
+
+class TrajectoryBuffer:
+    """
+    Time ordered buffer of validated setpoint rows that clients submit ahead of time in batches.
+    Rows are played from the server clock into the control loop's setpoint slot, so network
+    and client jitter do not reach the motion as long as the client stays ahead.
+    The first batch of a stream sets its epoch: its first row is due BUFFER_START_DELAY
+    seconds later and every later row at the same offset on the client's timeline.
+    A batch that starts before the last queued row replaces the queued rows from its first row on.
+    The stream ends when the buffer has been empty for BUFFER_IDLE_TIMEOUT seconds.
+    A batch without queued rows before it is checked against current() | the (left, right)
+    position the platform is at, so the first row cannot jump away from it.
+    """
+    def __init__(self, config, kinematics, slot, logger, labels=None,
+                 current: Optional[Callable[[], Optional[tuple]]] = None):
+        self.config = config
+        self.kinematics = kinematics
+        self.slot = slot
+        self.current = current
+        self.logger = logger
+        self.min_interval = 1 / config.POS_UPDATE_HZ
+        self.state = "idle" # idle | playing | starved
+        self.times = np.empty(0, dtype=np.float64)
+        self.positions = np.empty((0, 2), dtype=np.uint16)
+        self.head = 0 # next row to play
+        self.epoch: Optional[float] = None # loop time of time 0 on the client's timeline
+        self.seq = 0
+        self.played = 0
+        self.skipped = 0
+        self.late_rows = 0
+        self.batches = 0
+        self.rejected = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.validation = REGISTRY.histogram("buffer_validation_seconds", "Batch parse to queued", labels)
+        REGISTRY.gauge("buffer_queued_rows", "Rows waiting in the trajectory buffer", labels,
+                       fn=lambda: len(self.times) - self.head)
+        REGISTRY.counter("buffer_late_rows", "Rows that were already due when their batch arrived", labels,
+                         fn=lambda: self.late_rows)
+        REGISTRY.counter("buffer_rejected_batches", "Batches that failed validation", labels,
+                         fn=lambda: self.rejected)
+
+    @property
+    def active(self):
+        return self.state != "idle"
+
+    def _stream_time(self, now=None):
+        if self.epoch is None:
+            return None
+        return float((now if now is not None else asyncio.get_running_loop().time()) - self.epoch)
+
+    def submit(self, columns) -> dict:
+        """
+        Validates a parsed batch and queues it. Raises ValueError if the batch is rejected
+        """
+        start = time.perf_counter()
+        try:
+            cut = len(self.times)
+            if self.epoch is not None:
+                cut = int(np.searchsorted(self.times, columns["time"][0], side="left"))
+                if cut < self.head:
+                    raise ValueError("Batch starts before rows that have already been played")
+            first = max(cut - CONTEXT_ROWS, 0)
+            context_times, context_positions = self._context(columns["time"][0], first, cut)
+            times, positions = validate_batch(columns, self.kinematics, self.config,
+                                              context_times, context_positions)
+            if cut - self.head + len(times) > self.config.BUFFER_MAX_ROWS:
+                raise ValueError(f"Buffer holds at most {self.config.BUFFER_MAX_ROWS} rows")
+            now = asyncio.get_running_loop().time()
+            epoch = self.epoch if self.epoch is not None else now + self.config.BUFFER_START_DELAY - times[0]
+            if times[-1] - (now - epoch) > self.config.BUFFER_MAX_AHEAD:
+                raise ValueError(f"Batch ends more than {self.config.BUFFER_MAX_AHEAD}s ahead")
+        except ValueError:
+            self.rejected += 1
+            raise
+
+        self.epoch = epoch
+        self.late_rows += int(np.count_nonzero(times < now - epoch))
+        self.times = np.concatenate((self.times[:cut], times))
+        self.positions = np.concatenate((self.positions[:cut], positions))
+        self.batches += 1
+        if self.state == "idle":
+            self.state = "playing"
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        self._changed.set()
+        self.validation.observe(time.perf_counter() - start)
+        return self.status()
+
+    def _context(self, start, first, cut):
+        """
+        Rows the batch starting at time start is checked against. Without queued rows
+        it is the current position at the current stream time, for a new stream
+        BUFFER_START_DELAY before its first row
+        """
+        if cut > 0 or self.current is None:
+            return self.times[first:cut], self.positions[first:cut]
+        current = self.current()
+        if current is None:
+            return self.times[:0], self.positions[:0]
+        now = self._stream_time()
+        now = start - self.config.BUFFER_START_DELAY if now is None else min(now, start - self.min_interval)
+        return np.array([now], dtype=np.float64), np.array([current], dtype=np.uint16)
+
+    def clear(self):
+        """
+        Drops every queued row and ends the stream
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._end()
+
+    def _end(self):
+        self.state = "idle"
+        self.epoch = None
+        self.times = self.times[:0]
+        self.positions = self.positions[:0]
+        self.head = 0
+
+    def _compact(self):
+        # Played rows are dropped, the last ones stay as context for the next batch
+        if self.head >= COMPACT_ROWS and self.head * 2 >= len(self.times):
+            drop = self.head - CONTEXT_ROWS
+            self.times = self.times[drop:].copy()
+            self.positions = self.positions[drop:].copy()
+            self.head -= drop
+
+    async def _wait(self, timeout):
+        """
+        Sleeps until timeout or a new batch. Returns True if a batch arrived
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            changed = True
+        except asyncio.TimeoutError:
+            changed = False
+        self._changed.clear()
+        return changed
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.logger.info("Trajectory buffer stream started")
+        last_put = -np.inf
+        while True:
+            if self.head >= len(self.times):
+                self.state = "starved"
+                if not await self._wait(self.config.BUFFER_IDLE_TIMEOUT) and self.head >= len(self.times):
+                    self.logger.info(f"Trajectory buffer stream ended after {self.played} setpoints")
+                    self._end()
+                    return
+                continue
+
+            self.state = "playing"
+            now = loop.time()
+            wake = max(self.epoch + self.times[self.head], last_put + self.min_interval)
+            if wake > now:
+                await self._wait(wake - now)
+                continue # a batch may have replaced the rows
+
+            # Newest row that is due, the ones before it are skipped like in playback
+            index = max(self.head, int(np.searchsorted(self.times, now - self.epoch, side="right")) - 1)
+            left, right = self.positions[index]
+            self.slot.put(Setpoint(seq=self.seq, left=int(left), right=int(right), received=time.perf_counter()))
+            self.seq += 1
+            self.played += 1
+            self.skipped += index - self.head
+            last_put = now
+            self.head = index + 1
+            self._compact()
+
+    def status(self):
+        stream_time = self._stream_time()
+        queued_until = float(self.times[-1]) if self.head < len(self.times) else None
+        return {
+            "state": self.state,
+            "stream_time": stream_time,
+            "queued_rows": len(self.times) - self.head,
+            "queued_until": queued_until,
+            "lead": queued_until - stream_time if queued_until is not None else 0.0,
+            "played": self.played,
+            "skipped": self.skipped,
+            "late_rows": self.late_rows,
+            "batches": self.batches,
+            "rejected_batches": self.rejected,
+        }
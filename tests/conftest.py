@@ -0,0 +1,28 @@
+import logging
+import os
+import socket
+import sys
+import pytest
+
+# Modules in src are imported by bare name like the server does
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import Config
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def config():
+    """
+    Config of one platform on two local drive simulators, short timeouts so failures show up fast
+    """
+    return Config(SERVER_IP_LEFT="127.0.0.1", SERVER_IP_RIGHT="127.0.0.2", SERVER_PORT=free_port(),
+                  MODBUS_TIMEOUT=0.2, ESTOP_DEADLINE=0.5, RECORDER_ENABLED=False,
+                  STATE_SHM_NAME=f"liikealusta_test_{os.getpid()}")
+
+@pytest.fixture
+def logger():
+    return logging.getLogger("tests")
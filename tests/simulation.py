@@ -0,0 +1,81 @@
+import asyncio
+import contextlib
+from drive_simulator import DriveSimulator
+
+@contextlib.asynccontextmanager
+async def simulated_drives(config, **kwargs):
+    """
+    Runs a DriveSimulator on SERVER_IP_LEFT and SERVER_IP_RIGHT.
+    kwargs go to both simulators. Yields tuple of (left, right)
+    """
+    simulators = []
+    try:
+        for host in (config.SERVER_IP_LEFT, config.SERVER_IP_RIGHT):
+            simulator = DriveSimulator(config, name=host, seed=0, **kwargs)
+            await simulator.start(host, config.SERVER_PORT)
+            simulators.append(simulator)
+        yield tuple(simulators)
+    finally:
+        for simulator in simulators:
+            await simulator.close()
+
+async def wait_until(predicate, timeout=2.0, interval=0.01):
+    """
+    Returns True as soon as predicate() is true, False after timeout seconds
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+@contextlib.asynccontextmanager
+async def simulated_platform(config, logger, **kwargs):
+    """
+    Server platform created like palvelin does, connected to two simulated drives
+    that are already homed. Yields tuple of (platform, (left, right))
+    """
+    from drive_pool import DrivePool, DEFAULT_PLATFORM
+    from palvelin import create_platform
+
+    async with simulated_drives(config, **kwargs) as drives:
+        for drive in drives:
+            drive.homed = True
+        platform = create_platform(DEFAULT_PLATFORM, DrivePool(config, logger), config, logger)
+        try:
+            assert await platform.clients.connect()
+            assert await wait_until(lambda: all(connection.connected for connection in
+                                                platform.clients.estop.connections.values()))
+            yield platform, drives
+        finally:
+            platform.control_loop.stop()
+            platform.buffer.clear()
+            platform.clients.cleanup()
+            platform.drive_state.close()
+
+@contextlib.asynccontextmanager
+async def simulated_app(config, logger, **kwargs):
+    """
+    Server app of palvelin with its routes, the platform of simulated_platform
+    in place of the startup that init() runs. Yields tuple of (app, platform, (left, right))
+    """
+    import palvelin
+    from module_manager import ModuleManager
+
+    async with simulated_platform(config, logger, **kwargs) as (platform, drives):
+        async def init(app):
+            app.app_config = config
+            app.logger = logger
+            app.module_manager = ModuleManager(logger)
+            app.fault_events = None
+            app.pool = platform.clients.pool
+            app.platforms = {platform.name: platform}
+
+        original, palvelin.init = palvelin.init, init
+        try:
+            app = await palvelin.create_app()
+        finally:
+            palvelin.init = original
+        yield app, platform, drives
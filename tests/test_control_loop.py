@@ -0,0 +1,104 @@
+import asyncio
+import time
+from ModbusClients import ModbusClients
+from control_loop import ControlLoop
+from setpoints import Setpoint
+from simulation import simulated_drives, wait_until
+
+class ListRecorder:
+    def __init__(self):
+        self.rows = []
+
+    def record(self, *row):
+        self.rows.append(row)
+
+def setpoint(seq, left, right):
+    return Setpoint(seq=seq, left=left, right=right, received=time.perf_counter())
+
+async def running_loop(config, logger, recorder=None):
+    clients = ModbusClients(config, logger)
+    assert await clients.connect()
+    control_loop = ControlLoop(clients, config, logger, recorder=recorder)
+    control_loop.start()
+    return clients, control_loop
+
+def analog_positions(config, drives):
+    return [drive.registers[config.MODBUS_ANALOG_POSITION] for drive in drives]
+
+def test_writes_newest_setpoint(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            recorder = ListRecorder()
+            clients, control_loop = await running_loop(config, logger, recorder)
+            try:
+                control_loop.slot.put(setpoint(1, 1000, 2000))
+                control_loop.slot.put(setpoint(2, 3000, 4000))
+                written = await asyncio.wait_for(control_loop.wait_written(), 1.0)
+                assert written.seq == 2
+                assert analog_positions(config, drives) == [3000, 4000]
+                assert recorder.rows[-1][1:3] == (3000, 4000)
+                assert control_loop.slot.replaced == 1
+            finally:
+                control_loop.stop()
+                clients.cleanup()
+
+    asyncio.run(scenario())
+
+def test_gated_ticks_do_not_write(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            clients, control_loop = await running_loop(config, logger)
+            try:
+                control_loop.gate("left", "fault 3")
+                control_loop.slot.put(setpoint(1, 1000, 1000))
+                assert await wait_until(lambda: control_loop.gated_ticks >= 5)
+                assert analog_positions(config, drives) == [0, 0]
+
+                control_loop.ungate("left")
+                assert await wait_until(lambda: analog_positions(config, drives) == [1000, 1000])
+            finally:
+                control_loop.stop()
+                clients.cleanup()
+
+    asyncio.run(scenario())
+
+def test_halt_drops_pending_setpoint_until_resume(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            clients, control_loop = await running_loop(config, logger)
+            try:
+                control_loop.slot.put(setpoint(1, 1000, 1000))
+                await asyncio.wait_for(control_loop.wait_written(), 1.0)
+                control_loop.slot.put(setpoint(2, 5000, 5000))
+                control_loop.halt("test stop")
+                assert control_loop.halted
+                ticks = control_loop.gated_ticks
+                assert await wait_until(lambda: control_loop.gated_ticks >= ticks + 5)
+                assert analog_positions(config, drives) == [1000, 1000]
+
+                control_loop.resume(setpoint(3, 2000, 2000))
+                written = await asyncio.wait_for(control_loop.wait_written(), 1.0)
+                assert written.seq == 3
+                assert analog_positions(config, drives) == [2000, 2000]
+            finally:
+                control_loop.stop()
+                clients.cleanup()
+
+    asyncio.run(scenario())
+
+def test_exception_response_is_a_write_error(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as (left, right):
+            recorder = ListRecorder()
+            right.rejected_writes.add(config.MODBUS_ANALOG_POSITION)
+            clients, control_loop = await running_loop(config, logger, recorder)
+            try:
+                control_loop.slot.put(setpoint(1, 1000, 1000))
+                assert await wait_until(lambda: control_loop.write_errors >= 3)
+                assert control_loop.last_written is None
+                assert recorder.rows == []
+            finally:
+                control_loop.stop()
+                clients.cleanup()
+
+    asyncio.run(scenario())
@@ -0,0 +1,52 @@
+from drive_simulator import DriveSimulator
+from modbus_mux import encode_write_register
+from utils import IEG_MODE_bitmask_enable
+
+def ready(config):
+    """
+    Simulated drive that is homed, enabled and following the analog position
+    """
+    drive = DriveSimulator(config, seed=0)
+    drive.homed = True
+    drive.handle_pdu(encode_write_register(config.IEG_MODE, IEG_MODE_bitmask_enable(2)))
+    drive.handle_pdu(encode_write_register(config.COMMAND_MODE, 2))
+    return drive
+
+def run(drive, seconds, dt=0.002):
+    for _ in range(int(seconds / dt)):
+        drive.step(dt)
+
+def test_follows_analog_position(config):
+    drive = ready(config)
+    drive.handle_pdu(encode_write_register(config.MODBUS_ANALOG_POSITION, 0))
+    start = drive.position
+    run(drive, 0.5)
+    assert drive.position < start - 1.0
+
+def test_stop_holds_until_ieg_motion_releases_it(config):
+    drive = ready(config)
+    drive.handle_pdu(encode_write_register(config.IEG_MOTION, 4))
+    assert drive.stopped
+
+    # What an enable sequence writes does not release the stop
+    drive.handle_pdu(encode_write_register(config.MODBUS_ANALOG_POSITION, 0))
+    drive.handle_pdu(encode_write_register(config.COMMAND_MODE, 2))
+    drive.handle_pdu(encode_write_register(config.IEG_MODE, IEG_MODE_bitmask_enable(2)))
+    start = drive.position
+    run(drive, 0.5)
+    assert drive.stopped
+    assert drive.position == start
+
+    drive.handle_pdu(encode_write_register(config.IEG_MOTION, 0))
+    assert not drive.stopped
+    run(drive, 0.5)
+    assert drive.position < start - 1.0
+
+def test_home_is_ignored_while_stopped(config):
+    drive = ready(config)
+    drive.handle_pdu(encode_write_register(config.IEG_MOTION, 4))
+    drive.handle_pdu(encode_write_register(config.IEG_MOTION, 4 | 256))
+    assert not drive.homing
+
+    drive.handle_pdu(encode_write_register(config.IEG_MOTION, 256))
+    assert drive.homing
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from drive_state import DriveStateReader, DriveStateWriter, segment_name
+from palvelin import publish_drive_state
+from register_planner import DriveSnapshot
+from simulation import simulated_platform, wait_until
+
+@pytest.fixture
+def segment(config):
+    writer = DriveStateWriter(config.STATE_SHM_NAME, 4)
+    reader = DriveStateReader(config.STATE_SHM_NAME)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+def test_ring_keeps_newest_records(segment):
+    writer, reader = segment
+    for i in range(6):
+        writer.publish(0, DriveSnapshot(status=0, fault=0, position=float(i), velocity=0.0))
+
+    assert reader.head(0) == 6
+    assert reader.latest(1) is None
+    seq, _, snapshot = reader.latest(0)
+    assert (seq, snapshot.position) == (6, 5.0)
+    # Ring of 4, the two oldest records are overwritten
+    assert [record[0] for record in reader.records_since(0, 0)] == [3, 4, 5, 6]
+    assert [record[2].position for record in reader.records_since(0, 4)] == [4.0, 5.0]
+    assert reader.records_since(0, 6) == []
+
+def test_half_written_record_is_not_read(segment):
+    writer, reader = segment
+    writer.publish(0, DriveSnapshot(status=0, fault=0, position=1.0, velocity=0.0))
+    # Version of record 1 left odd like the writer does while it copies the payload
+    offset = reader._record_offset(0, 1)
+    reader.buf[offset] = 3
+    assert reader.latest(0) is None
+
+def test_fault_reset_handshake(segment):
+    writer, reader = segment
+    assert not writer.fault_reset_requested()
+    reader.request_fault_reset()
+    assert writer.fault_reset_requested()
+    writer.fault_reset_done()
+    assert not writer.fault_reset_requested()
+    writer.heartbeat()
+    assert reader.owner_heartbeat_age() < 1.0
+
+def test_server_publishes_simulated_drives(config, logger):
+    async def scenario():
+        async with simulated_platform(config, logger) as (platform, drives):
+            reader = DriveStateReader(segment_name(config, platform.name))
+            task = asyncio.create_task(publish_drive_state(platform))
+            try:
+                assert await wait_until(lambda: reader.latest(0) is not None and reader.latest(1) is not None)
+                _, _, snapshot = reader.latest(0)
+                assert snapshot.is_homed and not snapshot.is_faulted
+                assert snapshot.position == pytest.approx(drives[0].position, abs=1e-3)
+
+                drives[1].inject_fault(4)
+                assert await wait_until(lambda: reader.latest(1)[2].is_faulted)
+                assert reader.latest(1)[2].fault == 4
+                # Fault poller asks, the owner of the connections resets
+                reader.request_fault_reset()
+                assert await wait_until(lambda: drives[1].fault_code == 0)
+                assert await wait_until(lambda: not reader.latest(1)[2].is_faulted)
+                assert not platform.drive_state.fault_reset_requested()
+            finally:
+                task.cancel()
+                reader.close()
+
+    asyncio.run(scenario())
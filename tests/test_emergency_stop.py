@@ -0,0 +1,79 @@
+import asyncio
+from emergency_stop import EmergencyStopLane
+from modbus_mux import ModbusMultiplexer
+from simulation import simulated_drives, wait_until
+
+def hosts(config):
+    return {"left": config.SERVER_IP_LEFT, "right": config.SERVER_IP_RIGHT}
+
+async def started_lane(config, logger):
+    lane = EmergencyStopLane(config, logger, hosts(config))
+    lane.start()
+    assert await wait_until(lambda: all(connection.connected for connection in lane.connections.values()))
+    return lane
+
+def test_both_drives_acknowledge(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            lane = await started_lane(config, logger)
+            try:
+                assert await lane.stop()
+                assert all(drive.stopped for drive in drives)
+                assert lane.last_wire_latency is not None
+            finally:
+                lane.close()
+
+    asyncio.run(scenario())
+
+def test_falls_back_to_main_connection(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            # Stop connections never started | the stop has to go through the main connections
+            lane = EmergencyStopLane(config, logger, hosts(config))
+            main = {drive: ModbusMultiplexer(host, config.SERVER_PORT, config.MODBUS_TIMEOUT, logger=logger, drive=drive)
+                    for drive, host in hosts(config).items()}
+            try:
+                for client in main.values():
+                    assert await client.connect()
+                assert await lane.stop(main)
+                assert all(drive.stopped for drive in drives)
+                assert all(not client._pending for client in main.values())
+            finally:
+                for client in main.values():
+                    client.close()
+
+    asyncio.run(scenario())
+
+def test_resends_until_acknowledged(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as (left, right):
+            lane = await started_lane(config, logger)
+            try:
+                right.drop_rate = 1.0
+                stop = asyncio.create_task(lane.stop())
+                # Every resend is dropped until the drive starts answering again
+                assert await wait_until(lambda: right.dropped >= 3)
+                assert left.stopped and not right.stopped
+                right.drop_rate = 0.0
+                assert await stop
+                assert right.stopped
+            finally:
+                lane.close()
+
+    asyncio.run(scenario())
+
+def test_gives_up_after_deadline(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as (left, right):
+            lane = await started_lane(config, logger)
+            try:
+                right.drop_rate = 1.0
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                assert not await lane.stop()
+                assert loop.time() - start >= config.ESTOP_DEADLINE
+                assert left.stopped
+            finally:
+                lane.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+import asyncio
+import dataclasses
+import time
+import pytest
+from fault_events import FaultEventClient, FaultEventServer, FAULT, RECOVERED
+from fault_poller import next_interval
+from palvelin import handle_fault_event
+from simulation import simulated_app, wait_until
+
+@pytest.fixture
+def events_config(config, tmp_path):
+    return dataclasses.replace(config, FAULT_EVENT_SOCKET=str(tmp_path / "faults.sock"))
+
+def test_state_is_resent_after_reconnect(events_config, logger):
+    async def scenario():
+        received = []
+        client = FaultEventClient(events_config, logger)
+        server = FaultEventServer(events_config, logger, received.append)
+        try:
+            # No server yet, the event is kept as the drive's state
+            client.send(FAULT, "left", time.time(), fault=4, critical=False)
+            await asyncio.sleep(0.05)
+            assert not client.connected
+
+            await server.start()
+            client.retry_interval = 0.0
+            client.ensure_connected()
+            assert await wait_until(lambda: len(received) == 1)
+            assert received[0]["event"] == FAULT and received[0]["fault"] == 4
+
+            client.send(RECOVERED, "left", time.time())
+            assert await wait_until(lambda: len(received) == 2)
+            assert received[1]["event"] == RECOVERED and received[1]["platform"] == "default"
+        finally:
+            client.close()
+            server.close()
+
+    asyncio.run(scenario())
+
+def test_events_gate_control_loop(events_config, logger):
+    async def scenario():
+        async with simulated_app(events_config, logger) as (app, platform, _):
+            server = FaultEventServer(events_config, logger, lambda event: handle_fault_event(app, event))
+            client = FaultEventClient(events_config, logger)
+            await server.start()
+            try:
+                client.ensure_connected()
+                assert await wait_until(lambda: client.connected)
+                client.send(FAULT, "right", time.time(), fault=7, critical=True)
+                assert await wait_until(lambda: "right" in platform.control_loop.gated)
+                assert "critical" in platform.control_loop.gated["right"]
+
+                client.send(RECOVERED, "right", time.time())
+                assert await wait_until(lambda: "right" not in platform.control_loop.gated)
+            finally:
+                client.close()
+                server.close()
+
+    asyncio.run(scenario())
+
+def test_poll_interval_backs_off_when_idle(config):
+    interval = next_interval(config, config.POLLING_TIME_INTERVAL, True)
+    assert interval == config.FAULT_POLL_FAST
+    for _ in range(20):
+        interval = next_interval(config, interval, False)
+    assert interval == config.POLLING_TIME_INTERVAL
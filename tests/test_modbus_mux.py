@@ -0,0 +1,114 @@
+import asyncio
+import gc
+import warnings
+import pytest
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+from ModbusClients import ModbusClients
+from modbus_mux import MBAP, ModbusMultiplexer, encode_write_register
+from simulation import simulated_drives, wait_until
+
+def mux(config, logger, **kwargs):
+    return ModbusMultiplexer(config.SERVER_IP_LEFT, config.SERVER_PORT, config.MODBUS_TIMEOUT, logger=logger, **kwargs)
+
+def test_pipelined_responses_match_their_requests(config, logger):
+    async def scenario():
+        # Jitter answers the pipelined requests out of order
+        async with simulated_drives(config, latency=0.001, jitter=0.01) as (left, _):
+            for address in range(1000, 1032):
+                left.registers[address] = address * 3
+            client = mux(config, logger, max_in_flight=8)
+            try:
+                assert await client.connect()
+                responses = await asyncio.gather(*(client.read_holding_registers(address) for address in range(1000, 1032)))
+                assert [response.registers[0] for response in responses] == [address * 3 for address in range(1000, 1032)]
+                assert not client._pending
+            finally:
+                client.close()
+
+    asyncio.run(scenario())
+
+def test_request_times_out_and_is_forgotten(config, logger):
+    async def scenario():
+        async with simulated_drives(config, drop_rate=1.0):
+            client = mux(config, logger)
+            try:
+                assert await client.connect()
+                with pytest.raises(ModbusIOException):
+                    await client.write_register(100, 1)
+                assert client.consecutive_failures == 1
+                assert not client._pending
+            finally:
+                client.close()
+
+    asyncio.run(scenario())
+
+def test_send_now_expires_without_response(config, logger):
+    async def scenario():
+        async with simulated_drives(config, drop_rate=1.0):
+            client = mux(config, logger)
+            try:
+                assert await client.connect()
+                first = client.send_now(1, encode_write_register(config.IEG_MOTION, 4))
+                client.send_now(1, encode_write_register(config.IEG_MOTION, 4)) # dropped by its caller
+                assert len(client._pending) == 2
+                with pytest.raises(ModbusIOException):
+                    await first
+                assert await wait_until(lambda: not client._pending)
+            finally:
+                client.close()
+
+    asyncio.run(scenario())
+
+def test_malformed_length_fails_requests_in_flight(config, logger):
+    async def scenario():
+        async def answer_malformed(reader, writer):
+            header = await reader.readexactly(MBAP.size)
+            tid, _, length, unit = MBAP.unpack(header)
+            await reader.readexactly(length - 1)
+            writer.write(MBAP.pack(tid, 0, 0, unit))
+
+        server = await asyncio.start_server(answer_malformed, config.SERVER_IP_LEFT, config.SERVER_PORT)
+        client = mux(config, logger, drive="left")
+        try:
+            assert await client.connect()
+            with pytest.raises(ConnectionException):
+                await client.read_holding_registers(100)
+            assert not client.connected
+            assert client.disconnected.is_set()
+            assert not client._pending
+        finally:
+            client.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
+
+def test_simulator_drops_connection_on_malformed_length(config):
+    async def scenario():
+        async with simulated_drives(config) as (left, _):
+            reader, writer = await asyncio.open_connection(config.SERVER_IP_LEFT, config.SERVER_PORT)
+            writer.write(MBAP.pack(1, 0, 0, 1))
+            assert await asyncio.wait_for(reader.read(), 1.0) == b""
+            writer.close()
+
+    asyncio.run(scenario())
+
+def test_cancelled_paired_request_creates_no_coroutines(config, logger):
+    async def scenario():
+        async with simulated_drives(config):
+            clients = ModbusClients(config, logger)
+            try:
+                assert await clients.connect()
+                task = asyncio.create_task(clients.paired_write_register(config.MODBUS_ANALOG_POSITION, 1, 1))
+                await asyncio.sleep(0) # paired() has scheduled the side tasks but they have not started
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+            finally:
+                clients.cleanup()
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        asyncio.run(scenario())
+        gc.collect()
+    assert not [warning for warning in caught if "was never awaited" in str(warning.message)]
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import textwrap
+import warnings
+import psutil
+import pytest
+from module_manager import ModuleManager
+
+MODULE = textwrap.dedent("""
+    import os
+    import sys
+    import time
+
+    out = sys.argv[1]
+    if "--standby" in sys.argv and not sys.stdin.readline():
+        sys.exit(0) # supervisor is gone
+    open(os.path.join(out, f"active-{os.getpid()}"), "w").close()
+    if "--crash" in sys.argv:
+        sys.exit(3)
+    while True:
+        time.sleep(1)
+""")
+
+@pytest.fixture
+def module_dir(tmp_path):
+    (tmp_path / "helper.py").write_text(MODULE)
+    return tmp_path
+
+def manager(logger, module_dir, **kwargs):
+    return ModuleManager(logger, restart_backoff_initial=0.01, restart_backoff_max=0.05,
+                         module_dir=str(module_dir), **kwargs)
+
+def activated(module_dir):
+    return {int(name.split("-")[1]) for name in os.listdir(module_dir) if name.startswith("active-")}
+
+async def wait_until(predicate, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_restarts_until_budget_is_used(logger, module_dir):
+    async def scenario():
+        modules = manager(logger, module_dir, restart_budget=3, restart_window=10.0)
+        try:
+            gave_up = asyncio.Event()
+            stats = modules.supervise("helper", args=[str(module_dir), "--crash"], on_give_up=lambda stats: gave_up.set())
+            await asyncio.wait_for(gave_up.wait(), 5.0)
+            assert stats.gave_up
+            assert stats.starts == 4 and stats.restarts == 3
+            assert list(stats.exit_codes) == [3, 3, 3, 3]
+            assert len(activated(module_dir)) == 4
+        finally:
+            await modules.stop_all()
+
+    asyncio.run(scenario())
+
+def test_standby_takes_over(logger, module_dir):
+    async def scenario():
+        modules = manager(logger, module_dir)
+        try:
+            stats = modules.supervise("helper", args=[str(module_dir)], standby=True)
+            await wait_until(lambda: stats.running and stats.standby_pid is not None)
+            first, standby = stats.pid, stats.standby_pid
+            await wait_until(lambda: activated(module_dir) == {first})
+
+            psutil.Process(first).kill()
+            await wait_until(lambda: stats.pid == standby and stats.running)
+            assert stats.takeovers == 1
+            await wait_until(lambda: standby in activated(module_dir))
+            # A new standby is started in the background for the next takeover
+            await wait_until(lambda: stats.standby_pid not in (None, first, standby))
+        finally:
+            await modules.stop_all()
+
+    asyncio.run(scenario())
+
+def test_stop_all_reaps_active_and_standby(logger, module_dir):
+    async def scenario():
+        modules = manager(logger, module_dir)
+        stats = modules.supervise("helper", args=[str(module_dir)], standby=True)
+        await wait_until(lambda: stats.running and stats.standby_pid is not None)
+        pids = [stats.pid, stats.standby_pid]
+
+        await modules.stop_all()
+        assert not modules.processes
+        assert not any(psutil.pid_exists(pid) and psutil.Process(pid).status() != psutil.STATUS_ZOMBIE for pid in pids)
+        # The supervisor does not restart what was stopped
+        await asyncio.sleep(0.1)
+        assert not modules.processes
+        return modules
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        modules = asyncio.run(scenario())
+        modules.cleanup_all() # atexit after the loop has closed has nothing left to do
+    assert not [warning for warning in caught if "closed" in str(warning.message)]
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import numpy as np
+from ModbusClients import ModbusClients
+from control_loop import ControlLoop
+from kinematics import PlatformKinematics
+from motion_cueing import JerkLimiter, MotionCue, MotionPipeline, WashoutFilter
+from setpoints import Setpoint
+from simulation import simulated_drives, wait_until
+
+DT = 0.02
+
+def test_jerk_limiter_respects_limits_and_settles():
+    limiter = JerkLimiter(vel_max=50.0, acc_max=254.0, jerk_max=2500.0, dt=DT)
+    positions = [limiter.step(0.0)] + [limiter.step(100.0) for _ in range(300)]
+    velocity = np.diff(positions) / DT
+    acceleration = np.diff(velocity) / DT
+    jerk = np.diff(acceleration) / DT
+    assert np.abs(velocity).max() <= 50.0 + 1e-9
+    assert np.abs(acceleration).max() <= 254.0 + 1e-6
+    # Settling snaps onto the target, the only step allowed past the jerk limit
+    assert (np.abs(jerk) > 2500.0 + 1e-3).sum() <= 2
+    assert positions[-1] == 100.0
+    assert max(positions) <= 100.0 + 0.5
+
+def test_heave_onset_washes_out(config):
+    washout = WashoutFilter(config, DT)
+    heave = [washout.step(MotionCue(pitch=0.0, roll=0.0, heave_acc=2.0))[2] for _ in range(1000)]
+    assert max(heave) > 1.0
+    assert abs(heave[-1]) < 0.1 * max(heave)
+
+def test_sustained_surge_tilts_at_limited_rate(config):
+    washout = WashoutFilter(config, DT)
+    pitch = [washout.step(MotionCue(pitch=0.0, roll=0.0, surge_acc=1.0))[0] for _ in range(1000)]
+    # Forward acceleration raises the front, no faster than TILT_RATE_LIMIT_DEG_S
+    assert np.abs(np.diff(pitch)).max() <= config.TILT_RATE_LIMIT_DEG_S * DT + 1e-9
+    assert abs(pitch[-1] + np.degrees(np.arcsin(1.0 / 9.81))) < 0.1
+
+def test_pipeline_step_is_limited_on_the_drives(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            clients = ModbusClients(config, logger)
+            assert await clients.connect()
+            kinematics = PlatformKinematics(config)
+            pipeline = MotionPipeline(config, kinematics, 1 / config.POS_UPDATE_HZ)
+            control_loop = ControlLoop(clients, config, logger, pipeline=pipeline)
+            written = []
+            class Recorder:
+                def record(self, timestamp, left, right, *snapshots):
+                    written.append(left)
+            control_loop.recorder = Recorder()
+            control_loop.start()
+            try:
+                control_loop.slot.put(Setpoint(seq=0, left=10000, right=10000, received=time.perf_counter()))
+                await control_loop.wait_written()
+                control_loop.slot.put(Setpoint(seq=1, left=20000, right=20000, received=time.perf_counter()))
+                assert await wait_until(lambda: drives[0].registers[config.MODBUS_ANALOG_POSITION] == 20000, timeout=3.0)
+            finally:
+                control_loop.stop()
+                clients.cleanup()
+
+            strokes = np.array([kinematics.position_to_stroke(position) for position in written])
+            assert len(written) > 10
+            assert np.abs(np.diff(strokes)).max() <= config.MOTION_VEL_LIMIT_MM_S / config.POS_UPDATE_HZ * 1.05
+
+    asyncio.run(scenario())
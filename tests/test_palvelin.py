@@ -0,0 +1,42 @@
+import asyncio
+import time
+from palvelin import enable_platform, halt_platform
+from setpoints import Setpoint
+from simulation import simulated_platform, wait_until
+
+def test_enable_after_stop_follows_setpoints(config, logger):
+    async def scenario():
+        async with simulated_platform(config, logger) as (platform, drives):
+            await enable_platform(platform)
+            platform.control_loop.start()
+
+            halt_platform(platform, "test stop")
+            assert await platform.clients.stop()
+            assert all(drive.stopped for drive in drives)
+
+            await enable_platform(platform)
+            assert not platform.control_loop.halted
+            assert not any(drive.stopped for drive in drives)
+
+            platform.control_loop.slot.put(Setpoint(seq=1, left=16384, right=16384, received=time.perf_counter()))
+            # The setpoint reaches the drives through the smoothing stage and the drives follow it
+            assert await wait_until(lambda: all(drive.registers[config.MODBUS_ANALOG_POSITION] == 16384 and
+                                                abs(drive.position - drive.target_position()) < 0.05
+                                                for drive in drives), timeout=3.0)
+
+    asyncio.run(scenario())
+
+def test_halted_platform_does_not_write(config, logger):
+    async def scenario():
+        async with simulated_platform(config, logger) as (platform, drives):
+            await enable_platform(platform)
+            platform.control_loop.start()
+            halt_platform(platform, "test stop")
+            target = [drive.registers[config.MODBUS_ANALOG_POSITION] for drive in drives]
+
+            platform.control_loop.slot.put(Setpoint(seq=1, left=100, right=100, received=time.perf_counter()))
+            ticks = platform.control_loop.gated_ticks
+            assert await wait_until(lambda: platform.control_loop.gated_ticks >= ticks + 5)
+            assert [drive.registers[config.MODBUS_ANALOG_POSITION] for drive in drives] == target
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import asyncio
+import dataclasses
+import logging
+import time
+import numpy as np
+from kinematics import PlatformKinematics
+from motion_cueing import MotionPipeline
+from playback import Trajectory, TrajectoryPlayer, load_trajectory
+from setpoints import Setpoint, SetpointSlot
+from telemetry_recorder import TelemetryRecorder
+
+def record(path, commanded):
+    recorder = TelemetryRecorder(str(path), capacity=len(commanded) + 10, flush_interval=60.0)
+    for i, position in enumerate(commanded):
+        recorder.record(i / 50, position, position, None, None)
+    recorder.close()
+    return load_trajectory(str(path))
+
+def pipeline(config):
+    config = dataclasses.replace(config, ACTUATOR_X_MM=300.0, ACTUATOR_Y_MM=250.0)
+    return MotionPipeline(config, PlatformKinematics(config), 1 / config.POS_UPDATE_HZ)
+
+def test_recording_replays_commanded_positions_as_is(config, tmp_path):
+    commanded = [32768 + 100 * i for i in range(50)]
+    trajectory = record(tmp_path / "rec", commanded)
+    assert trajectory.smoothed
+
+    motion = pipeline(config)
+    written = [motion.step(trajectory.setpoint(i, i)) for i in range(len(trajectory))]
+    assert written == [(position, position) for position in commanded]
+
+def test_smoothed_jump_is_limited(config):
+    motion = pipeline(config)
+    motion.step(Setpoint(seq=0, left=32768, right=32768, received=0.0, smoothed=True))
+    left, right = motion.step(Setpoint(seq=1, left=40000, right=40000, received=0.0, smoothed=True))
+    stroke_step = motion.kinematics.position_to_stroke(left) - motion.kinematics.position_to_stroke(32768)
+    assert 0 < stroke_step <= config.MOTION_VEL_LIMIT_MM_S / config.POS_UPDATE_HZ
+
+def test_position_file_is_smoothed(config):
+    times = np.arange(3) / 50
+    trajectory = Trajectory({"time": times, "left": np.array([32768, 40000, 40000]),
+                             "right": np.array([32768, 40000, 40000])}, 3)
+    assert not trajectory.smoothed
+    motion = pipeline(config)
+    motion.step(trajectory.setpoint(0, 0))
+    assert motion.step(trajectory.setpoint(1, 1)) != (40000, 40000)
+
+def test_cue_rows_carry_only_the_cue(config):
+    times = np.arange(3) / 50
+    trajectory = Trajectory({"time": times, "pitch": np.array([0.0, 1.0, 2.0]), "roll": np.zeros(3)}, 3)
+    setpoint = trajectory.setpoint(2, 0)
+    assert setpoint.left is None and setpoint.right is None
+    assert setpoint.cue.pitch == 2.0
+
+    left, right = pipeline(config).step(setpoint)
+    assert 0 <= left <= 65535 and 0 <= right <= 65535
+
+def test_player_puts_rows_on_schedule(config):
+    async def scenario():
+        times = np.arange(10) / 50
+        positions = np.arange(10) * 100
+        trajectory = Trajectory({"time": times, "left": positions, "right": positions}, 10)
+        slot = SetpointSlot()
+        player = TrajectoryPlayer(trajectory, slot, logging.getLogger("tests"), min_interval=1 / 50)
+        start = time.perf_counter()
+        player.start()
+        played = []
+        while not played or played[-1] != positions[-1]:
+            setpoint = await asyncio.wait_for(slot.take(), 1.0)
+            played.append(setpoint.left)
+        # Rows may be skipped when late but never replayed or reordered
+        assert played == sorted(set(played))
+        assert time.perf_counter() - start >= times[-1]
+        await player._task
+        assert player.state == "finished"
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import pytest
+from ModbusClients import ModbusClients
+from simulation import simulated_drives
+
+LATENCY = 0.02
+
+async def connected_clients(config, logger):
+    clients = ModbusClients(config, logger)
+    assert await clients.connect()
+    return clients
+
+def test_snapshot_updates_estimators(config, logger):
+    async def scenario():
+        async with simulated_drives(config, latency=LATENCY) as drives:
+            clients = await connected_clients(config, logger)
+            try:
+                assert clients.predict() == (None, None)
+                left, right = await clients.read_snapshot()
+                assert left.position == pytest.approx(drives[0].position, abs=1e-3)
+                assert right.position == pytest.approx(drives[1].position, abs=1e-3)
+                assert clients.last_snapshots == (left, right)
+                for estimator in clients.estimators.values():
+                    assert estimator.updates == 1
+                    # Dated by its own round trip, at least the simulated latency
+                    assert LATENCY <= estimator.latency < LATENCY + 0.05
+                    assert estimator.state.time < time.perf_counter()
+                    assert estimator.state.position == pytest.approx(10.0, abs=1e-3)
+                    assert estimator.state.velocity == 0.0
+            finally:
+                clients.cleanup()
+
+    asyncio.run(scenario())
+
+def test_prediction_follows_moving_drive(config, logger):
+    async def scenario():
+        # Homing moves the drive down at a constant speed once accelerated
+        async with simulated_drives(config, latency=LATENCY, homing_speed=5.0) as drives:
+            clients = await connected_clients(config, logger)
+            try:
+                for drive in drives:
+                    drive.homing = True
+                await asyncio.sleep(0.2)
+                for _ in range(20):
+                    assert (await clients.read_snapshot()) != (None, None)
+                    await asyncio.sleep(0.01)
+
+                left_snapshot, _ = clients.last_snapshots
+                left, right = clients.predict_at_write()
+                actual = drives[0].position + drives[0].velocity * (clients.estimators["left"].latency / 2)
+                assert left.velocity == pytest.approx(-5.0, abs=0.5)
+                assert right.velocity == pytest.approx(-5.0, abs=0.5)
+                # The last snapshot is a round trip old, the prediction is not
+                assert abs(left.position - actual) < abs(left_snapshot.position - actual)
+                # The simulator samples when it answers, half a round trip later than
+                # the estimator dates it, so the estimate trails by about speed * latency / 2
+                assert left.position == pytest.approx(actual, abs=5.0 * LATENCY)
+            finally:
+                clients.cleanup()
+
+    asyncio.run(scenario())
+
+def test_failed_snapshot_keeps_estimate(config, logger):
+    async def scenario():
+        async with simulated_drives(config) as drives:
+            clients = await connected_clients(config, logger)
+            try:
+                await clients.read_snapshot()
+                state = clients.estimators["left"].state
+                await drives[1].close()
+                assert await clients.read_snapshot() == (None, None)
+                assert clients.estimators["left"].state is state
+            finally:
+                clients.cleanup()
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+import asyncio
+import json
+from palvelin import enable_platform
+from simulation import simulated_app, wait_until
+
+def test_acks_written_setpoints(config, logger):
+    async def scenario():
+        async with simulated_app(config, logger) as (app, platform, drives):
+            await enable_platform(platform)
+            platform.control_loop.start()
+            async with app.test_client().websocket("/stream") as ws:
+                await ws.send(json.dumps([7, 1000, 2000]))
+                while True:
+                    message = json.loads(await asyncio.wait_for(ws.receive(), 2.0))
+                    if "ack" in message:
+                        break
+                assert message["ack"] == 7
+                # Smoothed on the way, the drives reach the setpoint within the velocity limit
+                assert await wait_until(lambda: [drive.registers[config.MODBUS_ANALOG_POSITION]
+                                                 for drive in drives] == [1000, 2000], timeout=3.0)
+
+    asyncio.run(scenario())
+
+def test_refuses_setpoints_while_halted(config, logger):
+    async def scenario():
+        async with simulated_app(config, logger) as (app, platform, _):
+            platform.control_loop.halt("test stop")
+            async with app.test_client().websocket("/stream") as ws:
+                await ws.send(json.dumps([1, 1000, 1000]))
+                message = json.loads(await asyncio.wait_for(ws.receive(), 2.0))
+                assert "enable" in message["error"]
+
+    asyncio.run(scenario())
+
+def test_telemetry_is_shared_between_clients(config, logger):
+    async def scenario():
+        async with simulated_app(config, logger) as (app, platform, _):
+            clients = platform.clients
+            await clients.read_snapshot()
+            reads = []
+            read_snapshot = clients.read_snapshot
+            async def counted_read():
+                reads.append(1)
+                return await read_snapshot()
+            clients.read_snapshot = counted_read
+
+            async def telemetry(ws):
+                while True:
+                    message = json.loads(await ws.receive())
+                    if "telemetry" in message:
+                        return message["telemetry"]
+
+            test_client = app.test_client()
+            async with test_client.websocket("/stream") as first, test_client.websocket("/stream") as second:
+                published = clients.last_snapshots[0].position
+                for ws in (first, second):
+                    assert (await asyncio.wait_for(telemetry(ws), 1.0))["left"]["position"] == published
+                # The same snapshots are not sent again
+                for ws in (first, second):
+                    try:
+                        await asyncio.wait_for(telemetry(ws), 3 * config.WS_TELEMETRY_INTERVAL)
+                        assert False, "snapshot sent twice"
+                    except asyncio.TimeoutError:
+                        pass
+                assert reads == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import os
+import numpy as np
+from telemetry_recorder import TelemetryRecorder, load_recording, prune_recordings
+
+def make_recordings(base_dir, names):
+    for name in names:
+        os.makedirs(base_dir / name)
+
+def test_prune_keeps_newest_of_the_platform(tmp_path):
+    default = ["20260101-120000", "20260102-120000", "20260103-120000"]
+    named = ["20260101-120000-a", "20260102-120000-a"]
+    make_recordings(tmp_path, default + named + ["notes"])
+
+    removed = prune_recordings(tmp_path, 1)
+    assert sorted(os.path.basename(path) for path in removed) == default[:2]
+    assert sorted(os.listdir(tmp_path)) == sorted([default[2], "notes"] + named)
+
+    removed = prune_recordings(tmp_path, 0, "-a")
+    assert sorted(os.listdir(tmp_path)) == sorted([default[2], "notes"])
+
+def test_prune_missing_directory(tmp_path):
+    assert prune_recordings(tmp_path / "recordings", 5) == []
+
+def test_ring_wraps_in_time_order(tmp_path):
+    recorder = TelemetryRecorder(str(tmp_path / "rec"), capacity=8, buffer_size=4, flush_interval=60.0)
+    for row in range(11):
+        recorder.record(float(row), row, row, None, None)
+        if row % 3 == 2:
+            recorder.flush()
+    recorder.close()
+
+    columns = load_recording(str(tmp_path / "rec"))
+    assert list(columns["time"]) == [float(row) for row in range(3, 11)]
+    assert np.isnan(columns["position_left"]).all()
@@ -0,0 +1,105 @@
+import asyncio
+import numpy as np
+import pytest
+from kinematics import PlatformKinematics
+from palvelin import current_position, enable_platform
+from simulation import simulated_app, wait_until
+from trajectory_buffer import BINARY_ROW, parse_batch, validate_batch
+
+COUNTS_PER_MM = 65535 / 145.0 # MODBUS_ANALOG_POSITION over the default stroke
+
+def columns(times, left, right):
+    return {"time": np.asarray(times, dtype=np.float64),
+            "left": np.asarray(left, dtype=np.float64),
+            "right": np.asarray(right, dtype=np.float64)}
+
+def test_parse_binary_rows():
+    rows = np.zeros(3, dtype=BINARY_ROW)
+    rows["time"] = [0.0, 0.02, 0.04]
+    rows["left"] = [100, 200, 300]
+    parsed = parse_batch(rows.tobytes(), "application/octet-stream")
+    assert list(parsed["left"]) == [100, 200, 300]
+    with pytest.raises(ValueError, match="whole number"):
+        parse_batch(rows.tobytes()[:-1], "application/octet-stream")
+
+def test_validate_batch_names_first_invalid_row(config):
+    kinematics = PlatformKinematics(config)
+    with pytest.raises(ValueError, match="Row 2: times must be increasing"):
+        validate_batch(columns([0.0, 0.02, 0.02], [0, 0, 0], [0, 0, 0]), kinematics, config)
+    with pytest.raises(ValueError, match="Row 1: position outside"):
+        validate_batch(columns([0.0, 0.02], [0, 70000], [0, 0]), kinematics, config)
+    # 10 mm in 20 ms is 500 mm/s
+    with pytest.raises(ValueError, match="Row 1: velocity"):
+        validate_batch(columns([0.0, 0.02], [0, 10 * COUNTS_PER_MM], [0, 0]), kinematics, config)
+    # 40 mm/s reached in one 20 ms row is 2000 mm/s^2, named at the row it reaches
+    with pytest.raises(ValueError, match="Row 2: acceleration"):
+        validate_batch(columns([0.0, 0.02, 0.04], [0, 0, 0.8 * COUNTS_PER_MM], [0, 0, 0]), kinematics, config)
+
+    times, positions = validate_batch(columns([0.0, 0.02], [1000, 1001], [2000, 2000]), kinematics, config)
+    assert positions.dtype == np.uint16
+    assert positions.tolist() == [[1000, 2000], [1001, 2000]]
+
+def test_context_rows_continue_previous_batch(config):
+    kinematics = PlatformKinematics(config)
+    # Fine on its own, but the queued rows before it were at 0
+    batch = columns([0.04, 0.06], [2 * COUNTS_PER_MM] * 2, [0, 0])
+    validate_batch(batch, kinematics, config)
+    with pytest.raises(ValueError, match="Row 0: velocity"):
+        validate_batch(batch, kinematics, config, np.array([0.0, 0.02]), np.zeros((2, 2), dtype=np.uint16))
+
+async def running_platform(platform):
+    await enable_platform(platform)
+    platform.control_loop.start()
+    assert await wait_until(lambda: platform.control_loop.last_positions is not None)
+    return current_position(platform)
+
+def ramp(start, rows, step):
+    return {"time": [i * 0.02 for i in range(rows)],
+            "left": [start[0] + i * step for i in range(rows)],
+            "right": [start[1] + i * step for i in range(rows)]}
+
+def test_first_batch_cannot_jump_from_current_position(config, logger):
+    async def scenario():
+        async with simulated_app(config, logger) as (app, platform, _):
+            current = await running_platform(platform)
+            client = app.test_client()
+            response = await client.post("/trajectory", json=ramp((current[0] + 5000, current[1]), 10, 0))
+            assert response.status_code == 400
+            assert "velocity" in (await response.get_json())["error"]
+            assert not platform.buffer.active
+            assert platform.buffer.rejected == 1
+
+    asyncio.run(scenario())
+
+def test_batch_from_current_position_is_played(config, logger):
+    async def scenario():
+        async with simulated_app(config, logger) as (app, platform, drives):
+            current = await running_platform(platform)
+            step = round(0.04 * COUNTS_PER_MM) # 2 mm/s from standstill is well inside the limits
+            batch = ramp(current, 25, step)
+            response = await app.test_client().post("/trajectory", json=batch)
+            assert response.status_code == 200
+            status = await response.get_json()
+            assert status["queued_rows"] == 25 and status["state"] == "playing"
+
+            end = [batch["left"][-1], batch["right"][-1]]
+            assert await wait_until(lambda: [drive.registers[config.MODBUS_ANALOG_POSITION]
+                                             for drive in drives] == end, timeout=3.0)
+            assert await wait_until(lambda: platform.buffer.status()["queued_rows"] == 0)
+            status = platform.buffer.status()
+            assert status["played"] + status["skipped"] == 25
+            assert status["late_rows"] == 0
+
+            # Ends after BUFFER_IDLE_TIMEOUT without new batches
+            assert await wait_until(lambda: not platform.buffer.active, timeout=config.BUFFER_IDLE_TIMEOUT + 1.0)
+
+    asyncio.run(scenario())
+
+def test_refused_while_halted(config, logger):
+    async def scenario():
+        async with simulated_app(config, logger) as (app, platform, _):
+            platform.control_loop.halt("test stop")
+            response = await app.test_client().post("/trajectory", json=ramp((0, 0), 2, 0))
+            assert response.status_code == 409
+
+    asyncio.run(scenario())